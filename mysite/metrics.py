@@ -0,0 +1,238 @@
+"""
+Per-view request metrics, collected by ``mysite.middleware.RequestMetricsMiddleware``
+and served in Prometheus text format at ``/metrics``.
+
+Each process keeps its own histograms. With ``METRICS_DIR`` set, every
+process also writes them to a file of its own there (at most every
+``METRICS_FLUSH_INTERVAL`` seconds), and ``/metrics`` adds up all the
+files, so Gunicorn workers that share nothing still report together.
+"""
+import contextvars
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, JsonResponse
+from django.template.backends.django import DjangoTemplates
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# name: (help text, bucket upper bounds)
+HISTOGRAMS = {
+    'gym_request_duration_seconds': ('Wall time per request, by view.', DURATION_BUCKETS),
+    'gym_request_db_seconds': ('Time spent in database queries per request, by view.', DURATION_BUCKETS),
+    'gym_request_template_seconds': ('Template render time per request, by view.', DURATION_BUCKETS),
+    'gym_request_queries': ('Database queries per request, by view.', QUERY_BUCKETS),
+}
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """What one request spent, filled in while it runs."""
+
+    def __init__(self):
+        self.wall = 0.0
+        self.db = 0.0
+        self.queries = 0
+        self.template = 0.0
+
+    def server_timing(self):
+        """The ``Server-Timing`` header value, durations in milliseconds."""
+        return (
+            f'app;dur={self.wall * 1000:.1f}, '
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries", '
+            f'tpl;dur={self.template * 1000:.1f}'
+        )
+
+
+def start_request():
+    """Start collecting timings for the current request; returns (timings, token)."""
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def _time_query(execute, sql, params, many, context):
+    """An execute wrapper that adds each query to the current request's totals."""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - start
+        timings.queries += 1
+
+
+def track_queries():
+    """
+    Install the query timer on this thread's connections, once each. It
+    stays installed and reads the request from a context variable, so
+    queries are counted whichever thread an async view's ORM calls run in.
+    """
+    for connection in connections.all():
+        if _time_query not in connection.execute_wrappers:
+            # First in the list, so a ``with execute_wrapper()`` block
+            # around a request still pops its own wrapper on exit
+            connection.execute_wrappers.insert(0, _time_query)
+
+
+class Registry:
+    """This process's histograms: {name: {view: [bucket counts..., sum, count]}}."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {name: {} for name in HISTOGRAMS}
+            self.last_flush = time.monotonic()
+        # A new file name, so a reused pid never overwrites another process's
+        self.filename = f'{os.getpid()}-{time.time_ns()}.json'
+
+    def observe(self, view, timings):
+        values = {
+            'gym_request_duration_seconds': timings.wall,
+            'gym_request_db_seconds': timings.db,
+            'gym_request_template_seconds': timings.template,
+            'gym_request_queries': timings.queries,
+        }
+        with self.lock:
+            for name, value in values.items():
+                buckets = HISTOGRAMS[name][1]
+                series = self.histograms[name].setdefault(view, [0] * (len(buckets) + 2))
+                for i, bound in enumerate(buckets):
+                    if value <= bound:
+                        series[i] += 1
+                        break
+                series[-2] += value
+                series[-1] += 1
+            due = time.monotonic() - self.last_flush >= settings.METRICS_FLUSH_INTERVAL
+        if due and settings.METRICS_DIR:
+            self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {name: {view: list(series) for view, series in views.items()}
+                    for name, views in self.histograms.items()}
+
+    def flush(self):
+        """Write this process's histograms to its file in METRICS_DIR."""
+        with self.lock:
+            self.last_flush = time.monotonic()
+        data = json.dumps(self.snapshot())
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=settings.METRICS_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        # Readers never see a half-written file
+        os.replace(tmp, os.path.join(settings.METRICS_DIR, self.filename))
+
+
+registry = Registry()
+
+
+def collect():
+    """Histograms of every process (or just this one without METRICS_DIR), added up."""
+    if not settings.METRICS_DIR:
+        return registry.snapshot()
+    registry.flush()
+    totals = {name: {} for name in HISTOGRAMS}
+    for filename in os.listdir(settings.METRICS_DIR):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(settings.METRICS_DIR, filename)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, views in data.items():
+            if name not in totals:
+                continue
+            for view, series in views.items():
+                total = totals[name].setdefault(view, [0] * len(series))
+                if len(total) == len(series):
+                    totals[name][view] = [a + b for a, b in zip(total, series)]
+    return totals
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(histograms):
+    """Render histograms in the Prometheus text exposition format."""
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for view, series in sorted(histograms.get(name, {}).items()):
+            view = _label(view)
+            cumulative = 0
+            for bound, count in zip(buckets, series):
+                cumulative += count
+                lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {series[-1]}')
+            lines.append(f'{name}_sum{{view="{view}"}} {round(series[-2], 6)}')
+            lines.append(f'{name}_count{{view="{view}"}} {series[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Request histograms for Prometheus. Staff only; a scraper can instead
+    send ``Authorization: Bearer <METRICS_TOKEN>``.
+    """
+    token = settings.METRICS_TOKEN
+    header = request.headers.get('Authorization', '')
+    allowed = request.user.is_staff or (
+        token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode())
+    )
+    if not allowed:
+        return JsonResponse({'status': 'error', 'message': 'Permission denied.'}, status=403)
+    return HttpResponse(prometheus_text(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class TimedTemplate:
+    """Wraps a backend template so its render time counts towards the current request."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            timings.template += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing each top-level render. Included
+    templates render inside their parent, so they aren't counted twice.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
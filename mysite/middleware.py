@@ -0,0 +1,57 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from .metrics import end_request, registry, start_request, track_queries
+
+
+class RequestMetricsMiddleware:
+    """
+    Time every request by resolved view name: wall time, database time and
+    query count (through ``metrics.track_queries``), and template render
+    time (through ``metrics.TimedDjangoTemplates``).
+
+    The totals go into a ``Server-Timing`` header, which browser dev tools
+    show per request, and into the histograms served at ``/metrics``.
+    Streaming responses are timed up to the start of the stream. Runs in
+    either mode, so it never forces an async stack through a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        track_queries()
+        timings, token = start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        return self.finish(request, response, timings, start)
+
+    async def __acall__(self, request):
+        # Thread-sensitive, so the timer lands on the connections the
+        # request's sync_to_async ORM calls will use
+        await sync_to_async(track_queries)()
+        timings, token = start_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        return self.finish(request, response, timings, start)
+
+    def finish(self, request, response, timings, start):
+        timings.wall = time.perf_counter() - start
+        match = request.resolver_match
+        registry.observe(match.view_name if match else 'unresolved', timings)
+        response['Server-Timing'] = timings.server_timing()
+        return response
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "mysite.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -59,7 +60,8 @@ ROOT_URLCONF = "mysite.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates, timing renders for the request metrics
+        "BACKEND": "mysite.metrics.TimedDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -84,6 +86,41 @@ DATABASES = {
     )
 }
 
+if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    # Every SQLite connection, dev and production alike. Under ASGI (or
+    # several workers) requests write at the same time: take the write lock
+    # when a transaction starts and wait up to 20 s for it, rather than
+    # failing with "database is locked" when a read lock can't be upgraded.
+    # The PR locks rely on this (services.pr_recalc_lock/pr_rebuild_lock).
+    # WAL lets reads go on during a write; it sticks to the database file.
+    DATABASES["default"].setdefault("OPTIONS", {}).update({
+        "transaction_mode": "IMMEDIATE",
+        "timeout": 20,
+        "init_command": "PRAGMA journal_mode=WAL",
+    })
+    # A file, not shared-cache memory, so tests with threads wait on locks like production
+    DATABASES["default"].setdefault("TEST", {}).setdefault("NAME", str(BASE_DIR / "test_db.sqlite3"))
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# Per-process memory by default. With several Gunicorn workers set
+# CACHE_DIR to share a file-based cache between them.
+
+if os.environ.get('CACHE_DIR'):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ.get('CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -154,4 +191,19 @@ else:
         "staticfiles": {
             "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
         },
-    }
\ No newline at end of file
+    }
+# Run PR recalculation in the `process_pr_jobs` worker instead of inside the
+# api_add_sets / api_delete_set request; the page polls for the toasts.
+PR_RECALC_DEFERRED = os.environ.get('PR_RECALC_DEFERRED', 'False') == 'True'
+
+# Store identical consecutive sets ("5x5x100") as one WorkoutSet row with a
+# count instead of one row per set. Readers understand both layouts.
+COMPACT_SETS = os.environ.get('COMPACT_SETS', 'False') == 'True'
+
+# Request metrics (mysite/metrics.py). Each Gunicorn worker writes its
+# histograms to a file in METRICS_DIR so /metrics can add them up; unset,
+# /metrics only reports the worker that serves it. A scraper that can't
+# log in as staff sends "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = 10
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
@@ -20,9 +20,11 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 from workouts import views as workout_views
+from .metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('', workout_views.dashboard, name='dashboard'),
     path('', include('workouts.urls')),
     #path('accounts/', include('accounts.urls')),
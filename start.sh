@@ -2,4 +2,18 @@
 python manage.py collectstatic --noinput
 python manage.py migrate
 python manage.py load_default_exercises
-gunicorn mysite.wsgi
\ No newline at end of file
+# Only users without progress rows yet, so this is cheap after the first deploy
+python manage.py backfill_progress
+if [ "$PR_RECALC_DEFERRED" = "True" ]; then
+    python manage.py process_pr_jobs &
+fi
+# Each Gunicorn worker writes its request metrics here; /metrics adds them up
+export METRICS_DIR="${METRICS_DIR:-/tmp/gym-metrics}"
+rm -f "$METRICS_DIR"/*.json
+# SERVER_MODE=asgi serves the same app through mysite.asgi on uvicorn
+# workers, so the async JSON API views share each worker's event loop
+if [ "$SERVER_MODE" = "asgi" ]; then
+    gunicorn mysite.asgi -k uvicorn_worker.UvicornWorker
+else
+    gunicorn mysite.wsgi
+fi
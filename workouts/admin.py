@@ -1,5 +1,34 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
+from .fragments import bump_data_version
 from .models import Exercise, Workout, WorkoutSet, PersonalRecord
+from .services import rebuild_all_prs
+
+
+class DataVersionAdminMixin:
+    """
+    Admin edits bypass the app's write paths, so bump the owners' data
+    versions here to retire their cached page fragments.
+    """
+    owner_lookup = 'user'
+
+    def owner_ids(self, queryset):
+        return set(queryset.values_list(self.owner_lookup, flat=True))
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        for user_id in self.owner_ids(self.model.objects.filter(pk=form.instance.pk)):
+            bump_data_version(user_id)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, self.model.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        user_ids = self.owner_ids(queryset)
+        super().delete_queryset(request, queryset)
+        for user_id in user_ids:
+            bump_data_version(user_id)
 
 
 class WorkoutSetInline(admin.TabularInline):
@@ -11,24 +40,52 @@ class WorkoutSetInline(admin.TabularInline):
 class ExerciseAdmin(admin.ModelAdmin):
     list_display = ('name', 'user', 'description')
     list_filter = ('user',)
+    list_select_related = ('user',)
     search_fields = ('name',)
 
 
 @admin.register(Workout)
-class WorkoutAdmin(admin.ModelAdmin):
+class WorkoutAdmin(DataVersionAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'date', 'notes')
     list_filter = ('user', 'date')
+    list_select_related = ('user',)
     inlines = [WorkoutSetInline]
 
 
 @admin.register(WorkoutSet)
-class WorkoutSetAdmin(admin.ModelAdmin):
-    list_display = ('workout', 'exercise', 'set_number', 'reps', 'weight')
+class WorkoutSetAdmin(DataVersionAdminMixin, admin.ModelAdmin):
+    owner_lookup = 'workout__user'
+    list_display = ('workout', 'exercise', 'set_number', 'count', 'reps', 'weight')
     list_filter = ('exercise',)
+    list_select_related = ('workout__user', 'exercise')
 
 
 @admin.register(PersonalRecord)
-class PersonalRecordAdmin(admin.ModelAdmin):
+class PersonalRecordAdmin(DataVersionAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'exercise', 'pr_type', 'sets', 'reps', 'weight', 'date', 'is_current', 'is_manual')
     list_filter = ('user', 'exercise', 'pr_type', 'is_current', 'is_manual')
-    search_fields = ('exercise__name',)
\ No newline at end of file
+    list_select_related = ('user', 'exercise')
+    search_fields = ('exercise__name',)
+
+@admin.action(description="Rebuild PRs for selected users")
+def rebuild_prs(modeladmin, request, queryset):
+    totals = {'created': 0, 'updated': 0, 'deleted': 0}
+    for user in queryset:
+        changes = rebuild_all_prs(user)
+        for key in totals:
+            totals[key] += changes[key]
+    modeladmin.message_user(
+        request,
+        f"Rebuilt PRs for {queryset.count()} users: {totals['created']} created, "
+        f"{totals['updated']} updated, {totals['deleted']} deleted. "
+        "For the whole database use `manage.py rebuild_prs`.",
+        messages.SUCCESS,
+    )
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class WorkoutsUserAdmin(UserAdmin):
+    actions = [rebuild_prs]
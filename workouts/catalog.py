@@ -0,0 +1,50 @@
+from django.core.cache import cache
+from django.db.models import Q
+
+from .fragments import data_version
+from .models import Exercise
+
+# Keys carry the user's data version, so entries are never stale; this only
+# lets catalogs nobody asks for any more age out
+CATALOG_TIMEOUT = 24 * 60 * 60
+
+
+def exercise_catalog(user, version=None):
+    """
+    The exercises ``user`` can pick from — global ones plus their own — as
+    a list ordered by name, cached under the user's data version.
+
+    Every exercise write bumps it (a global one bumps every user's), and
+    being in the database, the bump reaches every worker whatever the cache
+    backend. Pass ``version`` when the caller has already read it.
+    """
+    if version is None:
+        version = data_version(user.pk)
+    key = f'exercise-catalog:{user.pk}:{version}'
+    exercises = cache.get(key)
+    if exercises is None:
+        exercises = list(Exercise.objects.filter(Q(user=user) | Q(user__isnull=True)))
+        cache.set(key, exercises, CATALOG_TIMEOUT)
+    return exercises
+
+
+def get_exercise(user, pk, version=None):
+    """
+    The catalog exercise with ``pk``; raises Exercise.DoesNotExist like
+    QuerySet.get().
+
+    A pk missing from the cached catalog is looked up in the database
+    before giving up, in case the catalog was built just before the
+    exercise's transaction committed.
+    """
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        raise Exercise.DoesNotExist(f'Invalid exercise id {pk!r}.')
+    for exercise in exercise_catalog(user, version):
+        if exercise.pk == pk:
+            return exercise
+    exercise = Exercise.objects.filter(Q(user=user) | Q(user__isnull=True), pk=pk).first()
+    if exercise is None:
+        raise Exercise.DoesNotExist(f'No exercise {pk} in the catalog.')
+    return exercise
@@ -0,0 +1,77 @@
+"""
+Largest-Triangle-Three-Buckets downsampling for chart series.
+
+LTTB keeps the points that shape the line: each bucket contributes the
+point forming the largest triangle with the point picked before it and
+the average of the next bucket, so peaks and dips survive where plain
+every-nth sampling would step over them.
+"""
+
+
+def _lttb_between(xs, ys, lo, hi, count):
+    """
+    Indices of ``count`` points strictly between ``lo`` and ``hi``, which
+    are both kept already and anchor the first and last triangles.
+    """
+    interior = hi - lo - 1
+    if count >= interior:
+        return list(range(lo + 1, hi))
+    if count <= 0:
+        return []
+    every = interior / count
+    picked = []
+    a = lo
+    for i in range(count):
+        start = lo + 1 + int(i * every)
+        end = lo + 1 + int((i + 1) * every)
+        if i + 1 < count:
+            next_end = lo + 1 + int((i + 2) * every)
+            avg_x = sum(xs[end:next_end]) / (next_end - end)
+            avg_y = sum(ys[end:next_end]) / (next_end - end)
+        else:
+            avg_x, avg_y = xs[hi], ys[hi]
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            # Twice the triangle's area; only the comparison matters
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        picked.append(best)
+        a = best
+    return picked
+
+
+def lttb(xs, ys, max_points, keep=()):
+    """
+    Indices of at most ``max_points`` points of the series (``xs``
+    ascending) that best keep its shape, in order.
+
+    The first and last points and every index in ``keep`` are always
+    included. The kept points split the series into stretches, and the
+    remaining budget is shared between the stretches by length and spent
+    by LTTB within each, so mandatory points only ever add detail. If the
+    mandatory points alone exceed ``max_points``, just they are returned.
+    """
+    n = len(xs)
+    if n <= max_points:
+        return list(range(n))
+    anchors = sorted({0, n - 1} | {i for i in keep if 0 <= i < n})
+    budget = max_points - len(anchors)
+    if budget <= 0:
+        return anchors
+
+    # Largest-remainder split of the budget over the gaps between anchors
+    gaps = [(lo, hi, hi - lo - 1) for lo, hi in zip(anchors, anchors[1:])]
+    interior = sum(size for _, _, size in gaps)
+    shares = [budget * size / interior for _, _, size in gaps]
+    counts = [int(share) for share in shares]
+    by_remainder = sorted(range(len(gaps)), key=lambda g: counts[g] - shares[g])
+    for g in by_remainder[:budget - sum(counts)]:
+        counts[g] += 1
+
+    picked = [anchors[0]]
+    for (lo, hi, _), count in zip(gaps, counts):
+        picked.extend(_lttb_between(xs, ys, lo, hi, count))
+        picked.append(hi)
+    return picked
@@ -0,0 +1,122 @@
+import csv
+import json
+import zlib
+
+from .models import PersonalRecord, WorkoutSet
+
+EXPORT_DATASETS = ('sets', 'prs')
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+# Rows fetched per database round trip, and bytes per chunk handed to
+# the response (or file); small enough to keep memory flat, large enough
+# that per-chunk overhead doesn't dominate
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+# The set columns match what importer.py reads, so an export imports back
+EXPORT_COLUMNS = {
+    'sets': ('date', 'exercise', 'set_number', 'reps', 'weight'),
+    'prs': (
+        'date', 'exercise', 'pr_type', 'reps', 'weight', 'sets',
+        'previous_value', 'previous_date', 'is_current', 'is_manual',
+    ),
+}
+
+
+def export_rows(user, dataset):
+    """
+    Yield ``user``'s sets or PRs as tuples in EXPORT_COLUMNS order, oldest
+    first, fetched ``EXPORT_CHUNK_SIZE`` rows at a time without building
+    model instances. Counted set rows are expanded to one row per set.
+    """
+    if dataset == 'sets':
+        rows = (
+            WorkoutSet.objects.filter(workout__user=user)
+            .order_by('workout__date', 'exercise__name', 'set_number', 'pk')
+            .values_list('workout__date', 'exercise__name', 'set_number', 'reps', 'weight', 'count')
+        )
+        return _expand_counts(rows.iterator(chunk_size=EXPORT_CHUNK_SIZE))
+    elif dataset == 'prs':
+        rows = (
+            PersonalRecord.objects.filter(user=user)
+            .order_by('date', 'exercise__name', 'pr_type', 'reps', 'weight', 'pk')
+            .values_list(
+                'date', 'exercise__name', 'pr_type', 'reps', 'weight', 'sets',
+                'previous_value', 'previous_date', 'is_current', 'is_manual',
+            )
+        )
+    else:
+        raise ValueError(f"Unknown export dataset {dataset!r}; use one of {', '.join(EXPORT_DATASETS)}.")
+    return rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _expand_counts(rows):
+    for date, exercise, set_number, reps, weight, count in rows:
+        for n in range(count):
+            yield date, exercise, set_number + n, reps, weight
+
+
+def _cell(value):
+    # Dates as ISO strings and Decimals as exact strings, in both formats
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    return str(value)
+
+
+class _Echo:
+    """A file-like object whose write() just returns the line, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def export_lines(rows, columns, fmt):
+    """Encode ``rows`` as CSV (with a header row) or NDJSON lines, one at a time."""
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow([_cell(value) for value in row])
+    elif fmt == 'ndjson':
+        for row in rows:
+            yield json.dumps(dict(zip(columns, map(_cell, row)))) + '\n'
+    else:
+        raise ValueError(f"Unknown export format {fmt!r}; use one of {', '.join(EXPORT_FORMATS)}.")
+
+
+def _buffered(lines, size=EXPORT_BUFFER_SIZE):
+    """Join text lines into UTF-8 byte chunks of about ``size`` bytes."""
+    buffer, length = [], 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzipped(chunks):
+    """Compress byte ``chunks`` into a gzip stream, chunk by chunk."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_history(user, dataset='sets', fmt='csv', compress=False):
+    """
+    Stream an export of ``user``'s sets or PRs as byte chunks: CSV or
+    NDJSON, optionally gzipped. Rows are read, encoded and compressed a
+    chunk at a time, so the export is never held in memory as a whole.
+    """
+    chunks = _buffered(export_lines(export_rows(user, dataset), EXPORT_COLUMNS[dataset], fmt))
+    return _gzipped(chunks) if compress else chunks
+
+
+def export_filename(user, dataset, fmt, compress=False):
+    return f"{user.username}-{dataset}.{fmt}{'.gz' if compress else ''}"
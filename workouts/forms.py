@@ -60,4 +60,38 @@ def parse_sets(text):
                 'weight': weight,
             })
             set_counter += 1
-    return sets
\ No newline at end of file
+    return sets
+
+def collapse_sets(sets):
+    """Merge consecutive identical sets from parse_sets() into one dict with a 'count'.
+
+    Example: the five sets of '5x5x100' become
+    [{'set_number': 1, 'reps': 5, 'weight': 100.0, 'count': 5}].
+    """
+    collapsed = []
+    for s in sets:
+        last = collapsed[-1] if collapsed else None
+        if (last and (last['reps'], last['weight']) == (s['reps'], s['weight'])
+                and last['set_number'] + last['count'] == s['set_number']):
+            last['count'] += 1
+        else:
+            collapsed.append({**s, 'count': 1})
+    return collapsed
+
+
+def format_sets(sets):
+    """Render WorkoutSets in quick-entry notation, e.g. '4x5x100, 1x3x100'.
+
+    Consecutive identical sets are merged, whether they are stored as one
+    counted row or as separate rows.
+    """
+    runs = []
+    for s in sets:
+        if runs and (runs[-1][1], runs[-1][2]) == (s.reps, s.weight):
+            runs[-1][0] += s.count
+        else:
+            runs.append([s.count, s.reps, s.weight])
+    return ', '.join(
+        f"{count}x{reps}x{int(weight) if weight == int(weight) else weight}"
+        for count, reps, weight in runs
+    )
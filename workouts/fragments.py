@@ -0,0 +1,85 @@
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import DataVersion
+
+# Keys carry the data version, so entries are never stale; this only
+# lets fragments nobody asks for any more age out
+FRAGMENT_TIMEOUT = 24 * 60 * 60
+
+STATS_NAMES_KEY = 'fragment-stats:names'
+
+
+def data_version(user_id):
+    """The user's current data version (0 before their first write)."""
+    version = DataVersion.objects.filter(user_id=user_id).values_list('version', flat=True).first()
+    return version or 0
+
+
+def bump_data_version(user_id):
+    """Retire every cached fragment of the user after a workout, set, PR or media write."""
+    if DataVersion.objects.filter(user_id=user_id).update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic():
+            DataVersion.objects.create(user_id=user_id, version=1)
+    except IntegrityError:
+        # Created concurrently
+        DataVersion.objects.filter(user_id=user_id).update(version=F('version') + 1)
+
+
+def bump_all_data_versions():
+    """Retire every user's cached fragments, after a change that shows in all of them."""
+    DataVersion.objects.update(version=F('version') + 1)
+    # Users who never wrote since versions were introduced may still have data cached at 0
+    without = get_user_model().objects.filter(data_version__isnull=True).values_list('pk', flat=True)
+    DataVersion.objects.bulk_create(
+        [DataVersion(user_id=user_id, version=1) for user_id in without], ignore_conflicts=True,
+    )
+
+
+def fragment_key(user_id, version, name, vary_on=()):
+    """
+    Cache key for a rendered fragment under the user's data version.
+    Exercise writes bump it too (exercise names appear in most fragments,
+    and the exercise catalog is keyed on it); being in the database, the
+    bump reaches every worker.
+    """
+    vary = hashlib.md5(':'.join(str(v) for v in vary_on).encode()).hexdigest()
+    return f'fragment:{name}:{user_id}:{version}:{vary}'
+
+
+def record_fragment(name, hit):
+    """Count a fragment cache hit or miss for fragment_stats()."""
+    key = f'fragment-stats:{name}:{"hits" if hit else "misses"}'
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+    names = cache.get(STATS_NAMES_KEY, [])
+    if name not in names:
+        cache.set(STATS_NAMES_KEY, sorted(names + [name]), None)
+
+
+def fragment_stats(reset=False):
+    """Hit/miss counts per fragment name, as recorded in this cache."""
+    names = cache.get(STATS_NAMES_KEY, [])
+    keys = [f'fragment-stats:{name}:{kind}' for name in names for kind in ('hits', 'misses')]
+    counts = cache.get_many(keys)
+    stats = {}
+    for name in names:
+        hits = counts.get(f'fragment-stats:{name}:hits', 0)
+        misses = counts.get(f'fragment-stats:{name}:misses', 0)
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+    if reset:
+        cache.delete_many(keys + [STATS_NAMES_KEY])
+    return stats
@@ -0,0 +1,261 @@
+import csv
+import datetime
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from .catalog import exercise_catalog
+from .models import Exercise, Workout, WorkoutSet, normalize_exercise_name
+from .services import enqueue_pr_recalc, rebuild_all_prs, refresh_day_summaries
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+IMPORT_CHUNK_SIZE = 1000
+
+# Only the first few bad rows are reported back; the rest are just counted
+MAX_REPORTED_ERRORS = 20
+
+# Column aliases seen in spreadsheet exports
+FIELD_ALIASES = {
+    'exercise_name': 'exercise',
+    'set': 'set_number',
+    'weight_kg': 'weight',
+}
+
+MAX_WEIGHT = Decimal('99999.99')
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def import_format_for(filename):
+    """'csv' or 'ndjson' from a file name's extension; None if unknown."""
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    return None
+
+
+def iter_rows(stream, fmt):
+    """
+    Yield (line_number, row dict) from a text stream of CSV (with a header
+    row) or NDJSON (one object per line), one row at a time.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # DictReader's line_num is the physical line the row ended on
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_number, None
+                continue
+            yield line_number, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f"Unknown import format {fmt!r}; use one of {', '.join(IMPORT_FORMATS)}.")
+
+
+def parse_row(row):
+    """
+    Validate one imported row into (date, exercise name, reps, weight,
+    set_number or None). Raises ImportRowError.
+    """
+    if row is None:
+        raise ImportRowError('Not a JSON object.')
+    fields = {}
+    for key, value in row.items():
+        if key is None:
+            # Extra CSV cells beyond the header
+            continue
+        key = key.strip().lower()
+        fields[FIELD_ALIASES.get(key, key)] = value.strip() if isinstance(value, str) else value
+
+    try:
+        date = datetime.date.fromisoformat(str(fields.get('date') or ''))
+    except ValueError:
+        raise ImportRowError(f"Invalid date {fields.get('date')!r}; use YYYY-MM-DD.")
+
+    name = str(fields.get('exercise') or '').strip()
+    if not name:
+        raise ImportRowError('Missing exercise name.')
+    if len(name) > Exercise._meta.get_field('name').max_length:
+        raise ImportRowError('Exercise name is too long.')
+
+    try:
+        reps = int(fields.get('reps'))
+    except (TypeError, ValueError):
+        raise ImportRowError(f"Invalid reps {fields.get('reps')!r}.")
+    if reps < 1:
+        raise ImportRowError('Reps must be at least 1.')
+
+    try:
+        weight = Decimal(str(fields.get('weight'))).quantize(Decimal('0.01'))
+        if weight.is_nan():
+            raise InvalidOperation
+    except (InvalidOperation, ValueError):
+        raise ImportRowError(f"Invalid weight {fields.get('weight')!r}.")
+    if not 0 <= weight <= MAX_WEIGHT:
+        raise ImportRowError(f'Weight must be between 0 and {MAX_WEIGHT}.')
+
+    set_number = fields.get('set_number')
+    if set_number in (None, ''):
+        set_number = None
+    else:
+        try:
+            set_number = int(set_number)
+        except (TypeError, ValueError):
+            raise ImportRowError(f'Invalid set number {set_number!r}.')
+        if set_number < 1:
+            raise ImportRowError('Set number must be at least 1.')
+
+    return date, name, reps, weight, set_number
+
+
+def import_workout_history(user, stream, fmt, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Import sets for ``user`` from a CSV or NDJSON text stream with columns
+    date, exercise, reps, weight and optional set_number.
+
+    The stream is read ``chunk_size`` rows at a time. Each chunk is written
+    in one transaction: missing workouts with one ``bulk_create``, then its
+    sets with another. Nothing is kept across chunks except the exercise
+    lookup and the earliest imported date per exercise, so memory does not
+    grow with the file. Exercise names are matched against the user's
+    catalog ignoring case and spacing (normalize_exercise_name(), as the
+    search index does); unknown ones become custom exercises. Rows
+    without a set number continue the numbering of that exercise on that day.
+    With COMPACT_SETS, consecutive identical sets share one counted row.
+
+    Bad rows are skipped and reported. PRs are rebuilt once at the end
+    with rebuild_all_prs(), rather than per row; with PR_RECALC_DEFERRED
+    a job is queued per affected exercise from its earliest imported day.
+    This also runs if the import stops part-way (a decode error, say), for
+    the chunks committed before it.
+
+    Returns a summary dict.
+    """
+    exercises = {}
+    for exercise in exercise_catalog(user):
+        # A user's own exercise wins over a global one of the same name
+        key = normalize_exercise_name(exercise.name)
+        if exercise.user_id is not None or key not in exercises:
+            exercises[key] = exercise
+
+    summary = {
+        'rows': 0,
+        'sets_created': 0,
+        'workouts_created': 0,
+        'exercises_created': 0,
+        'exercises_affected': 0,
+        'error_count': 0,
+        'errors': [],
+    }
+    since = {}
+
+    rows = iter_rows(stream, fmt)
+    try:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            parsed = []
+            for line_number, row in chunk:
+                summary['rows'] += 1
+                try:
+                    parsed.append(parse_row(row))
+                except ImportRowError as e:
+                    summary['error_count'] += 1
+                    if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                        summary['errors'].append(f'Line {line_number}: {e}')
+            if parsed:
+                _import_chunk(user, parsed, exercises, since, summary)
+    finally:
+        # Committed chunks stay even if a later one fails, so bring PRs
+        # and summaries up to date for them either way
+        summary['exercises_affected'] = len(since)
+        if since and settings.PR_RECALC_DEFERRED:
+            by_id = {exercise.pk: exercise for exercise in exercises.values()}
+            for exercise_id, date in since.items():
+                enqueue_pr_recalc(user, by_id[exercise_id], date)
+            # Days whose PRs the worker won't touch still gained sets
+            refresh_day_summaries(user)
+        elif since:
+            # One pass over the whole account beats replaying each affected
+            # exercise's history separately; it also refreshes the summaries
+            rebuild_all_prs(user)
+    return summary
+
+
+def _import_chunk(user, parsed, exercises, since, summary):
+    chunk_since = {}
+    with transaction.atomic():
+        for _, name, _, _, _ in parsed:
+            key = normalize_exercise_name(name)
+            if key not in exercises:
+                exercises[key] = Exercise.objects.create(user=user, name=name)
+                summary['exercises_created'] += 1
+
+        dates = {date for date, _, _, _, _ in parsed}
+        workout_ids = dict(
+            Workout.objects.filter(user=user, date__in=dates).values_list('date', 'pk')
+        )
+        missing = dates - workout_ids.keys()
+        if missing:
+            # ignore_conflicts: a set saved from the workout page may create
+            # one of these days concurrently
+            Workout.objects.bulk_create(
+                [Workout(user=user, date=date) for date in sorted(missing)], ignore_conflicts=True,
+            )
+            created = dict(
+                Workout.objects.filter(user=user, date__in=missing).values_list('date', 'pk')
+            )
+            workout_ids.update(created)
+            summary['workouts_created'] += len(created)
+
+        # Rows without a set number continue after the highest one stored
+        next_number = {
+            (workout_id, exercise_id): highest + 1
+            for workout_id, exercise_id, highest in (
+                WorkoutSet.objects.filter(workout_id__in=workout_ids.values())
+                .values('workout_id', 'exercise_id')
+                .annotate(highest=Max('set_number'))
+                .values_list('workout_id', 'exercise_id', 'highest')
+            )
+        }
+        new_sets = []
+        for date, name, reps, weight, set_number in parsed:
+            exercise = exercises[normalize_exercise_name(name)]
+            key = (workout_ids[date], exercise.pk)
+            if set_number is None:
+                set_number = next_number.get(key, 1)
+            next_number[key] = max(next_number.get(key, 1), set_number + 1)
+            last = new_sets[-1] if new_sets else None
+            if (settings.COMPACT_SETS and last is not None
+                    and (last.workout_id, last.exercise_id, last.reps, last.weight) == (key[0], exercise.pk, reps, weight)
+                    and last.last_set_number + 1 == set_number):
+                # The next identical set of a run: count it on the run's row
+                last.count += 1
+            else:
+                new_sets.append(WorkoutSet(
+                    workout_id=key[0], exercise=exercise,
+                    set_number=set_number, reps=reps, weight=weight,
+                ))
+            if exercise.pk not in chunk_since or date < chunk_since[exercise.pk]:
+                chunk_since[exercise.pk] = date
+        WorkoutSet.objects.bulk_create(new_sets)
+        summary['sets_created'] += sum(s.count for s in new_sets)
+    # Only once committed: a chunk that rolled back has nothing to rebuild
+    for exercise_id, date in chunk_since.items():
+        if exercise_id not in since or date < since[exercise_id]:
+            since[exercise_id] = date
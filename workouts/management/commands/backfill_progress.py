@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from workouts.models import ExerciseProgress, WeeklyVolume
+from workouts.services import refresh_day_summaries
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the progress table (each exercise's best estimated 1RM per day) and the weekly "
+        "and monthly volume rollups from existing sets, for users who have sets but no "
+        "progress or volume rows yet. Day summaries are rebuilt along the way, from the same read."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", action="append", dest="usernames", metavar="USERNAME",
+                            help="Only backfill this user (repeatable).")
+        parser.add_argument("--all", action="store_true",
+                            help="Also rebuild users who already have progress and volume rows.")
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(workouts__sets__isnull=False).distinct().order_by("pk")
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+        if not options["all"]:
+            users = users.exclude(
+                Exists(ExerciseProgress.objects.filter(user=OuterRef("pk")))
+                & Exists(WeeklyVolume.objects.filter(user=OuterRef("pk")))
+            )
+        count = 0
+        for user in users.iterator():
+            refresh_day_summaries(user)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Done. Progress and volume backfilled for {count} users."))
@@ -0,0 +1,84 @@
+import datetime
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from workouts.models import Exercise
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Time api_add_sets quick entries and count their database round trips."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "entries", nargs="*", default=["1x10x60", "5x5x100", "10x10x60", "3x10x60, 3x8x70, 3x6x80"],
+            help="Quick entry strings to benchmark.",
+        )
+        parser.add_argument("--repeat", type=int, default=20, help="Requests per entry.")
+
+    def handle(self, *args, **options):
+        # Everything runs inside a transaction that is rolled back at the end,
+        # so the benchmark leaves no users, workouts or PRs behind.
+        try:
+            with transaction.atomic():
+                self.run(options["entries"], options["repeat"])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def run(self, entries, repeat):
+        user = User.objects.create_user("bench-add-sets")
+        exercise = Exercise.objects.create(user=user, name="Bench Add Sets")
+        host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else "localhost"
+        client = Client(HTTP_HOST=host if host != "*" else "localhost")
+        client.force_login(user)
+        url = reverse("api_add_sets")
+        today = datetime.date.today()
+
+        self.stdout.write(f"{'entry':<28} {'sets':>5} {'queries':>8} {'mean ms':>9} {'p50 ms':>8} {'max ms':>8}")
+        for entry in entries:
+            timings, queries, sets = [], [], 0
+            for i in range(repeat):
+                # A fresh day per request, so every request pays for workout creation
+                body = json.dumps({
+                    "exercise_id": exercise.pk,
+                    "workout_date": (today - datetime.timedelta(days=i)).isoformat(),
+                    "sets_text": entry,
+                })
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    response = client.post(url, body, content_type="application/json")
+                    timings.append((time.perf_counter() - start) * 1000)
+                data = response.json()
+                if data.get("status") != "ok":
+                    self.stderr.write(f"{entry}: {data.get('message')}")
+                    break
+                # Session/auth lookups are not part of the write path, and the
+                # savepoints only exist because of the outer rollback transaction
+                queries.append(sum(
+                    1 for q in ctx.captured_queries
+                    if "django_session" not in q["sql"] and "auth_user" not in q["sql"]
+                    and not q["sql"].startswith(("SAVEPOINT", "RELEASE SAVEPOINT"))
+                ))
+                sets = len(data["sets"])
+            if not timings:
+                continue
+            self.stdout.write(
+                f"{entry:<28} {sets:>5} {statistics.mean(queries):>8.1f} "
+                f"{statistics.mean(timings):>9.2f} {statistics.median(timings):>8.2f} {max(timings):>8.2f}"
+            )
+            user.workouts.all().delete()
+            user.personal_records.all().delete()
+            user.pr_frontiers.all().delete()
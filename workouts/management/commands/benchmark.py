@@ -0,0 +1,230 @@
+import datetime
+import json
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from workouts.forms import parse_sets
+from workouts.management.commands.generate_history import REP_SCHEMES, session_entry
+from workouts.fragments import bump_data_version
+from workouts.models import Exercise, ExerciseProgress, PersonalRecord
+from workouts.services import recalculate_prs
+
+TARGETS = [
+    "parse_sets", "recalculate_prs", "dashboard", "workout_history", "pr_list", "api_add_sets", "export",
+    "progress", "progress_cached",
+]
+
+# Days in the series the progress targets chart, about 27 years of daily training
+PROGRESS_POINTS = 10_000
+
+
+class _Rollback(Exception):
+    pass
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the hot paths (PR recalculation, quick-entry parsing, dashboard, history, "
+        "PR list, add sets, set export, a 10k-point progress chart) against an existing account and report p50/p95/max and peak memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Account to benchmark (default: the first synthetic-* user).")
+        parser.add_argument("--repeat", type=int, default=20, help="Samples per target.")
+        parser.add_argument("--only", action="append", choices=TARGETS, help="Only run this target (repeatable).")
+        parser.add_argument("--output", help="Append the results as JSON to this file, to compare commits.")
+
+    def handle(self, *args, **options):
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+        else:
+            user = User.objects.filter(username__startswith="synthetic-").order_by("pk").first()
+        if user is None:
+            raise CommandError("No account to benchmark; run `manage.py generate_history` first or pass --user.")
+
+        self.user = user
+        self.repeat = options["repeat"]
+        host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else "localhost"
+        self.client = Client(HTTP_HOST=host if host != "*" else "localhost")
+        self.client.force_login(user)
+
+        self.stdout.write(
+            f"{user.username}: {user.workouts.count()} workouts, "
+            f"{user.personal_records.count()} PRs; {self.repeat} samples per target"
+        )
+        self.stdout.write(f"{'target':<18} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'peak KiB':>10}")
+        results = {}
+        for target in options["only"] or TARGETS:
+            # Writes happen inside a transaction that is rolled back, so the
+            # account is left exactly as it was
+            try:
+                with transaction.atomic():
+                    results[target] = self.measure(getattr(self, f"bench_{target}")())
+                    raise _Rollback
+            except _Rollback:
+                pass
+            r = results[target]
+            self.stdout.write(
+                f"{target:<18} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['max_ms']:>9.2f} {r['peak_kib']:>10.1f}"
+            )
+
+        if options["output"]:
+            self.write_report(options["output"], results)
+
+    def measure(self, run):
+        """
+        Time ``run`` ``repeat`` times, then once more under tracemalloc for
+        the peak allocation (tracing would skew the timings).
+        """
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - start) * 1000)
+
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {
+            "p50_ms": round(statistics.median(timings), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+            "max_ms": round(max(timings), 3),
+            "peak_kib": round(peak / 1024, 1),
+        }
+
+    def get(self, name, **params):
+        url = reverse(name)
+
+        def run():
+            response = self.client.get(url, params)
+            assert response.status_code == 200, f"{name}: HTTP {response.status_code}"
+        return run
+
+    def bench_parse_sets(self):
+        rng = random.Random(0)
+        texts = [session_entry(rng, rng.randrange(20, 200, 5), rng.choice(REP_SCHEMES)) for _ in range(200)]
+
+        def run():
+            for text in texts:
+                parse_sets(text)
+        return run
+
+    def bench_recalculate_prs(self):
+        """Full replay of the account's most-logged exercise."""
+        exercise = (
+            Exercise.objects.filter(workout_sets__workout__user=self.user)
+            .annotate(n=Count("workout_sets")).order_by("-n").first()
+        )
+        return lambda: recalculate_prs(self.user, exercise)
+
+    def bench_dashboard(self):
+        today = datetime.date.today()
+        return self.get("dashboard", year=today.year, month=today.month)
+
+    def bench_workout_history(self):
+        return self.get("workout_history")
+
+    def bench_pr_list(self):
+        return self.get("pr_list")
+
+    def bench_api_add_sets(self):
+        """Sets appended to the latest workout, the common case."""
+        workout = self.user.workouts.order_by("-date").first()
+        exercise = workout.sets.first().exercise
+        url = reverse("api_add_sets")
+        body = json.dumps({"workout_id": workout.pk, "exercise_id": exercise.pk, "sets_text": "3x5x100"})
+
+        def run():
+            data = self.client.post(url, body, content_type="application/json").json()
+            assert data["status"] == "ok", data.get("message")
+        return run
+
+    def bench_export(self):
+        """The account's full set export, gzipped, drained like a download would be."""
+        url = reverse("api_export_history")
+
+        def run():
+            response = self.client.get(url, {"data": "sets", "gzip": "1"})
+            assert response.status_code == 200, f"export: HTTP {response.status_code}"
+            for _ in response.streaming_content:
+                pass
+        return run
+
+    def progress_series(self):
+        """
+        A scratch exercise with a PROGRESS_POINTS-day series and a PR every
+        100 days, and the GET that charts it downsampled to 500 points.
+        """
+        rng = random.Random(0)
+        exercise = Exercise.objects.create(user=self.user, name="Benchmark progress")
+        start = datetime.date.today() - datetime.timedelta(days=PROGRESS_POINTS)
+        rows, e1rm = [], 60.0
+        for n in range(PROGRESS_POINTS):
+            e1rm = max(20.0, e1rm + rng.uniform(-2, 2.1))
+            rows.append(ExerciseProgress(
+                user=self.user, exercise=exercise, date=start + datetime.timedelta(days=n),
+                epley=round(e1rm, 2), brzycki=round(e1rm * 0.97, 2),
+            ))
+        ExerciseProgress.objects.bulk_create(rows, batch_size=1000)
+        PersonalRecord.objects.bulk_create(
+            PersonalRecord(user=self.user, exercise=exercise, pr_type="weight", reps=1,
+                           weight=row.epley, date=row.date)
+            for row in rows[::100]
+        )
+        return self.get("api_exercise_progress", exercise_id=exercise.pk, max_points=500)
+
+    def bench_progress(self):
+        """Downsampling a 10k-point series, as the first chart load after a write does."""
+        get = self.progress_series()
+
+        def run():
+            bump_data_version(self.user.pk)
+            get()
+        return run
+
+    def bench_progress_cached(self):
+        """The same chart reloaded with no new writes, served from the cache."""
+        return self.progress_series()
+
+    def write_report(self, path, results):
+        try:
+            revision = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except OSError:
+            revision = ""
+        try:
+            with open(path) as f:
+                runs = json.load(f)
+        except (OSError, ValueError):
+            runs = []
+        runs.append({
+            "recorded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "revision": revision,
+            "user": self.user.username,
+            "repeat": self.repeat,
+            "results": results,
+        })
+        with open(path, "w") as f:
+            json.dump(runs, f, indent=2)
+        self.stdout.write(f"Results appended to {path}")
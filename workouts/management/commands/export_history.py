@@ -0,0 +1,50 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from workouts.exporter import EXPORT_DATASETS, EXPORT_FORMATS, export_history
+
+
+class Command(BaseCommand):
+    help = (
+        "Export a user's sets or PRs as CSV or NDJSON, optionally gzipped, streaming rows from "
+        "the database to the output file so the export is never held in memory. Set exports "
+        "can be read back with import_history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", required=True, help="Account to export.")
+        parser.add_argument("--data", choices=EXPORT_DATASETS, default="sets", help="What to export.")
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv", help="Output format.")
+        parser.add_argument("--gzip", action="store_true", help="Gzip the output.")
+        parser.add_argument("-o", "--output", default="-", help="Output file, or - for stdout (the default).")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options["user"]).first()
+        if user is None:
+            raise CommandError(f"No user named {options['user']!r}.")
+
+        chunks = export_history(user, options["data"], options["format"], options["gzip"])
+        started = time.perf_counter()
+        if options["output"] == "-":
+            self.write(chunks, sys.stdout.buffer)
+            sys.stdout.flush()
+            return
+        try:
+            with open(options["output"], "wb") as f:
+                size = self.write(chunks, f)
+        except OSError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. Wrote {size / 1024:.1f} KiB to {options['output']} in {elapsed:.1f}s."
+        ))
+
+    def write(self, chunks, f):
+        size = 0
+        for chunk in chunks:
+            f.write(chunk)
+            size += len(chunk)
+        return size
@@ -0,0 +1,128 @@
+import datetime
+import random
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from workouts.forms import collapse_sets, parse_sets
+from workouts.models import Exercise, Workout, WorkoutSet
+from workouts.services import rebuild_all_prs
+
+# Rep targets a synthetic lifter cycles through, per exercise
+REP_SCHEMES = [(5, 5), (4, 8), (3, 10), (3, 12)]
+BATCH_SIZE = 2000
+
+
+def session_entry(rng, weight, scheme):
+    """
+    Quick-entry text for one exercise in a session, e.g. '4x5x100, 1x3+1+1x100'.
+
+    Most sets hit the target reps at the working weight; the last set is
+    sometimes missed or ground out with struggle reps.
+    """
+    sets, reps = scheme
+    roll = rng.random()
+    if roll < 0.2:
+        # Ran out of steam on the last set
+        last = f"1x{max(reps - rng.randint(1, 3), 1)}+{rng.randint(1, 2)}+{rng.randint(1, 2)}"
+    elif roll < 0.3:
+        last = f"1x{max(reps - rng.randint(1, 2), 1)}"
+    else:
+        last = f"1x{reps}"
+    entry = f"{last}x{weight}"
+    if sets > 1:
+        entry = f"{sets - 1}x{reps}x{weight}, {entry}"
+    return entry
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic users with years of realistic workout history "
+        "(progression, deloads, repeated weights and struggle reps) for local benchmarking."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=5, help="Number of users to create.")
+        parser.add_argument("--years", type=float, default=2, help="Years of history per user.")
+        parser.add_argument("--prefix", default="synthetic", help="Username prefix.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed, for reproducible data.")
+        parser.add_argument("--clear", action="store_true",
+                            help="Delete existing users with this prefix first.")
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        existing = User.objects.filter(username__startswith=f"{prefix}-")
+        if options["clear"]:
+            count, _ = existing.delete()
+            self.stdout.write(f"Deleted {count} rows belonging to existing {prefix} users.")
+        elif existing.exists():
+            raise CommandError(f"Users named {prefix}-* already exist; pass --clear to replace them.")
+
+        if not Exercise.objects.filter(user=None).exists():
+            call_command("load_default_exercises", stdout=self.stdout)
+        exercises = list(Exercise.objects.filter(user=None).order_by("pk"))
+
+        rng = random.Random(options["seed"])
+        end = datetime.date.today()
+        start = end - datetime.timedelta(days=int(options["years"] * 365))
+        for i in range(1, options["users"] + 1):
+            with transaction.atomic():
+                user = User.objects.create_user(f"{prefix}-{i}")
+                n_sets = self.generate_user(rng, user, rng.sample(exercises, min(len(exercises), 8)), start, end)
+            self.stdout.write(f"{user.username}: {user.workouts.count()} workouts, {n_sets} sets")
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+    def generate_user(self, rng, user, exercises, start, end):
+        weights = {ex.pk: Decimal(rng.randrange(20, 100, 5)) for ex in exercises}
+        schemes = {ex.pk: rng.choice(REP_SCHEMES) for ex in exercises}
+        sessions_per_week = rng.choice([2, 3, 4])
+
+        dates = []
+        day = start
+        while day <= end:
+            # A week off now and then
+            if rng.random() < 0.03:
+                day += datetime.timedelta(days=7)
+                continue
+            if rng.random() < sessions_per_week / 7:
+                dates.append(day)
+            day += datetime.timedelta(days=1)
+
+        workouts = Workout.objects.bulk_create([Workout(user=user, date=d) for d in dates])
+        if workouts and workouts[0].pk is None:
+            # Backends that don't return ids from bulk inserts
+            workouts = list(Workout.objects.filter(user=user).order_by("date"))
+
+        sets, total = [], 0
+        for workout in workouts:
+            for exercise in rng.sample(exercises, rng.randint(2, min(5, len(exercises)))):
+                weight = weights[exercise.pk]
+                parsed = parse_sets(session_entry(rng, weight, schemes[exercise.pk]))
+                if settings.COMPACT_SETS:
+                    parsed = collapse_sets(parsed)
+                for s in parsed:
+                    sets.append(WorkoutSet(workout=workout, exercise=exercise, **s))
+
+                # Slow linear progression with the occasional deload and scheme change;
+                # weights otherwise repeat across sessions
+                roll = rng.random()
+                if roll < 0.25:
+                    weights[exercise.pk] = weight + Decimal("2.5")
+                elif roll < 0.28:
+                    deload = (weight * Decimal("0.9") / Decimal("2.5")).to_integral_value() * Decimal("2.5")
+                    weights[exercise.pk] = max(Decimal(20), deload)
+                elif roll < 0.30:
+                    schemes[exercise.pk] = rng.choice(REP_SCHEMES)
+            if len(sets) >= BATCH_SIZE:
+                WorkoutSet.objects.bulk_create(sets)
+                total += sum(s.count for s in sets)
+                sets = []
+        WorkoutSet.objects.bulk_create(sets)
+        total += sum(s.count for s in sets)
+
+        rebuild_all_prs(user)
+        return total
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from workouts.media import generate_derivatives
+from workouts.models import ExerciseMedia, WorkoutMedia
+
+
+class Command(BaseCommand):
+    help = "Backfill WebP thumbnail/preview derivatives for existing image media."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Regenerate derivatives for media that already has them.",
+        )
+
+    def handle(self, *args, **options):
+        generated = skipped = failed = 0
+        for model in (ExerciseMedia, WorkoutMedia):
+            media_qs = model.objects.filter(is_video=False)
+            if not options["force"]:
+                media_qs = media_qs.filter(thumbnail="")
+            for media in media_qs.iterator():
+                try:
+                    ok = generate_derivatives(media)
+                except FileNotFoundError:
+                    ok = None
+                if ok:
+                    generated += 1
+                elif ok is None:
+                    skipped += 1
+                    self.stderr.write(f"Missing original: {media.file.name}")
+                else:
+                    failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. {generated} media processed, {failed} unreadable, {skipped} missing."
+        ))
@@ -0,0 +1,56 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from workouts.importer import IMPORT_CHUNK_SIZE, IMPORT_FORMATS, import_format_for, import_workout_history
+
+
+class Command(BaseCommand):
+    help = (
+        "Import workout history for a user from a CSV (with a header row) or NDJSON file with "
+        "columns date, exercise, reps, weight and optional set_number. The file is streamed "
+        "and written in chunks. At the end the account's PRs are rebuilt in one pass (with "
+        "PR_RECALC_DEFERRED, a recalculation is queued per affected exercise), also if the import "
+        "stops part-way."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - for stdin.")
+        parser.add_argument("--user", required=True, help="Account to import into.")
+        parser.add_argument("--format", choices=IMPORT_FORMATS,
+                            help="File format (default: from the file extension).")
+        parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE,
+                            help="Rows written per transaction.")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options["user"]).first()
+        if user is None:
+            raise CommandError(f"No user named {options['user']!r}.")
+        path = options["path"]
+        fmt = options["format"] or import_format_for(path)
+        if fmt is None:
+            raise CommandError("Can't tell the format from the file name; pass --format.")
+
+        try:
+            if path == "-":
+                summary = import_workout_history(user, sys.stdin, fmt, max(options["chunk_size"], 1))
+            else:
+                # utf-8-sig: spreadsheet CSV exports often start with a BOM
+                with open(path, encoding="utf-8-sig", newline="") as f:
+                    summary = import_workout_history(user, f, fmt, max(options["chunk_size"], 1))
+        except OSError as e:
+            raise CommandError(str(e))
+        except UnicodeDecodeError:
+            raise CommandError("The file is not UTF-8 text; rows before the bad bytes were imported.")
+
+        for error in summary["errors"]:
+            self.stderr.write(error)
+        if summary["error_count"] > len(summary["errors"]):
+            self.stderr.write(f"... and {summary['error_count'] - len(summary['errors'])} more bad rows.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Done. {summary['rows']} rows read: {summary['sets_created']} sets in "
+            f"{summary['workouts_created']} new workouts, {summary['exercises_created']} new exercises, "
+            f"PRs recalculated for {summary['exercises_affected']} exercises, "
+            f"{summary['error_count']} rows skipped."
+        ))
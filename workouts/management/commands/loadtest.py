@@ -0,0 +1,152 @@
+import http.client
+import json
+import os
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from workouts.management.commands.benchmark import percentile
+
+# How each mode is served: the current sync Gunicorn setup, and the same
+# app through its ASGI entry point on uvicorn workers (start.sh's two modes)
+SERVERS = {
+    "sync": ["mysite.wsgi"],
+    "asgi": ["mysite.asgi", "-k", "uvicorn_worker.UvicornWorker"],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the JSON API under the sync (WSGI) and async (ASGI, uvicorn workers) "
+        "Gunicorn setups with the same worker count, and report throughput and latency. "
+        "Each client adds a set to the account's latest workout and deletes it again, so "
+        "the account is left as it was."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Account to load (default: the first synthetic-* user).")
+        parser.add_argument("--mode", action="append", choices=SERVERS, help="Only run this mode (repeatable).")
+        parser.add_argument("--concurrency", type=int, default=20, help="Clients sending requests at once.")
+        parser.add_argument("--rounds", type=int, default=20, help="Add/delete round trips per client.")
+        parser.add_argument("--workers", type=int, default=1, help="Gunicorn workers per server.")
+
+    def handle(self, *args, **options):
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+        else:
+            user = User.objects.filter(username__startswith="synthetic-").order_by("pk").first()
+        if user is None:
+            raise CommandError("No account to load; run `manage.py generate_history` first or pass --user.")
+        workout = user.workouts.order_by("-date").first()
+        first_set = workout.sets.first() if workout else None
+        if first_set is None:
+            raise CommandError(f"{user.username} has no sets to add to.")
+
+        # A session and CSRF token the clients share, as a logged-in browser would send
+        client = Client()
+        client.force_login(user)
+        csrf = secrets.token_hex(16)
+        self.headers = {
+            "Host": next((h for h in settings.ALLOWED_HOSTS if h not in ("*", "")), "localhost"),
+            "Content-Type": "application/json",
+            "Cookie": f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}; "
+                      f"{settings.CSRF_COOKIE_NAME}={csrf}",
+            "X-CSRFToken": csrf,
+        }
+        self.add_body = json.dumps({"workout_id": workout.pk, "exercise_id": first_set.exercise_id, "sets_text": "1x5x20"})
+
+        concurrency, rounds = options["concurrency"], options["rounds"]
+        self.stdout.write(
+            f"{user.username}: {concurrency} clients x {rounds} rounds (add + delete), "
+            f"{options['workers']} worker(s) per server"
+        )
+        self.stdout.write(f"{'mode':<6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'errors':>7}")
+        for mode in options["mode"] or SERVERS:
+            port = free_port()
+            server = self.start_server(mode, port, options["workers"])
+            try:
+                r = self.run_load(port, concurrency, rounds)
+            finally:
+                server.terminate()
+                server.wait()
+            self.stdout.write(
+                f"{mode:<6} {r['rps']:>8.1f} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+                f"{r['max_ms']:>9.2f} {r['errors']:>7}"
+            )
+
+    def start_server(self, mode, port, workers):
+        command = [
+            sys.executable, "-m", "gunicorn", *SERVERS[mode],
+            "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "--log-level", "warning",
+        ]
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env={**os.environ, "METRICS_DIR": ""})
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"{mode} server exited with status {server.returncode}.")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.1)
+        server.terminate()
+        raise CommandError(f"{mode} server did not start within 30s.")
+
+    def run_load(self, port, concurrency, rounds):
+        timings, errors = [], []
+        lock = threading.Lock()
+        add_url, delete_url = reverse("api_add_sets"), reverse("api_delete_set")
+
+        def post(conn, url, body):
+            start = time.perf_counter()
+            conn.request("POST", url, body, self.headers)
+            response = conn.getresponse()
+            data = response.read()
+            elapsed = (time.perf_counter() - start) * 1000
+            ok = response.status == 200
+            with lock:
+                timings.append(elapsed)
+                if not ok:
+                    errors.append(response.status)
+            return json.loads(data) if ok else None
+
+        def client():
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            try:
+                for _ in range(rounds):
+                    data = post(conn, add_url, self.add_body)
+                    if data:
+                        for s in data["sets"]:
+                            post(conn, delete_url, json.dumps({"set_id": s["id"], "all": True}))
+            finally:
+                conn.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            for future in [pool.submit(client) for _ in range(concurrency)]:
+                future.result()
+        elapsed = time.perf_counter() - started
+        return {
+            "rps": len(timings) / elapsed,
+            "p50_ms": statistics.median(timings),
+            "p95_ms": percentile(timings, 95),
+            "max_ms": max(timings),
+            "errors": len(errors),
+        }
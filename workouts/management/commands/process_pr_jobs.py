@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from workouts.services import process_pr_jobs
+
+
+class Command(BaseCommand):
+    help = "Drain the deferred PR recalculation queue (PR_RECALC_DEFERRED=True)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Process pending jobs and exit.")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            processed = process_pr_jobs()
+            self.stdout.write(self.style.SUCCESS(f"Done. {processed} jobs processed."))
+            return
+
+        self.stdout.write("Waiting for PR recalculation jobs. Press Ctrl+C to stop.")
+        try:
+            while True:
+                close_old_connections()
+                processed = process_pr_jobs(limit=100)
+                if processed:
+                    self.stdout.write(f"{processed} jobs processed.")
+                else:
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from workouts.services import refresh_day_summaries
+
+
+class Command(BaseCommand):
+    help = "Recompute the dashboard's per-day calendar summaries from workouts, sets and PRs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", action="append", dest="usernames", metavar="USERNAME",
+                            help="Only rebuild this user (repeatable).")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("pk")
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+        count = 0
+        for user in users.iterator():
+            refresh_day_summaries(user)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Done. Day summaries rebuilt for {count} users."))
@@ -0,0 +1,129 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from workouts.services import rebuild_all_prs
+
+CHANGE_KEYS = ("created", "updated", "deleted", "total")
+
+
+def _init_worker():
+    # Needed when the pool spawns rather than forks; a no-op otherwise
+    django.setup()
+
+
+def rebuild_users(user_ids, dry_run=False):
+    """Rebuild (or dry-run) the PRs of ``user_ids``; returns {user_id: changes}."""
+    results = {}
+    for user in User.objects.filter(pk__in=user_ids).order_by("pk"):
+        results[user.pk] = rebuild_all_prs(user, dry_run=dry_run)
+    # Users deleted since the run started have nothing to rebuild
+    for user_id in set(user_ids) - results.keys():
+        results[user_id] = dict.fromkeys(CHANGE_KEYS, 0)
+    return results
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild every user's automatic PRs (after a rule change, bulk import or fix), "
+        "sharding users across worker processes. Finished users are checkpointed, so an "
+        "interrupted run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", action="append", dest="usernames", metavar="USERNAME",
+                            help="Only rebuild this user (repeatable).")
+        parser.add_argument("--workers", type=int,
+                            help="Worker processes (default: CPU count; 1 on SQLite, which locks on writes).")
+        parser.add_argument("--chunk-size", type=int, default=20, help="Users per task handed to a worker.")
+        parser.add_argument("--checkpoint", default=os.path.join(settings.BASE_DIR, ".rebuild_prs.checkpoint"),
+                            help="File listing finished user ids; removed when the run completes.")
+        parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint.")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only count the PR rows that would change; writes nothing.")
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        checkpoint = options["checkpoint"]
+
+        users = User.objects.order_by("pk")
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+        user_ids = list(users.values_list("pk", flat=True))
+
+        done = set()
+        if not dry_run and not options["restart"] and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                done = {int(line) for line in f if line.strip()}
+            self.stdout.write(f"Resuming: {len(done & set(user_ids))} users already rebuilt.")
+        elif not dry_run and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        pending = [pk for pk in user_ids if pk not in done]
+
+        workers = options["workers"] or (1 if connection.vendor == "sqlite" else os.cpu_count() or 1)
+        size = max(options["chunk_size"], 1)
+        chunks = [pending[i:i + size] for i in range(0, len(pending), size)]
+        verb = "Checking" if dry_run else "Rebuilding"
+        self.stdout.write(f"{verb} PRs for {len(pending)} users in {len(chunks)} chunks with {workers} workers.")
+
+        totals = dict.fromkeys(CHANGE_KEYS, 0)
+        finished = changed = 0
+        started = time.perf_counter()
+        log = None if dry_run else open(checkpoint, "a")
+        try:
+            for results in self.run_chunks(chunks, workers, dry_run):
+                for changes in results.values():
+                    for key in CHANGE_KEYS:
+                        totals[key] += changes[key]
+                    if changes["created"] or changes["updated"] or changes["deleted"]:
+                        changed += 1
+                if log is not None:
+                    log.write("".join(f"{pk}\n" for pk in results))
+                    log.flush()
+                    os.fsync(log.fileno())
+                finished += len(results)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{finished}/{len(pending)} users, {totals['total']} PR rows, "
+                    f"{finished / elapsed:.1f} users/s"
+                )
+        finally:
+            if log is not None:
+                log.close()
+
+        elapsed = time.perf_counter() - started
+        if not dry_run and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        rate = finished / elapsed if elapsed else 0
+        summary = (
+            f"{finished} users in {elapsed:.1f}s ({rate:.1f} users/s, "
+            f"{totals['total'] / elapsed if elapsed else 0:.0f} PR rows/s): "
+            f"{changed} users {'would change' if dry_run else 'changed'}, "
+            f"{totals['created']} created, {totals['updated']} updated, {totals['deleted']} deleted"
+        )
+        self.stdout.write(self.style.SUCCESS(("Dry run. Checked " if dry_run else "Done. ") + summary))
+
+    def run_chunks(self, chunks, workers, dry_run):
+        """Yield each chunk's results as it finishes."""
+        if workers <= 1:
+            for chunk in chunks:
+                yield rebuild_users(chunk, dry_run)
+            return
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = [pool.submit(rebuild_users, chunk, dry_run) for chunk in chunks]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
@@ -0,0 +1,140 @@
+import datetime
+import random
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+
+from workouts.models import Exercise, PersonalRecord, PRFrontier, Workout, WorkoutSet
+from workouts.services import _load_state, _rebuild_all_prs, _recalculate_prs, rebuild_all_prs, recalculate_prs
+
+USERNAME = "stress-pr-recalc"
+
+
+def pr_rows(user):
+    return sorted(
+        PersonalRecord.objects.filter(user=user, is_manual=False).values_list(
+            "exercise_id", "pr_type", "reps", "weight", "sets", "date",
+            "previous_value", "previous_date", "is_current",
+        )
+    )
+
+
+def frontiers(user):
+    return {
+        f.exercise_id: (f.through_date, _load_state(f.state), _load_state(f.state_before))
+        for f in PRFrontier.objects.filter(user=user)
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Save sets and recalculate PRs from many threads at once, several threads per "
+        "user+exercise, then check the PR rows and frontiers against a full rebuild and "
+        "report recomputes per second. Runs against a scratch account that is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8, help="Threads saving at once.")
+        parser.add_argument("--pairs", type=int, default=4, help="Exercises the threads share.")
+        parser.add_argument("--iterations", type=int, default=25, help="Saves per thread.")
+        parser.add_argument("--days", type=int, default=10, help="Workout days the sets land on.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+        parser.add_argument("--rebuilds", type=int, default=0,
+                            help="Whole-account rebuilds run by one more thread while the others save.")
+        parser.add_argument("--no-lock", action="store_true",
+                            help="Recalculate and rebuild without the PR locks, to show the drift they prevent.")
+
+    def handle(self, *args, **options):
+        User.objects.filter(username=USERNAME).delete()
+        user = User.objects.create_user(USERNAME)
+        try:
+            self.run(user, options)
+        finally:
+            user.delete()
+
+    def run(self, user, options):
+        exercises = [Exercise.objects.create(user=user, name=f"Stress {n}") for n in range(options["pairs"])]
+        start = datetime.date.today() - datetime.timedelta(days=options["days"])
+        workouts = [
+            Workout.objects.create(user=user, date=start + datetime.timedelta(days=n))
+            for n in range(options["days"])
+        ]
+        recalc = _recalculate_prs if options["no_lock"] else recalculate_prs
+        rebuild = _rebuild_all_prs if options["no_lock"] else rebuild_all_prs
+        errors = Counter()
+
+        def worker(n):
+            rng = random.Random(options["seed"] * 1000 + n)
+            try:
+                for i in range(options["iterations"]):
+                    exercise = rng.choice(exercises)
+                    workout = rng.choice(workouts)
+                    new_set = WorkoutSet(
+                        workout=workout, exercise=exercise, set_number=n * options["iterations"] + i + 1,
+                        reps=rng.randint(1, 12), weight=Decimal(rng.randrange(40, 200, 5)),
+                        count=rng.randint(1, 3),
+                    )
+                    try:
+                        # Alternate between api_add_sets (save and recompute in
+                        # one transaction) and the delete / job worker shape
+                        if i % 2:
+                            with transaction.atomic():
+                                new_set.save()
+                                recalc(user, exercise, workout.date, ())
+                        else:
+                            new_set.save()
+                            recalc(user, exercise, workout.date, ())
+                    except DatabaseError as e:
+                        errors[type(e).__name__] += 1
+            finally:
+                connection.close()
+
+        def rebuilder():
+            try:
+                for _ in range(options["rebuilds"]):
+                    try:
+                        rebuild(user)
+                    except DatabaseError as e:
+                        errors[type(e).__name__] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(options["threads"])]
+        if options["rebuilds"]:
+            threads.append(threading.Thread(target=rebuilder))
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        total = options["threads"] * options["iterations"]
+        self.stdout.write(
+            f"{total} saves from {options['threads']} threads over {options['pairs']} exercise(s) "
+            f"in {elapsed:.2f}s: {total / elapsed:.1f} recomputes/s"
+            + (f", with {options['rebuilds']} rebuild(s)" if options["rebuilds"] else "")
+            + (f", {sum(errors.values())} failed ({dict(errors)})" if errors else "")
+        )
+
+        # Whatever the interleaving, the result must be what a rebuild from the sets gives
+        rows, states = pr_rows(user), frontiers(user)
+        duplicates = sum(n - 1 for n in Counter(row[:6] for row in rows).values() if n > 1)
+        rebuild_all_prs(user)
+        expected_rows, expected_states = pr_rows(user), frontiers(user)
+        missing = len(set(expected_rows) - set(rows))
+        extra = len(rows) - len(expected_rows) + missing
+        stale = sum(1 for ex, state in expected_states.items() if states.get(ex) != state)
+        if duplicates or missing or extra or stale:
+            raise CommandError(
+                f"PRs drifted: {duplicates} duplicate, {missing} missing, {extra} extra row(s), "
+                f"{stale} stale frontier(s)."
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"No drift: {len(rows)} PR rows and {len(states)} frontiers match a full rebuild."
+        ))
@@ -0,0 +1,63 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from workouts.models import MonthlyVolume, WeeklyVolume
+from workouts.services import rebuild_volume_rollups, volume_from_sets
+
+
+def weekly_rows(rows):
+    return {(row.exercise_id, row.week): (row.sets, row.reps, row.volume) for row in rows if row.sets}
+
+
+def monthly_rows(rows):
+    return {row.month: (row.sets, row.reps, row.volume) for row in rows if row.sets}
+
+
+def differences(stored, expected):
+    """Keys missing from ``stored``, extra in it, and with different totals."""
+    missing = expected.keys() - stored.keys()
+    extra = stored.keys() - expected.keys()
+    wrong = {key for key in stored.keys() & expected.keys() if stored[key] != expected[key]}
+    return missing, extra, wrong
+
+
+class Command(BaseCommand):
+    help = (
+        "Check the weekly and monthly volume rollups against totals computed from the sets, "
+        "and report every user whose rollups drifted. With --fix, rebuild those users' rollups."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", action="append", dest="usernames", metavar="USERNAME",
+                            help="Only check this user (repeatable).")
+        parser.add_argument("--fix", action="store_true", help="Rebuild the rollups of users that drifted.")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("pk")
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+        checked, drifted = 0, []
+        for user in users.iterator():
+            checked += 1
+            weekly, monthly = volume_from_sets(user)
+            problems = []
+            for name, stored, expected in (
+                ("week", weekly_rows(WeeklyVolume.objects.filter(user=user)), weekly_rows(weekly)),
+                ("month", monthly_rows(MonthlyVolume.objects.filter(user=user)), monthly_rows(monthly)),
+            ):
+                missing, extra, wrong = differences(stored, expected)
+                if missing or extra or wrong:
+                    problems.append(f"{name}: {len(missing)} missing, {len(extra)} extra, {len(wrong)} wrong")
+            if not problems:
+                continue
+            drifted.append(user)
+            self.stdout.write(f"{user.username}: " + "; ".join(problems))
+            if options["fix"]:
+                rebuild_volume_rollups(user)
+
+        if drifted and not options["fix"]:
+            raise CommandError(
+                f"Volume rollups drifted for {len(drifted)} of {checked} users; rerun with --fix to rebuild them."
+            )
+        fixed = f", rebuilt {len(drifted)}" if drifted else ""
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} users{fixed}."))
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import os
+import re
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+from storages.utils import clean_name
+
+logger = logging.getLogger(__name__)
+
+
+# Bytes read from storage per chunk when streaming media to the client
+STREAM_CHUNK_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.mp4': 'video/mp4',
+    '.mov': 'video/quicktime',
+    '.webm': 'video/webm',
+    '.avi': 'video/x-msvideo',
+}
+
+# Media model field → longest side in px of the WebP derivative stored there
+DERIVATIVES = {
+    'thumbnail': 320,
+    'preview': 960,
+}
+DERIVATIVE_QUALITY = 80
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def content_type_for(path):
+    ext = os.path.splitext(path)[1].lower()
+    return CONTENT_TYPES.get(ext, 'application/octet-stream')
+
+
+def _s3_object(storage, name):
+    """The boto3 Object behind ``name`` for S3 storages, else None."""
+    if not hasattr(storage, 'bucket'):
+        return None
+    return storage.bucket.Object(storage._normalize_name(clean_name(name)))
+
+
+def media_stat(storage, name):
+    """
+    Return (size, modified) for a stored file without reading it.
+
+    On S3 both come from a single HEAD request.
+    """
+    obj = _s3_object(storage, name)
+    if obj is not None:
+        obj.load()
+        return obj.content_length, obj.last_modified
+    return storage.size(name), storage.get_modified_time(name)
+
+
+def media_etag(name, size, modified):
+    """Strong validator for a stored file; uploads are never rewritten in place."""
+    digest = hashlib.md5(f'{name}:{size}:{modified.timestamp()}'.encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def parse_range(header, size):
+    """
+    Parse a single ``bytes=`` range against a file of ``size`` bytes.
+
+    Returns (start, end) inclusive, None when the header should be ignored
+    (absent, malformed or multi-range — serve the whole file), or False
+    when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def iter_media(storage, name, start, end, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield bytes ``start``..``end`` (inclusive) of a stored file in chunks of
+    at most ``chunk_size``, never holding more than one chunk in memory.
+
+    S3 storages get a ranged GET streamed straight from the response body;
+    django-storages' File objects would buffer the whole object first.
+    """
+    obj = _s3_object(storage, name)
+    if obj is not None:
+        body = obj.get(Range=f'bytes={start}-{end}')['Body']
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+        return
+
+    f = storage.open(name, 'rb')
+    try:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def generate_derivatives(media, source=None):
+    """
+    Store downscaled WebP copies of an ExerciseMedia / WorkoutMedia image
+    in its DERIVATIVES fields, next to the original.
+
+    ``source`` is an already-open file for the original (e.g. the upload),
+    to avoid reading it back from storage. Videos are skipped; images
+    Pillow cannot read are logged and left without derivatives.
+    Returns True if derivatives were written.
+    """
+    if media.is_video:
+        return False
+
+    f = source or media.file.open('rb')
+    try:
+        f.seek(0)
+        with Image.open(f) as img:
+            img = ImageOps.exif_transpose(img)
+            img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    except (OSError, Image.DecompressionBombError):
+        logger.warning("Could not generate derivatives for %s", media.file.name, exc_info=True)
+        return False
+    finally:
+        if source is None:
+            f.close()
+
+    stem = os.path.splitext(os.path.basename(media.file.name))[0]
+    for field, size in DERIVATIVES.items():
+        old = getattr(media, field)
+        if old:
+            old.delete(save=False)
+        resized = img.copy()
+        resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+        buf = BytesIO()
+        resized.save(buf, 'WEBP', quality=DERIVATIVE_QUALITY)
+        getattr(media, field).save(f'{stem}_{size}.webp', ContentFile(buf.getvalue()), save=False)
+
+    media.save(update_fields=list(DERIVATIVES))
+    return True
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.2 on 2026-10-17 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workouts", "0007_prrecalcjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="exercisemedia",
+            name="preview",
+            field=models.FileField(blank=True, upload_to="exercises/"),
+        ),
+        migrations.AddField(
+            model_name="exercisemedia",
+            name="thumbnail",
+            field=models.FileField(blank=True, upload_to="exercises/"),
+        ),
+        migrations.AddField(
+            model_name="workoutmedia",
+            name="preview",
+            field=models.FileField(blank=True, upload_to="workouts/"),
+        ),
+        migrations.AddField(
+            model_name="workoutmedia",
+            name="thumbnail",
+            field=models.FileField(blank=True, upload_to="workouts/"),
+        ),
+    ]
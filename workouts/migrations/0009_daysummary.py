@@ -0,0 +1,95 @@
+# Generated by Django 6.0.2 on 2026-10-17 02:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def build_day_summaries(apps, schema_editor):
+    Workout = apps.get_model("workouts", "Workout")
+    WorkoutSet = apps.get_model("workouts", "WorkoutSet")
+    PersonalRecord = apps.get_model("workouts", "PersonalRecord")
+    DaySummary = apps.get_model("workouts", "DaySummary")
+
+    days = {}
+
+    def day(user_id, date):
+        key = (user_id, date)
+        if key not in days:
+            days[key] = DaySummary(
+                user_id=user_id, date=date, exercise_ids=[], pr_exercise_ids=[]
+            )
+        return days[key]
+
+    for user_id, date in Workout.objects.values_list("user_id", "date"):
+        day(user_id, date).has_workout = True
+    for user_id, date, exercise_id, n in (
+        WorkoutSet.objects.values_list(
+            "workout__user_id", "workout__date", "exercise_id"
+        )
+        .annotate(n=Count("id"))
+        .order_by("workout__user_id", "workout__date", "exercise_id")
+    ):
+        summary = day(user_id, date)
+        summary.set_count += n
+        summary.exercise_ids.append(exercise_id)
+    for user_id, date, exercise_id in (
+        PersonalRecord.objects.filter(is_current=True)
+        .values_list("user_id", "date", "exercise_id")
+        .distinct()
+        .order_by("user_id", "date", "exercise_id")
+    ):
+        summary = day(user_id, date)
+        summary.has_pr = True
+        summary.pr_exercise_ids.append(exercise_id)
+
+    DaySummary.objects.bulk_create(days.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workouts", "0008_media_derivatives"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DaySummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("has_workout", models.BooleanField(default=False)),
+                ("has_pr", models.BooleanField(default=False)),
+                ("set_count", models.PositiveIntegerField(default=0)),
+                ("exercise_ids", models.JSONField(default=list)),
+                ("pr_exercise_ids", models.JSONField(default=list)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="day_summaries",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["date"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "date"), name="one_day_summary_per_day"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(build_day_summaries, migrations.RunPython.noop),
+    ]
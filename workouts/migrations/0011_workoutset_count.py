@@ -0,0 +1,81 @@
+# Generated by Django 6.0.2 on 2026-10-17 09:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def collapse_sets(apps, schema_editor):
+    """
+    Merge runs of identical consecutive sets (same workout, exercise, reps
+    and weight, with consecutive set numbers) into one row with a count.
+    Runs never span workouts, so this goes BATCH_SIZE workouts at a time.
+    Skipped unless COMPACT_SETS is on: existing rows stay one per set.
+    """
+    if not settings.COMPACT_SETS:
+        return
+    Workout = apps.get_model("workouts", "Workout")
+    WorkoutSet = apps.get_model("workouts", "WorkoutSet")
+    last_pk = 0
+    while True:
+        workout_ids = list(
+            Workout.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:BATCH_SIZE]
+        )
+        if not workout_ids:
+            break
+        last_pk = workout_ids[-1]
+
+        runs, doomed = [], []
+        for row in (
+            WorkoutSet.objects.filter(workout_id__in=workout_ids)
+            .order_by("workout_id", "exercise_id", "set_number", "pk")
+        ):
+            run = runs[-1] if runs else None
+            if (
+                run is not None
+                and (run.workout_id, run.exercise_id, run.reps, run.weight)
+                == (row.workout_id, row.exercise_id, row.reps, row.weight)
+                and run.set_number + run.count == row.set_number
+            ):
+                run.count += row.count
+                doomed.append(row.pk)
+            else:
+                runs.append(row)
+        if doomed:
+            WorkoutSet.objects.bulk_update([run for run in runs if run.count > 1], ["count"])
+            WorkoutSet.objects.filter(pk__in=doomed).delete()
+
+
+def expand_sets(apps, schema_editor):
+    """Split counted rows back into one row per set."""
+    WorkoutSet = apps.get_model("workouts", "WorkoutSet")
+    while True:
+        rows = list(WorkoutSet.objects.filter(count__gt=1).order_by("pk")[:BATCH_SIZE])
+        if not rows:
+            break
+        WorkoutSet.objects.bulk_create([
+            WorkoutSet(
+                workout_id=row.workout_id, exercise_id=row.exercise_id,
+                set_number=row.set_number + n, reps=row.reps, weight=row.weight,
+            )
+            for row in rows
+            for n in range(1, row.count)
+        ])
+        WorkoutSet.objects.filter(pk__in=[row.pk for row in rows]).update(count=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workouts", "0010_dataversion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="workoutset",
+            name="count",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(collapse_sets, expand_sets),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0.2 on 2026-10-17 04:30
+
+from django.db import migrations, models
+
+
+def fill_name_normalized(apps, schema_editor):
+    # Same as models.normalize_exercise_name() at the time of writing
+    Exercise = apps.get_model("workouts", "Exercise")
+    exercises = list(Exercise.objects.only("name"))
+    for exercise in exercises:
+        exercise.name_normalized = " ".join(exercise.name.split()).casefold()
+    Exercise.objects.bulk_update(exercises, ["name_normalized"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workouts", "0013_weeklyvolume_monthlyvolume"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="exercise",
+            name="name_normalized",
+            field=models.CharField(
+                db_index=True, default="", editable=False, max_length=200
+            ),
+        ),
+        migrations.RunPython(fill_name_normalized, migrations.RunPython.noop),
+    ]
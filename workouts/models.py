@@ -1,8 +1,13 @@
 from django.db import models
 from django.conf import settings
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+def normalize_exercise_name(name):
+    """Case- and spacing-insensitive form of an exercise name, for matching and search."""
+    return ' '.join(name.split()).casefold()
+
+
 class Exercise(models.Model):
     """An exercise that a user can perform (e.g., Bench Press, Squat)."""
     user = models.ForeignKey(
@@ -13,6 +18,9 @@ class Exercise(models.Model):
         null=True,
     )
     name = models.CharField(max_length=200)
+    # normalize_exercise_name(name), set on save; indexed for duplicate
+    # checks and prefix search (see search.py)
+    name_normalized = models.CharField(max_length=200, db_index=True, editable=False, default='')
     description = models.TextField(blank=True, default='')
 
 
@@ -26,6 +34,13 @@ class Exercise(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.name_normalized = normalize_exercise_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_normalized'}
+        super().save(*args, **kwargs)
+
 
 class Workout(models.Model):
     """A workout session on a specific date."""
@@ -49,7 +64,13 @@ class Workout(models.Model):
 
 
 class WorkoutSet(models.Model):
-    """A single set within a workout (e.g., Bench Press: 20 reps @ 50kg)."""
+    """
+    A set within a workout (e.g., Bench Press: 20 reps @ 50kg).
+
+    With ``count`` > 1 the row stands for that many identical consecutive
+    sets, numbered ``set_number`` to ``last_set_number`` (so "5x5x100" is
+    one row instead of five).
+    """
     workout = models.ForeignKey(
         Workout,
         on_delete=models.CASCADE,
@@ -63,11 +84,28 @@ class WorkoutSet(models.Model):
     set_number = models.PositiveIntegerField()
     reps = models.PositiveIntegerField()
     weight = models.DecimalField(max_digits=7, decimal_places=2)
+    count = models.PositiveIntegerField(default=1)
 
     class Meta:
         ordering = ['set_number']
 
+    @property
+    def last_set_number(self):
+        return self.set_number + self.count - 1
+
+    @property
+    def label(self):
+        """'Set 3', or 'Sets 1–5' for a counted row."""
+        if self.count > 1:
+            return f"Sets {self.set_number}–{self.last_set_number}"
+        return f"Set {self.set_number}"
+
     def __str__(self):
+        if self.count > 1:
+            return (
+                f"{self.exercise.name}: {self.count} x {self.reps} reps @ {self.weight}kg "
+                f"(sets {self.set_number}-{self.last_set_number})"
+            )
         return f"{self.exercise.name}: {self.reps} reps @ {self.weight}kg (set {self.set_number})"
 
 
@@ -127,6 +165,9 @@ class ExerciseMedia(models.Model):
     )
     file = models.FileField(upload_to='exercises/')
     is_video = models.BooleanField(default=False)
+    # Downscaled WebP copies of images, stored next to the original
+    thumbnail = models.FileField(upload_to='exercises/', blank=True)
+    preview = models.FileField(upload_to='exercises/', blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -146,6 +187,9 @@ class WorkoutMedia(models.Model):
     )
     file = models.FileField(upload_to='workouts/')
     is_video = models.BooleanField(default=False)
+    # Downscaled WebP copies of images, stored next to the original
+    thumbnail = models.FileField(upload_to='workouts/', blank=True)
+    preview = models.FileField(upload_to='workouts/', blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -156,13 +200,246 @@ class WorkoutMedia(models.Model):
         return f"{kind} for {self.workout}"
 
 
+@receiver(post_save, sender=Exercise)
+@receiver(post_delete, sender=Exercise)
+def bump_exercise_data_version(sender, instance, signal, **kwargs):
+    from .fragments import bump_all_data_versions, bump_data_version
+
+    # The exercise catalog and most cached fragments are keyed on the data
+    # version; global exercises (user=None) appear in every user's
+    if instance.user_id is None:
+        bump_all_data_versions()
+    elif signal is post_save:
+        bump_data_version(instance.user_id)
+    else:
+        # Only an existing row: deleting the user cascades here after theirs is gone
+        DataVersion.objects.filter(user_id=instance.user_id).update(version=models.F('version') + 1)
+
+
 @receiver(post_delete, sender=ExerciseMedia)
 def delete_exercise_media_file(sender, instance, **kwargs):
-    if instance.file:
-        instance.file.delete(save=False)
+    for f in (instance.file, instance.thumbnail, instance.preview):
+        if f:
+            f.delete(save=False)
 
 
 @receiver(post_delete, sender=WorkoutMedia)
 def delete_workout_media_file(sender, instance, **kwargs):
-    if instance.file:
-        instance.file.delete(save=False)
\ No newline at end of file
+    for f in (instance.file, instance.thumbnail, instance.preview):
+        if f:
+            f.delete(save=False)
+
+
+@receiver(post_save, sender=WorkoutMedia)
+@receiver(post_delete, sender=WorkoutMedia)
+def bump_workout_media_data_version(sender, instance, signal, **kwargs):
+    from .fragments import bump_data_version
+
+    if signal is post_save:
+        bump_data_version(instance.workout.user_id)
+    else:
+        # Only an existing row: deleting the user cascades here after theirs is gone
+        DataVersion.objects.filter(user__workouts=instance.workout_id).update(version=models.F('version') + 1)
+
+class PRFrontier(models.Model):
+    """
+    Best-so-far PR trackers for one user + exercise, as left by the last
+    recalculation, so appending sets to the latest workout only has to
+    compare the new sets against it instead of replaying history.
+
+    ``state`` covers every day up to and including ``through_date``;
+    ``state_before`` covers the days before it, so further sets added to
+    that same day can be re-evaluated.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='pr_frontiers',
+    )
+    exercise = models.ForeignKey(
+        Exercise,
+        on_delete=models.CASCADE,
+        related_name='pr_frontiers',
+    )
+    through_date = models.DateField()
+    state_before = models.JSONField(default=dict)
+    state = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'exercise'], name='one_pr_frontier_per_exercise'),
+        ]
+
+    def __str__(self):
+        return f"PR frontier: {self.user.username} — {self.exercise.name} through {self.through_date}"
+
+
+class PRRecalcJob(models.Model):
+    """
+    A pending deferred PR recalculation for one user + exercise.
+
+    Jobs for the same pair are coalesced: enqueueing again keeps the
+    earliest ``since`` date and bumps ``updated_at`` so a worker that is
+    already running the job knows to run it again.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='pr_recalc_jobs',
+    )
+    exercise = models.ForeignKey(
+        Exercise,
+        on_delete=models.CASCADE,
+        related_name='pr_recalc_jobs',
+    )
+    since = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['updated_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'exercise'], name='one_pr_recalc_job_per_exercise'),
+        ]
+
+    def __str__(self):
+        return f"PR recalc: {self.user.username} — {self.exercise.name} since {self.since}"
+
+
+class DaySummary(models.Model):
+    """
+    Calendar rollup of one user's day, so the dashboard can render a month
+    from ~31 small rows. Kept current by services.refresh_day_summaries();
+    rebuild with `manage.py rebuild_day_summaries` if it ever drifts.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='day_summaries',
+    )
+    date = models.DateField()
+    has_workout = models.BooleanField(default=False)
+    has_pr = models.BooleanField(default=False)
+    set_count = models.PositiveIntegerField(default=0)
+    exercise_ids = models.JSONField(default=list)
+    # Exercises with a current PR dated on this day
+    pr_exercise_ids = models.JSONField(default=list)
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='one_day_summary_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} — {self.date}: {self.set_count} sets"
+
+
+class ExerciseProgress(models.Model):
+    """
+    Best estimated 1RM of one user's exercise on one day, by the Epley and
+    Brzycki formulas, for the progress chart. Kept current by
+    services.refresh_day_summaries() from the same set read as DaySummary;
+    fill it for existing history with `manage.py backfill_progress`.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='exercise_progress',
+    )
+    exercise = models.ForeignKey(
+        Exercise,
+        on_delete=models.CASCADE,
+        related_name='progress',
+    )
+    date = models.DateField()
+    epley = models.DecimalField(max_digits=8, decimal_places=2)
+    # Brzycki is undefined from 37 reps on, so a day of only such sets has none
+    brzycki = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'exercise', 'date'], name='one_progress_row_per_exercise_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} — {self.exercise.name} {self.date}: e1RM {self.epley}"
+
+
+class WeeklyVolume(models.Model):
+    """
+    Training volume of one user's exercise in one ISO week: sets, reps and
+    reps × weight summed over its sets. Adjusted by deltas in the same
+    transaction as each set added or deleted (services.apply_volume_delta);
+    check it against the sets with `manage.py verify_volume_rollups`.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='weekly_volumes',
+    )
+    exercise = models.ForeignKey(
+        Exercise,
+        on_delete=models.CASCADE,
+        related_name='weekly_volumes',
+    )
+    # Monday of the ISO week
+    week = models.DateField()
+    sets = models.IntegerField(default=0)
+    reps = models.IntegerField(default=0)
+    volume = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['week']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'exercise', 'week'], name='one_volume_row_per_exercise_week'),
+        ]
+
+    def __str__(self):
+        year, week, _ = self.week.isocalendar()
+        return f"{self.user.username} — {self.exercise.name} {year}-W{week:02d}: {self.volume}kg"
+
+
+class MonthlyVolume(models.Model):
+    """
+    Training volume of one user in one calendar month, across exercises.
+    Maintained like WeeklyVolume.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='monthly_volumes',
+    )
+    # First day of the month
+    month = models.DateField()
+    sets = models.IntegerField(default=0)
+    reps = models.IntegerField(default=0)
+    volume = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['month']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='one_volume_row_per_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} — {self.month:%Y-%m}: {self.volume}kg"
+
+
+class DataVersion(models.Model):
+    """
+    Per-user counter bumped on every workout, set, PR or media write.
+    Cached page fragments are keyed by it (see fragments.py), so a bump
+    retires all of the user's fragments at once.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='data_version',
+    )
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user.username}: data version {self.version}"
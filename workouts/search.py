@@ -0,0 +1,78 @@
+"""
+Exercise search for the type-ahead pickers, so pages no longer render the
+whole catalog into a dropdown.
+
+Matching runs on ``Exercise.name_normalized``: a prefix is a range scan on
+its index (``>= q`` and ``< q + U+10FFFF``), which SQLite and PostgreSQL
+both serve from a plain b-tree, unlike ``LIKE``/``ILIKE``. Only when the
+prefix matches don't fill a page does the search fall back to matching
+anywhere in the name ("press" finds "Bench Press"), which scans.
+
+Results are ranked by how many sets the user has logged of each exercise,
+read from the weekly volume rollups and cached under their data version.
+"""
+from django.core.cache import cache
+from django.db.models import Q, Sum
+
+from .fragments import FRAGMENT_TIMEOUT, data_version
+from .models import Exercise, WeeklyVolume, normalize_exercise_name
+
+SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 50
+
+
+def visible_exercises(user):
+    """Exercises ``user`` can pick: global ones plus their own."""
+    return Exercise.objects.filter(Q(user=user) | Q(user__isnull=True))
+
+
+def exercise_usage(user):
+    """{exercise_id: sets logged} for ``user``, cached under their data version."""
+    key = f'exercise-usage:{user.pk}:{data_version(user.pk)}'
+    usage = cache.get(key)
+    if usage is None:
+        usage = dict(
+            WeeklyVolume.objects.filter(user=user, sets__gt=0)
+            .values('exercise_id')
+            .annotate(n=Sum('sets'))
+            .order_by()
+            .values_list('exercise_id', 'n')
+        )
+        cache.set(key, usage, FRAGMENT_TIMEOUT)
+    return usage
+
+
+def _prefix(query):
+    return Q(name_normalized__gte=query, name_normalized__lt=query + '\U0010ffff')
+
+
+def _ranked(matches, usage, limit):
+    """Up to ``limit`` of ``matches``: those the user logged, most sets first, then the rest by name."""
+    ranked = sorted(
+        matches.filter(pk__in=list(usage)),
+        key=lambda exercise: (-usage[exercise.pk], exercise.name_normalized),
+    )[:limit]
+    if len(ranked) < limit:
+        ranked += matches.exclude(pk__in=list(usage)).order_by('name_normalized')[:limit - len(ranked)]
+    return ranked
+
+
+def search_exercises(user, query, limit=SEARCH_LIMIT):
+    """
+    Up to ``limit`` exercises visible to ``user`` whose name starts with
+    ``query`` (case and spacing ignored), then ones containing it. An
+    empty query lists the user's most used exercises.
+    """
+    query = normalize_exercise_name(query)
+    usage = exercise_usage(user)
+    visible = visible_exercises(user).only('id', 'user_id', 'name', 'name_normalized')
+    prefix = _prefix(query) if query else Q()
+    results = _ranked(visible.filter(prefix), usage, limit)
+    if query and len(results) < limit:
+        results += _ranked(visible.filter(name_normalized__contains=query).exclude(prefix), usage, limit - len(results))
+    return results
+
+
+def find_exercise(user, name):
+    """The exercise visible to ``user`` named ``name`` (case and spacing ignored), or None."""
+    return visible_exercises(user).filter(name_normalized=normalize_exercise_name(name)).first()
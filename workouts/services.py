@@ -1,48 +1,78 @@
+import datetime
+import logging
+import threading
 from collections import defaultdict
+from contextlib import contextmanager
 from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
 
-from django.db.models import Max, Count
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, DecimalField, F, FloatField, Max, Q, Sum, Value, When
+from django.db.models.functions import Cast, Least
+from django.utils import timezone
 
-from .models import PersonalRecord, WorkoutSet
+from .fragments import bump_data_version
+from .models import (
+    DaySummary, ExerciseProgress, MonthlyVolume, PersonalRecord, PRFrontier, PRRecalcJob, WeeklyVolume, Workout,
+    WorkoutSet,
+)
 
+logger = logging.getLogger(__name__)
 
-def recalculate_prs(user, exercise):
-    """
-    Recalculate all automatic PRs for a given user + exercise
-    by walking through ALL their WorkoutSets chronologically.
 
-    Manual PRs (is_manual=True) are left untouched.
-    """
+def _pr_context(pr_type, reps, weight):
+    """The key a PR competes under: reps for weight PRs, weight for rep PRs,
+    (reps, weight) for set PRs."""
+    if pr_type == 'weight':
+        return reps
+    if pr_type == 'reps':
+        return weight
+    return (reps, weight)
 
-    # 1. Delete all auto-detected PRs for this user+exercise
-    PersonalRecord.objects.filter(
-        user=user, exercise=exercise, is_manual=False
-    ).delete()
 
-    # 2. Get all sets for this user+exercise, ordered by date then set_number
-    all_sets = (
-        WorkoutSet.objects
-        .filter(workout__user=user, exercise=exercise)
-        .select_related('workout')
-        .order_by('workout__date', 'set_number')
-    )
+def _pr_identity(pr):
+    """Fields that identify a PR row; everything else is derived."""
+    return (pr.pr_type, pr.reps, pr.weight, pr.sets, pr.date)
 
-    if not all_sets.exists():
-        return []
 
-    # 3. Group sets by workout date
-    workouts_by_date = defaultdict(list)
-    for s in all_sets:
-        workouts_by_date[s.workout.date].append(s)
+def _pr_lookup(pr_type, context, value, date):
+    """Filter matching the PR row that set ``value`` for ``context`` on ``date``."""
+    if pr_type == 'weight':
+        return Q(pr_type=pr_type, reps=context, weight=value, sets=1, date=date)
+    if pr_type == 'reps':
+        return Q(pr_type=pr_type, reps=value, weight=context, sets=1, date=date)
+    reps, weight = context
+    return Q(pr_type=pr_type, reps=reps, weight=weight, sets=value, date=date)
+
+
+def _state_from_prs(prs):
+    """
+    Rebuild the best-so-far trackers from auto PR rows ordered by date.
+
+    A context only ever gets a new PR when it beats the previous one, so
+    the latest PR per context is the best value up to that point.
+    """
+    best_weight = {}
+    best_reps = {}
+    best_sets = {}
+    for pr in prs:
+        if pr.pr_type == 'weight':
+            best_weight[pr.reps] = (pr.weight, pr.date)
+        elif pr.pr_type == 'reps':
+            best_reps[pr.weight] = (pr.reps, pr.date)
+        elif pr.pr_type == 'sets':
+            best_sets[(pr.reps, pr.weight)] = (pr.sets, pr.date)
+    return best_weight, best_reps, best_sets
 
-    # Trackers for current bests
-    best_weight = {}    # key: reps → value: (weight, date)
-    best_reps = {}      # key: weight → value: (reps, date)
-    best_sets = {}      # key: (reps, weight) → value: (count, date)
 
-    new_prs = []  # collect all PR records to bulk create
+def _replay(user, exercise, workouts_by_date, best_weight, best_reps, best_sets):
+    """
+    Walk the given days chronologically, updating the trackers in place
+    and returning the PR records (unsaved) they produce.
+    """
+    new_prs = []
 
-    # 4. Walk through dates chronologically
     for date in sorted(workouts_by_date.keys()):
         day_sets = workouts_by_date[date]
 
@@ -95,7 +125,7 @@ def recalculate_prs(user, exercise):
         # --- SET PR: count sets with same reps+weight this day ---
         day_set_counts = defaultdict(int)  # (reps, weight) → count
         for s in day_sets:
-            day_set_counts[(s.reps, s.weight)] += 1
+            day_set_counts[(s.reps, s.weight)] += s.count
 
         for (reps, weight), count in day_set_counts.items():
             prev = best_sets.get((reps, weight))
@@ -114,34 +144,702 @@ def recalculate_prs(user, exercise):
                 ))
                 best_sets[(reps, weight)] = (count, date)
 
+    return new_prs
+
+
+def _dump_state(best_weight, best_reps, best_sets):
+    """Serialize the trackers for PRFrontier (JSON keys must be strings)."""
+    return {
+        'weight': [[reps, str(w), d.isoformat()] for reps, (w, d) in best_weight.items()],
+        'reps': [[str(w), reps, d.isoformat()] for w, (reps, d) in best_reps.items()],
+        'sets': [[reps, str(w), n, d.isoformat()] for (reps, w), (n, d) in best_sets.items()],
+    }
+
+
+def _load_state(data):
+    """Inverse of _dump_state()."""
+    date = datetime.date.fromisoformat
+    best_weight = {reps: (Decimal(w), date(d)) for reps, w, d in data.get('weight', [])}
+    best_reps = {Decimal(w): (reps, date(d)) for w, reps, d in data.get('reps', [])}
+    best_sets = {(reps, Decimal(w)): (n, date(d)) for reps, w, n, d in data.get('sets', [])}
+    return best_weight, best_reps, best_sets
+
+
+# Stripes of the in-process PR lock used where the database has no
+# advisory locks: pairs on different stripes recompute in parallel
+PR_LOCK_STRIPES = 64
+_pr_lock_stripes = [threading.Lock() for _ in range(PR_LOCK_STRIPES)]
+
+
+@contextmanager
+def pr_recalc_lock(user, exercise):
+    """
+    Serialise PR recalculation for one user + exercise, inside a transaction.
+
+    On PostgreSQL this takes a transaction-level advisory lock keyed on the
+    pair, which holds across processes until the outermost commit, so two
+    recomputes of the same pair never interleave while other pairs run in
+    parallel. Elsewhere (SQLite) the transaction itself is what serialises
+    writers; a striped in-process lock keeps threads of the same pair from
+    starting together. Inside an already open transaction the stripe is
+    skipped: that transaction holds (or will take) the database's only
+    write lock, and waiting on a stripe while holding it could deadlock
+    against a thread that holds the stripe and waits for the database.
+    """
+    # No savepoint: a failed recompute rolls back the caller's transaction too
+    if connection.vendor == 'postgresql':
+        with transaction.atomic(savepoint=False):
+            with connection.cursor() as cursor:
+                # The shared side of pr_rebuild_lock(): a whole-account rebuild waits for us
+                cursor.execute('SELECT pg_advisory_xact_lock_shared(%s)', [user.pk])
+                cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [user.pk, exercise.pk])
+            yield
+    elif connection.in_atomic_block:
+        yield
+    else:
+        with _pr_lock_stripes[hash((user.pk, exercise.pk)) % PR_LOCK_STRIPES], transaction.atomic(savepoint=False):
+            yield
+
+
+@contextmanager
+def pr_rebuild_lock(user):
+    """
+    Serialise a whole-account PR rebuild of ``user`` against every
+    recalculate_prs() of theirs, inside a transaction.
+
+    On PostgreSQL this takes the exclusive side of a per-user advisory
+    lock whose shared side pr_recalc_lock() holds, so the rebuild waits
+    for running recomputes and new ones wait for it to commit. Elsewhere
+    (SQLite) the transaction alone does it: transactions begin IMMEDIATE,
+    so the rebuild holds the database's only write lock from its first read.
+    """
+    with transaction.atomic(savepoint=False):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [user.pk])
+        yield
+
+
+def recalculate_prs(user, exercise, since=None, also_refresh=()):
+    """
+    Recalculate all automatic PRs for a given user + exercise
+    by walking through their WorkoutSets chronologically.
+
+    With ``since`` (a date), only days on or after it are replayed. The
+    best-so-far state as of the day before comes from the user's
+    PRFrontier when ``since`` is on or after its latest day (the common
+    "sets appended to today's workout" case, which then never looks at
+    older history), and is otherwise restored from the PR rows dated
+    before ``since``. Either way, only PR rows whose history or
+    ``is_current`` flag actually changed are written, and the result is
+    identical to a full rebuild. The frontier is rewritten afterwards.
+
+    Manual PRs (is_manual=True) are left untouched. DaySummary rows are
+    refreshed for every date whose PRs changed, plus ``also_refresh``
+    (the caller's edited day, to save it a second refresh).
+
+    Returns the current auto PRs in the replayed window, plus earlier
+    rows whose standing it affected (for toast notifications).
+
+    Runs under pr_recalc_lock(), so concurrent calls for the same pair
+    (two devices saving at once, a retried request) can't duplicate or
+    lose PR rows.
+    """
+    with pr_recalc_lock(user, exercise):
+        return _recalculate_prs(user, exercise, since, also_refresh)
+
+
+def _recalculate_prs(user, exercise, since, also_refresh):
+    auto_prs = PersonalRecord.objects.filter(
+        user=user, exercise=exercise, is_manual=False
+    )
+
+    # 1. Restore the trackers as of the day before the replay window
+    frontier = PRFrontier.objects.filter(user=user, exercise=exercise).first()
+    if since is None:
+        best_weight, best_reps, best_sets = {}, {}, {}
+        existing_prs = list(auto_prs)
+    else:
+        if frontier is not None and since >= frontier.through_date:
+            # Backdated edits land before through_date and take the slow path
+            state = frontier.state_before if since == frontier.through_date else frontier.state
+            best_weight, best_reps, best_sets = _load_state(state)
+        else:
+            best_weight, best_reps, best_sets = _state_from_prs(
+                auto_prs.filter(date__lt=since).order_by('date', 'pk')
+            )
+        existing_prs = list(auto_prs.filter(date__gte=since))
+    base = (dict(best_weight), dict(best_reps), dict(best_sets))
+
+    # 2. Get the sets to replay, ordered by date then set_number
+    replay_sets = (
+        WorkoutSet.objects
+        .filter(workout__user=user, exercise=exercise)
+        .select_related('workout')
+        .order_by('workout__date', 'set_number')
+    )
+    if since is not None:
+        replay_sets = replay_sets.filter(workout__date__gte=since)
+
+    # 3. Group sets by workout date
+    workouts_by_date = defaultdict(list)
+    for s in replay_sets:
+        workouts_by_date[s.workout.date].append(s)
+    days = sorted(workouts_by_date)
+
+    # 4. Replay the window, keeping the state before its last day for the frontier
+    new_prs = _replay(
+        user, exercise, {d: workouts_by_date[d] for d in days[:-1]},
+        best_weight, best_reps, best_sets,
+    )
+    state_before = _dump_state(best_weight, best_reps, best_sets)
+    new_prs += _replay(
+        user, exercise, {d: workouts_by_date[d] for d in days[-1:]},
+        best_weight, best_reps, best_sets,
+    )
+
     # 5. Mark only the latest PR per type+context as is_current
     #    Walk backwards — first seen per key is the current one
-    seen_weight = set()
-    seen_reps = set()
-    seen_sets = set()
-
+    seen = set()
     for pr in reversed(new_prs):
-        if pr.pr_type == 'weight':
-            key = pr.reps
-            if key in seen_weight:
-                pr.is_current = False
-            else:
-                seen_weight.add(key)
-        elif pr.pr_type == 'reps':
-            key = pr.weight
-            if key in seen_reps:
-                pr.is_current = False
-            else:
-                seen_reps.add(key)
-        elif pr.pr_type == 'sets':
-            key = (pr.reps, pr.weight)
-            if key in seen_sets:
-                pr.is_current = False
-            else:
-                seen_sets.add(key)
+        key = (pr.pr_type, _pr_context(pr.pr_type, pr.reps, pr.weight))
+        pr.is_current = key not in seen
+        seen.add(key)
+
+    # The latest earlier PR of a context is current unless the window now
+    # holds a PR for it; only contexts with PRs in the window can change.
+    touched = seen | {
+        (pr.pr_type, _pr_context(pr.pr_type, pr.reps, pr.weight)) for pr in existing_prs
+    }
+    lookups = []
+    for pr_type, context in touched:
+        tracker = base[('weight', 'reps', 'sets').index(pr_type)]
+        if context in tracker:
+            lookups.append(_pr_lookup(pr_type, context, *tracker[context]))
+    earlier_prs = []
+    if lookups:
+        q = lookups[0]
+        for lookup in lookups[1:]:
+            q |= lookup
+        earlier_prs = list(auto_prs.filter(q, date__lt=since))
+
+    current_prs = []
+    flip_on, flip_off = [], []
+    for pr in earlier_prs:
+        key = (pr.pr_type, _pr_context(pr.pr_type, pr.reps, pr.weight))
+        is_current = key not in seen
+        if is_current:
+            current_prs.append(pr)
+        if pr.is_current != is_current:
+            pr.is_current = is_current
+            (flip_on if is_current else flip_off).append(pr.pk)
+
+    # 6. Diff the replayed PRs against the stored ones
+    stored = defaultdict(list)
+    for pr in existing_prs:
+        stored[_pr_identity(pr)].append(pr)
+
+    to_create, to_update = [], []
+    for pr in new_prs:
+        matches = stored.get(_pr_identity(pr))
+        if not matches:
+            to_create.append(pr)
+            continue
+        old = matches.pop()
+        if (old.previous_value != pr.previous_value
+                or old.previous_date != pr.previous_date
+                or old.is_current != pr.is_current):
+            old.previous_value = pr.previous_value
+            old.previous_date = pr.previous_date
+            old.is_current = pr.is_current
+            to_update.append(old)
+        if old.is_current:
+            current_prs.append(old)
+    current_prs.extend(pr for pr in to_create if pr.is_current)
+
+    stale = [pr for matches in stored.values() for pr in matches]
+    stale_ids = [pr.pk for pr in stale]
+
+    # 7. Write only what changed
+    if stale_ids:
+        PersonalRecord.objects.filter(pk__in=stale_ids).delete()
+    if flip_on:
+        PersonalRecord.objects.filter(pk__in=flip_on).update(is_current=True)
+    if flip_off:
+        PersonalRecord.objects.filter(pk__in=flip_off).update(is_current=False)
+    if to_update:
+        PersonalRecord.objects.bulk_update(
+            to_update, ['previous_value', 'previous_date', 'is_current']
+        )
+    if to_create:
+        PersonalRecord.objects.bulk_create(to_create)
+
+    # 8. Save the frontier. An empty window leaves the latest day before
+    #    `since` unknown, so drop it and let the next call rebuild it.
+    if days:
+        if frontier is None:
+            frontier = PRFrontier(user=user, exercise=exercise)
+        frontier.through_date = days[-1]
+        frontier.state_before = state_before
+        frontier.state = _dump_state(best_weight, best_reps, best_sets)
+        frontier.save()
+    elif frontier is not None:
+        frontier.delete()
+
+    # 9. Keep the calendar's PR highlighting in step
+    changed = [pr for pr in earlier_prs if pr.pk in flip_on or pr.pk in flip_off]
+    changed_dates = {pr.date for pr in stale + changed + to_update + to_create}
+    refresh_day_summaries(user, changed_dates | set(also_refresh))
+
+    # 10. Return only the current PRs (for toast notifications)
+    return current_prs
+
+
+def _running_bests(rows, last_days):
+    """
+    One sorted-array pass over ``rows`` of (exercise_id, context, date, value)
+    already aggregated per day and sorted by exercise, context, date.
+
+    Returns (prs, state, state_before): ``prs`` lists (exercise_id, context,
+    date, value, previous, is_current) for every day that beat the running
+    best of its context; ``state`` / ``state_before`` map exercise_id to the
+    {context: (best, date)} trackers after all days / before the exercise's
+    last day (``last_days``), as recalculate_prs() leaves them in PRFrontier.
+    """
+    prs = []
+    state = defaultdict(dict)
+    state_before = defaultdict(dict)
+    for (exercise_id, context), days in groupby(rows, key=itemgetter(0, 1)):
+        last_day = last_days[exercise_id]
+        best = None
+        before = None
+        on_last_day = False
+        first = len(prs)
+        for _, _, date, value in days:
+            if date == last_day:
+                on_last_day = True
+                before = best
+            if best is None or value > best[0]:
+                prs.append([exercise_id, context, date, value, best, False])
+                best = (value, date)
+        # The context's latest PR is its current one
+        if len(prs) > first:
+            prs[-1][5] = True
+        state[exercise_id][context] = best
+        if not on_last_day:
+            before = best
+        if before is not None:
+            state_before[exercise_id][context] = before
+    return prs, state, state_before
+
+
+def _diff_pr_rows(user, records):
+    """
+    Compare rebuilt PR records with the user's stored auto PRs. Rows match
+    on (exercise, type, reps, weight, sets, date); a match whose previous
+    value/date or is_current differs counts as updated.
+    """
+    fields = ('exercise_id', 'pr_type', 'reps', 'weight', 'sets', 'date',
+              'previous_value', 'previous_date', 'is_current')
+    stored = defaultdict(list)
+    for row in PersonalRecord.objects.filter(user=user, is_manual=False).values_list(*fields):
+        stored[row[:6]].append(row[6:])
+    created = updated = 0
+    for pr in records:
+        row = tuple(getattr(pr, field) for field in fields)
+        matches = stored.get(row[:6])
+        if not matches:
+            created += 1
+        elif matches.pop() != row[6:]:
+            updated += 1
+    deleted = sum(len(matches) for matches in stored.values())
+    return {'created': created, 'updated': updated, 'deleted': deleted}
+
+
+def rebuild_all_prs(user, dry_run=False):
+    """
+    Rebuild every automatic PR of ``user``, for all exercises at once.
+
+    Equivalent to calling recalculate_prs(user, exercise) for each exercise
+    (rows, is_current flags and PRFrontier states all match), but reads
+    the user's sets with one ``values_list`` query and computes each PR
+    type as a group-by over sorted columns: a context's PRs only depend on
+    that context's own history, so sorting by (exercise, context, date)
+    turns the day-by-day replay into one running maximum per context.
+    The results are written with one delete and one ``bulk_create``.
+
+    Returns counts of the PR rows that were (or, with ``dry_run``, would
+    be) created, updated and deleted, plus the new ``total``. A dry run
+    writes nothing.
+
+    The sets are read and the PRs rewritten in one transaction under
+    pr_rebuild_lock(), so a concurrent recalculate_prs() of the same user
+    runs wholly before or after the rebuild. A dry run takes no lock.
+    """
+    if dry_run:
+        return _rebuild_all_prs(user, dry_run=True)
+    with pr_rebuild_lock(user):
+        return _rebuild_all_prs(user)
+
+
+def _rebuild_all_prs(user, dry_run=False):
+    rows = sorted(
+        WorkoutSet.objects.filter(workout__user=user)
+        .values_list('exercise_id', 'workout__date', 'reps', 'weight', 'count')
+    )
+    last_days = {}
+    for exercise_id, date, _, _, _ in rows:
+        last_days[exercise_id] = date
+
+    # Per-day aggregates, each sorted by (exercise, context, date):
+    # weight PRs are the heaviest weight per rep count, rep PRs the most
+    # reps per weight, set PRs the most sets per (reps, weight)
+    day_max_weight = {}
+    day_max_reps = {}
+    day_set_counts = defaultdict(int)
+    for exercise_id, date, reps, weight, count in rows:
+        key = (exercise_id, reps, date)
+        if key not in day_max_weight or weight > day_max_weight[key]:
+            day_max_weight[key] = weight
+        key = (exercise_id, weight, date)
+        if key not in day_max_reps or reps > day_max_reps[key]:
+            day_max_reps[key] = reps
+        day_set_counts[(exercise_id, (reps, weight), date)] += count
+
+    def columns(aggregate):
+        return sorted((ex, context, date, value) for (ex, context, date), value in aggregate.items())
+
+    weight_prs, weight_state, weight_before = _running_bests(columns(day_max_weight), last_days)
+    reps_prs, reps_state, reps_before = _running_bests(columns(day_max_reps), last_days)
+    sets_prs, sets_state, sets_before = _running_bests(columns(day_set_counts), last_days)
+
+    records = []
+    for exercise_id, reps, date, weight, previous, is_current in weight_prs:
+        records.append(PersonalRecord(
+            user=user, exercise_id=exercise_id, pr_type='weight',
+            reps=reps, weight=weight, sets=1, date=date,
+            previous_value=previous[0] if previous else None,
+            previous_date=previous[1] if previous else None,
+            is_current=is_current,
+        ))
+    for exercise_id, weight, date, reps, previous, is_current in reps_prs:
+        records.append(PersonalRecord(
+            user=user, exercise_id=exercise_id, pr_type='reps',
+            reps=reps, weight=weight, sets=1, date=date,
+            previous_value=Decimal(previous[0]) if previous else None,
+            previous_date=previous[1] if previous else None,
+            is_current=is_current,
+        ))
+    for exercise_id, (reps, weight), date, count, previous, is_current in sets_prs:
+        records.append(PersonalRecord(
+            user=user, exercise_id=exercise_id, pr_type='sets',
+            reps=reps, weight=weight, sets=count, date=date,
+            previous_value=Decimal(previous[0]) if previous else None,
+            previous_date=previous[1] if previous else None,
+            is_current=is_current,
+        ))
+
+    frontiers = [
+        PRFrontier(
+            user=user, exercise_id=exercise_id, through_date=last_day,
+            state_before=_dump_state(
+                weight_before[exercise_id], reps_before[exercise_id], sets_before[exercise_id],
+            ),
+            state=_dump_state(weight_state[exercise_id], reps_state[exercise_id], sets_state[exercise_id]),
+        )
+        for exercise_id, last_day in last_days.items()
+    ]
+
+    changes = _diff_pr_rows(user, records)
+    changes['total'] = len(records)
+    if dry_run:
+        return changes
+
+    PersonalRecord.objects.filter(user=user, is_manual=False).delete()
+    PersonalRecord.objects.bulk_create(records, batch_size=1000)
+    PRFrontier.objects.filter(user=user).delete()
+    PRFrontier.objects.bulk_create(frontiers, batch_size=1000)
+    refresh_day_summaries(user)
+    return changes
+
+
+def enqueue_pr_recalc(user, exercise, since):
+    """
+    Queue a deferred recalculate_prs() for user + exercise from ``since``,
+    coalescing with any job already pending for the same pair.
+    """
+    try:
+        with transaction.atomic():
+            job, created = PRRecalcJob.objects.get_or_create(
+                user=user, exercise=exercise, defaults={'since': since},
+            )
+    except IntegrityError:
+        # Another request created the job between our SELECT and INSERT
+        job, created = PRRecalcJob.objects.get(user=user, exercise=exercise), False
+    if not created:
+        # One UPDATE, so a concurrent enqueue can't overwrite an earlier since
+        if not PRRecalcJob.objects.filter(pk=job.pk).update(
+            since=Least('since', Value(since)), updated_at=timezone.now(),
+        ):
+            # The worker finished and removed the job in between; queue a new one
+            return enqueue_pr_recalc(user, exercise, since)
+    return job
+
+
+def process_pr_jobs(limit=None):
+    """
+    Run pending PR recalculation jobs, oldest first. Returns how many ran.
+
+    A job is only removed if nobody re-enqueued it while it was running;
+    otherwise it stays queued (with the earliest ``since``) for the next pass.
+    A job whose recalculation fails is logged and stays queued, moved
+    behind the others, so one bad job can't stop the worker.
+    """
+    jobs = PRRecalcJob.objects.select_related('user', 'exercise')
+    if limit:
+        jobs = jobs[:limit]
+
+    processed = 0
+    for job in list(jobs):
+        try:
+            recalculate_prs(job.user, job.exercise, since=job.since)
+        except Exception:
+            logger.exception('PR recalculation job %s (user %s, exercise %s) failed',
+                             job.pk, job.user_id, job.exercise_id)
+            PRRecalcJob.objects.filter(pk=job.pk).update(updated_at=timezone.now())
+            continue
+        PRRecalcJob.objects.filter(pk=job.pk, updated_at=job.updated_at).delete()
+        processed += 1
+    return processed
+
+
+E1RM_FORMULAS = ('epley', 'brzycki')
+
+CENT = Decimal('0.01')
+
+# Estimated 1RM of each set, in SQL so a day's best comes out of the same
+# GROUP BY as its set count. A single is its own 1RM. Epley, w × (1 +
+# reps/30), is kept ×30 so it stays exact multiplication; Brzycki,
+# w × 36 / (37 − reps), divides in floating point (SQLite would divide
+# integers when a weight is whole) and is undefined from 37 reps on.
+EPLEY_X30 = Case(
+    When(reps__lte=1, then=F('weight') * 30),
+    default=F('weight') * (F('reps') + 30),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+BRZYCKI = Case(
+    When(reps__lte=1, then=Cast('weight', FloatField())),
+    When(reps__lt=37, then=Cast('weight', FloatField()) * 36 / (37 - F('reps'))),
+    default=None,
+    output_field=FloatField(),
+)
+
+
+# Volume of a WorkoutSet row, a counted row standing for ``count`` identical sets
+REPS = Sum(F('count') * F('reps'))
+VOLUME = Sum(
+    F('count') * F('reps') * F('weight'),
+    output_field=DecimalField(max_digits=14, decimal_places=2),
+)
+
+
+def week_start(date):
+    """Monday of the ISO week ``date`` falls in: the key of its WeeklyVolume row."""
+    return date - datetime.timedelta(days=date.weekday())
+
+
+def month_start(date):
+    return date.replace(day=1)
+
+
+def _add_volume(model, key, sets, reps, volume):
+    """
+    Add a delta to one rollup row, creating it on first use. A row whose
+    sets are all deleted stays at zero (readers skip it), so a write is one
+    UPDATE per table; the next rebuild drops it.
+    """
+    rows = model.objects.filter(**key)
+    if rows.update(sets=F('sets') + sets, reps=F('reps') + reps, volume=F('volume') + volume) or sets <= 0:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, sets=sets, reps=reps, volume=volume)
+    except IntegrityError:
+        # Created concurrently
+        rows.update(sets=F('sets') + sets, reps=F('reps') + reps, volume=F('volume') + volume)
+
+
+def apply_volume_delta(user, exercise_id, date, sets, reps, volume):
+    """
+    Add ``sets`` sets of ``reps`` reps and ``volume`` kg in total (negative
+    when sets were removed) on ``date`` to ``user``'s weekly and monthly
+    volume rollups. Call it in the transaction that writes the sets, so
+    the rollups commit or roll back with them.
+    """
+    _add_volume(WeeklyVolume, {'user': user, 'exercise_id': exercise_id, 'week': week_start(date)}, sets, reps, volume)
+    _add_volume(MonthlyVolume, {'user': user, 'month': month_start(date)}, sets, reps, volume)
+
+
+def volume_of(workout_sets):
+    """(sets, reps, volume) of WorkoutSet rows, counting each row ``count`` times."""
+    sets = reps = volume = 0
+    for ws in workout_sets:
+        sets += ws.count
+        reps += ws.count * ws.reps
+        # Freshly parsed rows still hold the weight as a float
+        volume += ws.count * ws.reps * Decimal(str(ws.weight))
+    return sets, reps, volume
+
+
+def _volume_rollups(user, rows):
+    """WeeklyVolume and MonthlyVolume rows from per-day (date, exercise_id, sets, reps, volume) totals."""
+    weeks, months = {}, {}
+    for date, exercise_id, sets, reps, volume in rows:
+        for totals, key in ((weeks, (week_start(date), exercise_id)), (months, month_start(date))):
+            total = totals.setdefault(key, [0, 0, 0])
+            total[0] += sets
+            total[1] += reps
+            total[2] += volume
+    return (
+        [WeeklyVolume(user=user, exercise_id=exercise_id, week=week, sets=sets, reps=reps, volume=volume)
+         for (week, exercise_id), (sets, reps, volume) in weeks.items()],
+        [MonthlyVolume(user=user, month=month, sets=sets, reps=reps, volume=volume)
+         for month, (sets, reps, volume) in months.items()],
+    )
+
+
+def _write_volume(user, weekly, monthly):
+    """Replace all of ``user``'s volume rollups with ``weekly`` and ``monthly``."""
+    with transaction.atomic():
+        WeeklyVolume.objects.filter(user=user).delete()
+        MonthlyVolume.objects.filter(user=user).delete()
+        WeeklyVolume.objects.bulk_create(weekly, batch_size=1000)
+        MonthlyVolume.objects.bulk_create(monthly, batch_size=1000)
+
+
+def volume_from_sets(user):
+    """
+    ``user``'s volume rollups as the sets say they should be: unsaved
+    (WeeklyVolume list, MonthlyVolume list), for verification.
+    """
+    return _volume_rollups(user, (
+        WorkoutSet.objects.filter(workout__user=user)
+        .values_list('workout__date', 'exercise_id')
+        .annotate(n=Sum('count'), total_reps=REPS, total_volume=VOLUME)
+        .order_by()
+        .iterator(chunk_size=2000)
+    ))
+
+
+def rebuild_volume_rollups(user):
+    """Recompute all of ``user``'s volume rollups from their sets."""
+    _write_volume(user, *volume_from_sets(user))
+
+
+def _write_progress(user, dates, bests):
+    """
+    Bring ``user``'s ExerciseProgress rows on ``dates`` (None: all days) in
+    line with ``bests``, writing only the rows that changed.
+    """
+    progress = ExerciseProgress.objects.filter(user=user)
+    if dates is not None:
+        progress = progress.filter(date__in=dates)
+    stale, unchanged = [], set()
+    for pk, date, exercise_id, epley, brzycki in (
+        progress.values_list('pk', 'date', 'exercise_id', 'epley', 'brzycki').iterator(chunk_size=2000)
+    ):
+        best = bests.get((date, exercise_id))
+        if best is None:
+            stale.append(pk)
+        elif best == (epley, brzycki):
+            unchanged.add((date, exercise_id))
+    for i in range(0, len(stale), 1000):
+        ExerciseProgress.objects.filter(pk__in=stale[i:i + 1000]).delete()
+    changed = [
+        ExerciseProgress(user=user, exercise_id=exercise_id, date=date, epley=epley, brzycki=brzycki)
+        for (date, exercise_id), (epley, brzycki) in bests.items()
+        if (date, exercise_id) not in unchanged
+    ]
+    if changed:
+        ExerciseProgress.objects.bulk_create(
+            changed,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['user', 'exercise', 'date'],
+            update_fields=['epley', 'brzycki'],
+        )
+
+
+def refresh_day_summaries(user, dates=None, progress=True):
+    """
+    Recompute the DaySummary rows of ``user`` for ``dates`` (an iterable of
+    dates, or None for every day) from workouts, sets and current PRs.
+    Days with neither a workout nor a PR lose their row.
+
+    Unless ``progress`` is False (the sets didn't change), the same set
+    query also refreshes the days' ExerciseProgress rows: each exercise's
+    best estimated 1RM per day (EPLEY_X30, BRZYCKI). A refresh of every
+    day rebuilds the volume rollups from it as well, for the write paths
+    (imports, rebuilds) that don't keep them current by deltas.
+
+    Every set, PR and workout write path ends here, so this also bumps the
+    user's data version, retiring their cached page fragments.
+    """
+    workouts = Workout.objects.filter(user=user)
+    sets = WorkoutSet.objects.filter(workout__user=user)
+    prs = PersonalRecord.objects.filter(user=user, is_current=True)
+    summaries = DaySummary.objects.filter(user=user)
+    if dates is not None:
+        dates = set(dates)
+        if not dates:
+            return
+        workouts = workouts.filter(date__in=dates)
+        sets = sets.filter(workout__date__in=dates)
+        prs = prs.filter(date__in=dates)
+        summaries = summaries.filter(date__in=dates)
+
+    days = {}
+
+    def day(date):
+        if date not in days:
+            days[date] = DaySummary(user=user, date=date, exercise_ids=[], pr_exercise_ids=[])
+        return days[date]
 
-    # 6. Bulk create all PR records
-    PersonalRecord.objects.bulk_create(new_prs)
+    for date in workouts.values_list('date', flat=True):
+        day(date).has_workout = True
+    bests = {}
+    volumes = []
+    for date, exercise_id, n, reps, volume, epley_x30, brzycki in (
+        sets.values_list('workout__date', 'exercise_id')
+        .annotate(n=Sum('count'), total_reps=REPS, total_volume=VOLUME, epley_x30=Max(EPLEY_X30), brzycki=Max(BRZYCKI))
+        .order_by('workout__date', 'exercise_id')
+        .iterator(chunk_size=2000)
+    ):
+        summary = day(date)
+        summary.set_count += n
+        summary.exercise_ids.append(exercise_id)
+        bests[(date, exercise_id)] = (
+            (epley_x30 / 30).quantize(CENT),
+            Decimal(brzycki).quantize(CENT) if brzycki is not None else None,
+        )
+        if dates is None:
+            volumes.append((date, exercise_id, n, reps, volume))
+    for date, exercise_id in prs.values_list('date', 'exercise_id').distinct().order_by('date', 'exercise_id'):
+        summary = day(date)
+        summary.has_pr = True
+        summary.pr_exercise_ids.append(exercise_id)
 
-    # 7. Return only the current PRs (for toast notifications)
-    return [pr for pr in new_prs if pr.is_current]
\ No newline at end of file
+    if dates is None or dates - days.keys():
+        summaries.exclude(date__in=days.keys()).delete()
+    if days:
+        DaySummary.objects.bulk_create(
+            days.values(),
+            update_conflicts=True,
+            unique_fields=['user', 'date'],
+            update_fields=['has_workout', 'has_pr', 'set_count', 'exercise_ids', 'pr_exercise_ids'],
+        )
+    if progress:
+        _write_progress(user, dates, bests)
+    if dates is None:
+        _write_volume(user, *_volume_rollups(user, volumes))
+    bump_data_version(user.pk)
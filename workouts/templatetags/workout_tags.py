@@ -1,4 +1,7 @@
 from django import template
+from django.core.cache import cache
+
+from ..fragments import FRAGMENT_TIMEOUT, data_version, fragment_key, record_fragment
 
 register = template.Library()
 
@@ -8,4 +11,54 @@ def pad2(value):
     try:
         return f"{int(value):02d}"
     except (ValueError, TypeError):
-        return value
\ No newline at end of file
+        return value
+
+@register.filter
+def media_src(media, field='file'):
+    """URL of a media record's derivative (e.g. 'thumbnail'), falling back to the original."""
+    f = getattr(media, field, None) or media.file
+    return f'/media/{f.name}'
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        request = context['request']
+        user_id = request.user.pk
+        # One data-version read per request, however many fragments the page has
+        if not hasattr(request, '_data_version'):
+            request._data_version = data_version(user_id)
+        key = fragment_key(
+            user_id, request._data_version, self.name,
+            [var.resolve(context) for var in self.vary_on],
+        )
+        html = cache.get(key)
+        record_fragment(self.name, hit=html is not None)
+        if html is None:
+            html = self.nodelist.render(context)
+            cache.set(key, html, FRAGMENT_TIMEOUT)
+        return html
+
+
+@register.tag
+def fragment_cache(parser, token):
+    """
+    Cache a block of a logged-in user's page under their data version:
+
+        {% fragment_cache "history" cursor %} ... {% endfragment_cache %}
+
+    The first argument names the fragment (for hit/miss stats); the rest
+    are variables it varies on. Any workout, set, PR or media write by the
+    user — or an exercise catalog change — retires the cached copy.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name.")
+    name = bits[1].strip('"\'')
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    return FragmentCacheNode(nodelist, name, [parser.compile_filter(bit) for bit in bits[2:]])
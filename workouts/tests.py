@@ -1,3 +1,2081 @@
-from django.test import TestCase
+import datetime
+import functools
+import gzip
+import importlib
+import json
+import os
+import random
+import time
+import shutil
+import tempfile
+import tracemalloc
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase as DjangoTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from mysite import metrics
+from mysite.middleware import RequestMetricsMiddleware
+from django.test.utils import CaptureQueriesContext
+
+from .models import (
+    DataVersion, DaySummary, Exercise, ExerciseMedia, ExerciseProgress, MonthlyVolume, PersonalRecord, PRFrontier,
+    PRRecalcJob, WeeklyVolume, Workout, WorkoutMedia, WorkoutSet,
+)
+from . import exporter, media, services, views
+from .catalog import exercise_catalog, get_exercise
+from .downsample import lttb
+from .fragments import data_version, fragment_stats
+from .importer import import_workout_history
+from .services import enqueue_pr_recalc, process_pr_jobs, rebuild_all_prs, recalculate_prs, refresh_day_summaries
+
+
+class TestCase(DjangoTestCase):
+    """Each test starts with an empty cache; cached catalogs would otherwise outlive rolled-back rows."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+def pr_snapshot(user, exercise):
+    """Comparable view of a user's auto PRs for one exercise."""
+    return sorted(
+        PersonalRecord.objects.filter(
+            user=user, exercise=exercise, is_manual=False,
+        ).values_list(
+            'pr_type', 'reps', 'weight', 'sets', 'date',
+            'previous_value', 'previous_date', 'is_current',
+        )
+    )
+
+
+class PRHistoryMixin:
+    """One user + exercise with helpers to log random training days."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.exercise = Exercise.objects.create(name='Bench Press')
+        self.rng = random.Random(42)
+        self.start = datetime.date(2024, 1, 1)
+
+    def add_day(self, date, count=None):
+        workout, _ = Workout.objects.get_or_create(user=self.user, date=date)
+        first = workout.sets.count() + 1
+        for n in range(count or self.rng.randint(1, 6)):
+            WorkoutSet.objects.create(
+                workout=workout,
+                exercise=self.exercise,
+                set_number=first + n,
+                reps=self.rng.choice([3, 5, 8, 10]),
+                weight=Decimal(self.rng.choice([60, 62.5, 65, 70, 72.5, 80])),
+            )
+        return workout
+
+    def full_rebuild_snapshot(self):
+        recalculate_prs(self.user, self.exercise)
+        return pr_snapshot(self.user, self.exercise)
+
+
+class IncrementalPRTests(PRHistoryMixin, TestCase):
+
+    def test_incremental_append_matches_full_rebuild(self):
+        for day in range(0, 60, 3):
+            date = self.start + datetime.timedelta(days=day)
+            self.add_day(date)
+            recalculate_prs(self.user, self.exercise, since=date)
+            incremental = pr_snapshot(self.user, self.exercise)
+            self.assertEqual(incremental, self.full_rebuild_snapshot())
+
+    def test_incremental_backdated_edits_match_full_rebuild(self):
+        for day in range(0, 90, 2):
+            self.add_day(self.start + datetime.timedelta(days=day))
+        recalculate_prs(self.user, self.exercise)
+
+        for _ in range(25):
+            ws = self.rng.choice(list(WorkoutSet.objects.select_related('workout')))
+            date = ws.workout.date
+            if self.rng.random() < 0.5:
+                ws.delete()
+            else:
+                self.add_day(date, count=2)
+            recalculate_prs(self.user, self.exercise, since=date)
+            incremental = pr_snapshot(self.user, self.exercise)
+            self.assertEqual(incremental, self.full_rebuild_snapshot())
+
+    def test_unchanged_rows_are_not_rewritten(self):
+        for day in range(10):
+            self.add_day(self.start + datetime.timedelta(days=day))
+        recalculate_prs(self.user, self.exercise)
+        before = set(PersonalRecord.objects.values_list('pk', flat=True))
+
+        recalculate_prs(self.user, self.exercise, since=self.start)
+        self.assertEqual(set(PersonalRecord.objects.values_list('pk', flat=True)), before)
+
+    def test_manual_prs_are_untouched(self):
+        self.add_day(self.start)
+        manual = PersonalRecord.objects.create(
+            user=self.user, exercise=self.exercise, pr_type='weight',
+            reps=1, weight=Decimal('200'), date=self.start, is_manual=True,
+        )
+        recalculate_prs(self.user, self.exercise, since=self.start)
+        self.assertTrue(PersonalRecord.objects.filter(pk=manual.pk, is_current=True).exists())
+
+
+class PRFrontierTests(PRHistoryMixin, TestCase):
+    """Appends to the latest workout are checked against the stored frontier."""
+
+    def append_queries(self, history_days):
+        for day in range(history_days):
+            self.add_day(self.start + datetime.timedelta(days=day))
+        recalculate_prs(self.user, self.exercise)
+        latest = self.start + datetime.timedelta(days=history_days - 1)
+        self.add_day(latest, count=2)
+        with CaptureQueriesContext(connection) as ctx:
+            recalculate_prs(self.user, self.exercise, since=latest)
+        self.assertEqual(pr_snapshot(self.user, self.exercise), self.full_rebuild_snapshot())
+        return [q['sql'] for q in ctx.captured_queries]
+
+    def test_append_cost_does_not_grow_with_history(self):
+        short = self.append_queries(5)
+        WorkoutSet.objects.all().delete()
+        Workout.objects.all().delete()
+        PersonalRecord.objects.all().delete()
+        PRFrontier.objects.all().delete()
+        long = self.append_queries(120)
+        self.assertEqual(len(short), len(long))
+
+    def test_frontier_tracks_latest_day(self):
+        for day in range(5):
+            self.add_day(self.start + datetime.timedelta(days=day))
+        recalculate_prs(self.user, self.exercise)
+        frontier = PRFrontier.objects.get(user=self.user, exercise=self.exercise)
+        self.assertEqual(frontier.through_date, self.start + datetime.timedelta(days=4))
+
+        Workout.objects.filter(date=frontier.through_date).delete()
+        recalculate_prs(self.user, self.exercise, since=frontier.through_date)
+        self.assertFalse(PRFrontier.objects.exists())
+        self.assertEqual(pr_snapshot(self.user, self.exercise), self.full_rebuild_snapshot())
+
+
+class RebuildAllPRsTests(TestCase):
+    """rebuild_all_prs() must leave exactly what per-exercise recalculate_prs() leaves."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.exercises = [Exercise.objects.create(name=f'Lift {n}') for n in range(5)]
+
+    def log_random_history(self, seed, days=60):
+        rng = random.Random(seed)
+        start = datetime.date(2024, 1, 1)
+        sets = []
+        for day in sorted(rng.sample(range(days * 2), days)):
+            workout = Workout.objects.create(user=self.user, date=start + datetime.timedelta(days=day))
+            for exercise in rng.sample(self.exercises, rng.randint(1, 4)):
+                for n in range(1, rng.randint(2, 7)):
+                    sets.append(WorkoutSet(
+                        workout=workout, exercise=exercise, set_number=n,
+                        reps=rng.choice([1, 3, 5, 5, 8, 10]),
+                        weight=Decimal(rng.choice(['60', '62.5', '65', '70', '72.5', '80', '100.25'])),
+                    ))
+        WorkoutSet.objects.bulk_create(sets)
+
+    def snapshot(self):
+        def state(data):
+            return {kind: sorted(rows) for kind, rows in data.items()}
+        return (
+            {ex.pk: pr_snapshot(self.user, ex) for ex in self.exercises},
+            sorted(
+                (f.exercise_id, f.through_date, state(f.state_before), state(f.state))
+                for f in PRFrontier.objects.filter(user=self.user)
+            ),
+            list(DaySummary.objects.filter(user=self.user).values_list('date', 'has_pr', 'pr_exercise_ids')),
+        )
+
+    def test_matches_per_exercise_recalculation(self):
+        for seed in range(3):
+            with self.subTest(seed=seed):
+                Workout.objects.filter(user=self.user).delete()
+                self.log_random_history(seed, days=40)
+                for exercise in self.exercises:
+                    recalculate_prs(self.user, exercise)
+                refresh_day_summaries(self.user)
+                expected = self.snapshot()
+                self.assertTrue(expected[0][self.exercises[0].pk])
+
+                PersonalRecord.objects.filter(user=self.user).update(is_current=False, previous_value=None)
+                PRFrontier.objects.filter(user=self.user).delete()
+                rebuild_all_prs(self.user)
+                self.assertEqual(self.snapshot(), expected)
+
+    def test_one_read_and_bulk_writes(self):
+        self.log_random_history(7)
+        with CaptureQueriesContext(connection) as ctx:
+            created = rebuild_all_prs(self.user)
+        self.assertEqual(created['total'], PersonalRecord.objects.filter(user=self.user).count())
+        reads = [q['sql'] for q in ctx.captured_queries if 'FROM "workouts_workoutset"' in q['sql']]
+        # The set read, plus the day-summary refresh's own grouped query
+        self.assertEqual(len(reads), 2)
+        # No per-exercise or per-row queries: the PR inserts are only split
+        # by the backend's bulk batch size
+        inserts = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('INSERT INTO "workouts_personalrecord"')
+        ]
+        batch = connection.ops.bulk_batch_size([f for f in PersonalRecord._meta.concrete_fields if not f.primary_key], [])
+        self.assertEqual(len(inserts), -(-created['total'] // min(batch, 1000)))
+
+    def test_keeps_manual_prs_and_drops_orphans(self):
+        self.log_random_history(3, days=10)
+        manual = PersonalRecord.objects.create(
+            user=self.user, exercise=self.exercises[0], pr_type='weight', reps=1,
+            weight=Decimal('200'), sets=1, date=datetime.date(2024, 1, 5), is_manual=True,
+        )
+        unused = Exercise.objects.create(name='Unused')
+        PersonalRecord.objects.create(
+            user=self.user, exercise=unused, pr_type='weight', reps=1,
+            weight=Decimal('50'), sets=1, date=datetime.date(2024, 1, 5),
+        )
+        rebuild_all_prs(self.user)
+        self.assertTrue(PersonalRecord.objects.filter(pk=manual.pk).exists())
+        self.assertFalse(PersonalRecord.objects.filter(exercise=unused).exists())
+
+    def test_frontier_supports_incremental_recalculation(self):
+        self.log_random_history(11)
+        rebuild_all_prs(self.user)
+        last = Workout.objects.filter(user=self.user).order_by('-date').first()
+        exercise = self.exercises[0]
+        WorkoutSet.objects.create(workout=last, exercise=exercise, set_number=50, reps=5, weight=Decimal('90'))
+        recalculate_prs(self.user, exercise, since=last.date)
+        incremental = pr_snapshot(self.user, exercise)
+        recalculate_prs(self.user, exercise)
+        self.assertEqual(pr_snapshot(self.user, exercise), incremental)
+
+
+class RebuildPRsCommandTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.bench = Exercise.objects.create(name='Bench Press')
+        self.users = [User.objects.create_user(f'lifter{n}') for n in range(3)]
+        for n, user in enumerate(self.users):
+            workout = Workout.objects.create(user=user, date=datetime.date(2024, 1, 1))
+            WorkoutSet.objects.create(workout=workout, exercise=self.bench, set_number=1, reps=5, weight=60 + n)
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'checkpoint')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.checkpoint))
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('rebuild_prs', '--checkpoint', self.checkpoint, '--chunk-size', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_counts_without_writing(self):
+        out = self.run_command('--dry-run')
+        self.assertIn('Dry run. Checked 3 users', out)
+        self.assertIn('3 users would change, 9 created, 0 updated, 0 deleted', out)
+        self.assertFalse(PersonalRecord.objects.exists())
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_rebuild_then_nothing_left_to_change(self):
+        out = self.run_command()
+        self.assertIn('Done. 3 users', out)
+        self.assertIn('users/s', out)
+        self.assertEqual(PersonalRecord.objects.filter(is_current=True).count(), 9)
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertIn('0 users would change, 0 created, 0 updated, 0 deleted', self.run_command('--dry-run'))
+        WorkoutSet.objects.filter(workout__user=self.users[0]).update(weight=80)
+        self.assertIn('1 users would change, 3 created, 0 updated, 3 deleted', self.run_command('--dry-run'))
+
+    def test_resumes_from_checkpoint(self):
+        with open(self.checkpoint, 'w') as f:
+            f.write(f'{self.users[0].pk}\n')
+        out = self.run_command()
+        self.assertIn('Resuming: 1 users already rebuilt.', out)
+        self.assertFalse(PersonalRecord.objects.filter(user=self.users[0]).exists())
+        self.assertTrue(PersonalRecord.objects.filter(user=self.users[1]).exists())
+
+        with open(self.checkpoint, 'w') as f:
+            f.write(f'{self.users[0].pk}\n')
+        self.run_command('--restart')
+        self.assertTrue(PersonalRecord.objects.filter(user=self.users[0]).exists())
+
+    def test_interrupted_run_checkpoints_finished_users(self):
+        real = rebuild_all_prs
+        calls = []
+
+        def flaky(user, dry_run=False):
+            calls.append(user.pk)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return real(user, dry_run=dry_run)
+
+        with mock.patch('workouts.management.commands.rebuild_prs.rebuild_all_prs', flaky):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_command()
+        with open(self.checkpoint) as f:
+            self.assertEqual(f.read(), f'{self.users[0].pk}\n')
+
+    def test_admin_action(self):
+        admin = User.objects.create_superuser('admin', password='pw')
+        self.client.force_login(admin)
+        with override_settings(STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        }):
+            response = self.client.post('/admin/auth/user/', {
+                'action': 'rebuild_prs', '_selected_action': [self.users[1].pk],
+            }, follow=True)
+        self.assertContains(response, 'Rebuilt PRs for 1 users: 3 created')
+        self.assertEqual(set(PersonalRecord.objects.values_list('user', flat=True)), {self.users[1].pk})
+
+
+class ImportHistoryTests(TestCase):
+    CSV = (
+        'date,exercise,reps,weight,set_number\n'
+        '2024-01-01,bench press,5,60,\n'
+        '2024-01-01,Bench Press,5,60,\n'
+        '2024-01-03,Bench Press,5,62.5,1\n'
+        '2024-01-03,Cable Fly,12,15,\n'
+        '2024-01-05,Bench Press,3,65,\n'
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.bench = Exercise.objects.create(name='Bench Press')
+        self.user = User.objects.create_user('importer', password='pw')
+        self.path = os.path.join(tempfile.mkdtemp(), 'history.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.path))
+
+    def import_csv(self, text, *args):
+        with open(self.path, 'w') as f:
+            f.write(text)
+        out, err = StringIO(), StringIO()
+        call_command('import_history', self.path, '--user', 'importer', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    @override_settings(COMPACT_SETS=True)
+    def test_imports_sets_workouts_exercises_and_prs(self):
+        # An existing set on an imported day: numbering continues after it
+        workout = Workout.objects.create(user=self.user, date=datetime.date(2024, 1, 1))
+        WorkoutSet.objects.create(workout=workout, exercise=self.bench, set_number=1, reps=8, weight=50)
+
+        out, err = self.import_csv(self.CSV)
+        self.assertIn('5 rows read: 5 sets in 2 new workouts, 1 new exercises', out)
+        self.assertEqual(err, '')
+
+        fly = Exercise.objects.get(user=self.user, name='Cable Fly')
+        self.assertEqual(
+            list(WorkoutSet.objects.filter(workout=workout).values_list('set_number', 'count', 'reps', 'weight')),
+            [(1, 1, 8, Decimal('50.00')), (2, 2, 5, Decimal('60.00'))],
+        )
+        self.assertEqual(WorkoutSet.objects.filter(workout__user=self.user, exercise=fly).count(), 1)
+
+        imported = set(PersonalRecord.objects.filter(user=self.user).values_list(
+            'exercise_id', 'pr_type', 'reps', 'weight', 'sets', 'date', 'is_current'))
+        rebuild_all_prs(self.user)
+        self.assertEqual(imported, set(PersonalRecord.objects.filter(user=self.user).values_list(
+            'exercise_id', 'pr_type', 'reps', 'weight', 'sets', 'date', 'is_current')))
+        self.assertEqual(
+            DaySummary.objects.get(user=self.user, date=datetime.date(2024, 1, 3)).set_count, 2,
+        )
+
+    @override_settings(COMPACT_SETS=True)
+    def test_chunks_share_one_pr_rebuild(self):
+        with mock.patch('workouts.importer.rebuild_all_prs', wraps=rebuild_all_prs) as rebuild:
+            out, _ = self.import_csv(self.CSV, '--chunk-size', '2')
+        self.assertIn('5 sets', out)
+        rebuild.assert_called_once_with(self.user)
+        self.assertEqual(
+            list(WorkoutSet.objects.filter(workout__date=datetime.date(2024, 1, 1)).values_list('set_number', 'count')),
+            [(1, 2)],
+        )
+
+    @override_settings(PR_RECALC_DEFERRED=True)
+    def test_deferred_queues_a_job_per_exercise(self):
+        self.import_csv(self.CSV)
+        self.assertEqual(
+            sorted(PRRecalcJob.objects.values_list('exercise__name', 'since')),
+            [('Bench Press', datetime.date(2024, 1, 1)), ('Cable Fly', datetime.date(2024, 1, 3))],
+        )
+        self.assertFalse(PersonalRecord.objects.exists())
+        self.assertEqual(DaySummary.objects.filter(user=self.user, has_workout=True).count(), 3)
+
+    def test_bad_rows_are_skipped_and_reported(self):
+        out, err = self.import_csv(
+            'date,exercise,reps,weight\n'
+            '2024-01-01,Bench Press,5,60\n'
+            '01/02/2024,Bench Press,5,60\n'
+            '2024-01-03,,5,60\n'
+            '2024-01-04,Bench Press,0,60\n'
+            '2024-01-05,Bench Press,5,heavy\n'
+        )
+        self.assertIn('5 rows read: 1 sets', out)
+        self.assertIn('4 rows skipped', out)
+        self.assertIn('Line 3: Invalid date', err)
+        self.assertIn('Line 4: Missing exercise name.', err)
+        self.assertIn('Line 5: Reps must be at least 1.', err)
+        self.assertIn('Line 6: Invalid weight', err)
+
+    def test_names_match_ignoring_case_and_spacing(self):
+        out, _ = self.import_csv(
+            'date,exercise,reps,weight\n'
+            '2024-01-01,bench  press,5,60\n'
+            '2024-01-01,Cable Fly,12,15\n'
+            '2024-01-02, cable   FLY ,12,15\n'
+        )
+        self.assertIn('1 new exercises', out)
+        self.assertEqual(
+            sorted(WorkoutSet.objects.values_list('exercise__name', flat=True)),
+            ['Bench Press', 'Cable Fly', 'Cable Fly'],
+        )
+
+    def test_decode_error_part_way_still_rebuilds_committed_chunks(self):
+        good = 'date,exercise,reps,weight\n2024-01-01,Bench Press,5,60\n2024-01-02,Bench Press,5,70\n'
+        with open(self.path, 'wb') as f:
+            f.write(good.encode() + b'x' * 10000 + b'\n2024-01-03,Bench Press,5,\xff\n')
+        with self.assertRaisesMessage(CommandError, 'not UTF-8'):
+            call_command('import_history', self.path, '--user', 'importer', '--chunk-size', '2',
+                         stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(WorkoutSet.objects.filter(workout__user=self.user).count(), 2)
+        self.assertEqual(
+            PersonalRecord.objects.get(user=self.user, pr_type='weight', is_current=True).weight, Decimal('70'),
+        )
+        self.assertEqual(DaySummary.objects.filter(user=self.user, has_workout=True).count(), 2)
+
+        self.client.login(username='importer', password='pw')
+        body = b'{"date": "2024-02-01", "exercise": "Bench Press", "reps": 5, "weight": 80}\n' * 2 + b'\xff' * 10000
+        with mock.patch('workouts.views.import_workout_history',
+                        functools.partial(import_workout_history, chunk_size=1)):
+            response = self.client.post('/api/import-history/', {
+                'file': SimpleUploadedFile('history.ndjson', body, content_type='application/x-ndjson'),
+            })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            PersonalRecord.objects.get(user=self.user, pr_type='weight', is_current=True).weight, Decimal('80'),
+        )
+
+    def test_upload_endpoint_streams_ndjson(self):
+        self.client.login(username='importer', password='pw')
+        body = b'\n'.join([
+            b'{"date": "2024-02-01", "exercise": "Bench Press", "reps": 5, "weight": 70}',
+            b'',
+            b'{"date": "2024-02-01", "exercise": "Bench Press", "reps": 5, "weight": 70, "set_number": 2}',
+            b'[1, 2]',
+        ])
+        response = self.client.post('/api/import-history/', {
+            'file': SimpleUploadedFile('history.ndjson', body, content_type='application/x-ndjson'),
+        })
+        data = response.json()
+        self.assertEqual(data['status'], 'ok')
+        self.assertEqual((data['rows'], data['sets_created'], data['error_count']), (3, 2, 1))
+        self.assertEqual(data['errors'], ['Line 4: Not a JSON object.'])
+        self.assertTrue(PersonalRecord.objects.filter(user=self.user, weight=70, sets=2).exists())
+
+        response = self.client.post('/api/import-history/', {
+            'file': SimpleUploadedFile('history.xlsx', b'data'),
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportHistoryTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.bench = Exercise.objects.create(name='Bench Press')
+        self.user = User.objects.create_user('exporter', password='pw')
+        for day, weight in [(1, '60'), (3, '62.5')]:
+            workout = Workout.objects.create(user=self.user, date=datetime.date(2024, 1, day))
+            for n in (1, 2):
+                WorkoutSet.objects.create(workout=workout, exercise=self.bench, set_number=n, reps=5, weight=Decimal(weight))
+        rebuild_all_prs(self.user)
+        self.client.login(username='exporter', password='pw')
+
+    def download(self, **params):
+        response = self.client.get('/api/export-history/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_export_streams_and_imports_back(self):
+        response, body = self.download()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('exporter-sets.csv', response['Content-Disposition'])
+        self.assertEqual(body.decode().splitlines(), [
+            'date,exercise,set_number,reps,weight',
+            '2024-01-01,Bench Press,1,5,60.00',
+            '2024-01-01,Bench Press,2,5,60.00',
+            '2024-01-03,Bench Press,1,5,62.50',
+            '2024-01-03,Bench Press,2,5,62.50',
+        ])
+
+        other = User.objects.create_user('restored')
+        summary = import_workout_history(other, StringIO(body.decode()), 'csv')
+        self.assertEqual(summary['sets_created'], 4)
+
+        def prs(user):
+            return set(PersonalRecord.objects.filter(user=user).values_list(
+                'exercise_id', 'pr_type', 'reps', 'weight', 'sets', 'date', 'is_current'))
+        self.assertEqual(prs(other), prs(self.user))
+
+    def test_gzipped_ndjson_prs(self):
+        response, body = self.download(data='prs', format='ndjson', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('exporter-prs.ndjson.gz', response['Content-Disposition'])
+        rows = [json.loads(line) for line in gzip.decompress(body).decode().splitlines()]
+        self.assertEqual(len(rows), PersonalRecord.objects.filter(user=self.user).count())
+        self.assertIn({
+            'date': '2024-01-03', 'exercise': 'Bench Press', 'pr_type': 'weight', 'reps': 5,
+            'weight': '62.50', 'sets': 1, 'previous_value': '60.00', 'previous_date': '2024-01-01',
+            'is_current': True, 'is_manual': False,
+        }, rows)
+
+    def test_only_own_rows_and_invalid_params(self):
+        stranger = User.objects.create_user('stranger')
+        workout = Workout.objects.create(user=stranger, date=datetime.date(2024, 1, 2))
+        WorkoutSet.objects.create(workout=workout, exercise=self.bench, set_number=1, reps=1, weight=200)
+        _, body = self.download()
+        self.assertNotIn(b'200', body)
+        self.assertEqual(self.client.get('/api/export-history/', {'format': 'xml'}).status_code, 400)
+
+    def test_command_writes_gzip_file(self):
+        path = os.path.join(tempfile.mkdtemp(), 'sets.csv.gz')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        out = StringIO()
+        call_command('export_history', '--user', 'exporter', '--gzip', '-o', path, stdout=out)
+        self.assertIn(f'to {path}', out.getvalue())
+        with gzip.open(path, 'rt') as f:
+            self.assertEqual(len(f.read().splitlines()), 5)
+
+
+@override_settings(COMPACT_SETS=True)
+class CompactSetTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.client.force_login(self.user)
+        self.bench = Exercise.objects.create(name='Bench Press')
+
+    def add_sets(self, text, date='2024-03-01'):
+        response = self.client.post('/api/add-sets/', json.dumps({
+            'workout_date': date, 'exercise_id': self.bench.pk, 'sets_text': text,
+        }), content_type='application/json')
+        return response.json()
+
+    def set_prs(self):
+        return set(PersonalRecord.objects.filter(user=self.user).values_list(
+            'pr_type', 'reps', 'weight', 'sets', 'date', 'is_current'))
+
+    def test_entry_is_stored_as_counted_rows(self):
+        data = self.add_sets('5x5x100, 1x3x100')
+        self.assertEqual(
+            [(s['set_number'], s['count'], s['reps']) for s in data['sets']], [(1, 5, 5), (6, 1, 3)],
+        )
+        self.assertEqual(WorkoutSet.objects.count(), 2)
+        self.assertTrue(PersonalRecord.objects.filter(pr_type='sets', reps=5, sets=5).exists())
+        self.assertEqual(DaySummary.objects.get(user=self.user).set_count, 6)
+
+        response = self.client.get('/workout/2024-03-01/')
+        self.assertEqual(response.context['grouped_sets'][0]['compact'], '5x5x100, 1x3x100')
+        self.assertContains(response, 'Sets 1–5: 5 reps @ 100.00kg')
+        history = self.client.get('/api/history/').json()['workouts'][0]
+        self.assertEqual(history['set_count'], 6)
+
+    def test_prs_match_expanded_rows(self):
+        self.add_sets('3x5x100, 2x8x80', date='2024-03-01')
+        self.add_sets('4x5x100, 1x8x85', date='2024-03-03')
+        compact = self.set_prs()
+        self.assertEqual(rebuild_all_prs(self.user, dry_run=True)['total'], len(compact))
+
+        with override_settings(COMPACT_SETS=False):
+            Workout.objects.all().delete()
+            self.add_sets('3x5x100, 2x8x80', date='2024-03-01')
+            self.add_sets('4x5x100, 1x8x85', date='2024-03-03')
+        self.assertEqual(WorkoutSet.objects.count(), 10)
+        self.assertEqual(self.set_prs(), compact)
+
+    def test_delete_removes_one_set_of_a_counted_row(self):
+        data = self.add_sets('5x5x100')
+        set_id = data['sets'][0]['id']
+        response = self.client.post('/api/delete-set/', json.dumps({'set_id': set_id}), content_type='application/json')
+        self.assertEqual(response.json(), {'status': 'ok', 'count': 4})
+        self.assertEqual(WorkoutSet.objects.get().count, 4)
+        self.assertTrue(PersonalRecord.objects.filter(pr_type='sets', sets=4, is_current=True).exists())
+        self.assertFalse(PersonalRecord.objects.filter(pr_type='sets', sets=5).exists())
+
+        response = self.client.post(
+            '/api/delete-set/', json.dumps({'set_id': set_id, 'all': True}), content_type='application/json',
+        )
+        self.assertEqual(response.json()['count'], 0)
+        self.assertFalse(Workout.objects.exists())
+
+    def test_migration_collapses_and_expands_runs(self):
+        migration = importlib.import_module('workouts.migrations.0011_workoutset_count')
+        squat = Exercise.objects.create(name='Squat')
+        workout = Workout.objects.create(user=self.user, date=datetime.date(2024, 3, 1))
+        rows = [
+            (self.bench, 1, 5, 100), (self.bench, 2, 5, 100), (self.bench, 3, 5, 100),
+            (self.bench, 4, 3, 100), (self.bench, 6, 3, 100), (squat, 1, 5, 100), (squat, 2, 5, 100),
+        ]
+        for exercise, set_number, reps, weight in rows:
+            WorkoutSet.objects.create(workout=workout, exercise=exercise, set_number=set_number, reps=reps, weight=weight)
+        expanded = set(WorkoutSet.objects.values_list('exercise_id', 'set_number', 'reps', 'weight'))
+
+        with override_settings(COMPACT_SETS=False):
+            migration.collapse_sets(apps, None)
+        self.assertEqual(set(WorkoutSet.objects.values_list('exercise_id', 'set_number', 'reps', 'weight')), expanded)
+        self.assertFalse(WorkoutSet.objects.filter(count__gt=1).exists())
+
+        migration.collapse_sets(apps, None)
+        self.assertEqual(
+            sorted(WorkoutSet.objects.values_list('exercise_id', 'set_number', 'count', 'reps')),
+            sorted([
+                (self.bench.pk, 1, 3, 5), (self.bench.pk, 4, 1, 3), (self.bench.pk, 6, 1, 3), (squat.pk, 1, 2, 5),
+            ]),
+        )
+
+        migration.expand_sets(apps, None)
+        self.assertFalse(WorkoutSet.objects.filter(count__gt=1).exists())
+        self.assertEqual(set(WorkoutSet.objects.values_list('exercise_id', 'set_number', 'reps', 'weight')), expanded)
+
+    def test_export_expands_counted_rows(self):
+        self.add_sets('3x5x100')
+        body = b''.join(self.client.get('/api/export-history/').streaming_content).decode()
+        self.assertEqual(body.splitlines()[1:], [
+            '2024-03-01,Bench Press,1,5,100.00',
+            '2024-03-01,Bench Press,2,5,100.00',
+            '2024-03-01,Bench Press,3,5,100.00',
+        ])
+
+
+@override_settings(PR_RECALC_DEFERRED=True)
+class DeferredPRTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.exercise = Exercise.objects.create(name='Squat')
+        self.client.force_login(self.user)
+
+    def add_sets(self, sets_text, date='2024-03-01'):
+        return self.client.post('/api/add-sets/', {
+            'exercise_id': self.exercise.pk,
+            'workout_date': date,
+            'sets_text': sets_text,
+        }, content_type='application/json').json()
+
+    def test_toasts_arrive_after_worker_runs(self):
+        data = self.add_sets('3x5x100')
+        self.assertTrue(data['prs_pending'])
+        self.assertFalse(PersonalRecord.objects.exists())
+
+        poll = self.client.get(data['prs_url']).json()
+        self.assertTrue(poll['pending'])
+        self.assertEqual(poll['prs'], [])
+
+        self.assertEqual(process_pr_jobs(), 1)
+        poll = self.client.get(data['prs_url']).json()
+        self.assertFalse(poll['pending'])
+        self.assertEqual(
+            sorted(pr['type'] for pr in poll['prs']),
+            ['Rep PR', 'Set PR', 'Weight PR'],
+        )
+
+    def test_jobs_coalesce_to_earliest_date(self):
+        self.add_sets('1x5x100', date='2024-03-05')
+        self.add_sets('1x5x90', date='2024-03-01')
+        self.add_sets('1x5x95', date='2024-03-03')
+        job = PRRecalcJob.objects.get()
+        self.assertEqual(job.since, datetime.date(2024, 3, 1))
+
+        process_pr_jobs()
+        self.assertFalse(PRRecalcJob.objects.exists())
+        self.assertEqual(
+            PersonalRecord.objects.filter(pr_type='weight', is_current=True).get().weight,
+            Decimal('100'),
+        )
+
+    def test_job_requeued_while_running_is_kept(self):
+        self.add_sets('1x5x100')
+        job = PRRecalcJob.objects.get()
+        enqueue_pr_recalc(self.user, self.exercise, datetime.date(2024, 2, 1))
+        PRRecalcJob.objects.filter(pk=job.pk, updated_at=job.updated_at).delete()
+        self.assertEqual(PRRecalcJob.objects.get().since, datetime.date(2024, 2, 1))
+
+    def test_enqueue_keeps_earliest_since_in_one_update(self):
+        self.add_sets('1x5x100', date='2024-03-01')
+        # The stored since moved earlier after the job was read: a later date never moves it back
+        PRRecalcJob.objects.update(since=datetime.date(2024, 2, 1))
+        enqueue_pr_recalc(self.user, self.exercise, datetime.date(2024, 3, 5))
+        self.assertEqual(PRRecalcJob.objects.get().since, datetime.date(2024, 2, 1))
+
+        # The worker deletes the job between our SELECT and UPDATE: a new job is queued
+        job = PRRecalcJob.objects.get()
+        PRRecalcJob.objects.all().delete()
+        real = PRRecalcJob.objects.get_or_create
+        stale = [(job, False)]
+
+        def get_or_create(**kwargs):
+            return stale.pop() if stale else real(**kwargs)
+
+        with mock.patch.object(PRRecalcJob.objects, 'get_or_create', get_or_create):
+            enqueue_pr_recalc(self.user, self.exercise, datetime.date(2024, 3, 5))
+        self.assertEqual(PRRecalcJob.objects.get().since, datetime.date(2024, 3, 5))
+
+    def test_failing_job_is_logged_and_kept(self):
+        self.add_sets('1x5x100')
+        other = Exercise.objects.create(name='Bench Press')
+        enqueue_pr_recalc(self.user, other, datetime.date(2024, 3, 1))
+        real = services.recalculate_prs
+
+        def recalculate(user, exercise, since=None):
+            if exercise == self.exercise:
+                raise RuntimeError('boom')
+            return real(user, exercise, since=since)
+
+        with mock.patch('workouts.services.recalculate_prs', recalculate), \
+                self.assertLogs('workouts.services', 'ERROR') as logs:
+            self.assertEqual(process_pr_jobs(), 1)
+        self.assertIn('boom', logs.output[0])
+        self.assertEqual(list(PRRecalcJob.objects.values_list('exercise', flat=True)), [self.exercise.pk])
+
+    def test_poll_rejects_malformed_ids(self):
+        after = timezone.now().isoformat()
+        for params in ({'workout_id': 'x'}, {'workout_id': '1', 'exercise_id': 'abc'}, {}):
+            response = self.client.get('/api/workout-prs/', {'after': after, **params})
+            self.assertEqual(response.status_code, 400, params)
+
+
+class FakeS3Body:
+    """Mimics botocore's StreamingBody, generating bytes on demand."""
+
+    def __init__(self, length):
+        self.length = length
+
+    def iter_chunks(self, chunk_size):
+        remaining = self.length
+        while remaining > 0:
+            n = min(chunk_size, remaining)
+            remaining -= n
+            yield b'x' * n
+
+    def close(self):
+        pass
+
+
+class FakeS3Object:
+
+    def __init__(self, size):
+        self.content_length = size
+        self.last_modified = timezone.now()
+
+    def load(self):
+        pass
+
+    def get(self, Range):
+        start, end = (int(n) for n in Range[len('bytes='):].split('-'))
+        return {'Body': FakeS3Body(end - start + 1)}
+
+
+class FakeS3Storage:
+    """Just enough of S3Storage for workouts.media to take its S3 path."""
+
+    def __init__(self, size):
+        self.bucket = mock.Mock()
+        self.bucket.Object.return_value = FakeS3Object(size)
+
+    def _normalize_name(self, name):
+        return name
+
+
+class TempMediaMixin:
+    """Point FileSystemStorage at a throwaway MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class ServeMediaTests(TempMediaMixin, TestCase):
+    SIZE = 16 * 1024 * 1024
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('viewer', password='pw')
+        self.client.force_login(self.user)
+        self.content = bytes(range(256)) * 1024
+        self.path = default_storage.save('workouts/clip.mp4', ContentFile(self.content))
+
+    def test_range_request_returns_partial_content(self):
+        response = self.client.get(f'/media/{self.path}', HTTP_RANGE='bytes=100-299')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-299/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:300])
+
+        response = self.client.get(f'/media/{self.path}', HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+
+        response = self.client.get(f'/media/{self.path}', HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_conditional_get_returns_not_modified(self):
+        response = self.client.get(f'/media/{self.path}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        response = self.client.get(f'/media/{self.path}', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_file_is_404(self):
+        self.assertEqual(self.client.get('/media/workouts/nope.mp4').status_code, 404)
+
+    def assert_streams_in_bounded_memory(self, path):
+        tracemalloc.start()
+        try:
+            response = self.client.get(f'/media/{path}')
+            streamed = sum(len(chunk) for chunk in response.streaming_content)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(streamed, self.SIZE)
+        self.assertLess(peak, 2 * 1024 * 1024)
+
+    def test_filesystem_storage_memory_is_bounded(self):
+        with default_storage.open('workouts/big.mov', 'wb') as f:
+            for _ in range(self.SIZE // len(self.content)):
+                f.write(self.content)
+        self.assert_streams_in_bounded_memory('workouts/big.mov')
+
+    def test_s3_storage_memory_is_bounded(self):
+        with mock.patch('workouts.views.default_storage', FakeS3Storage(self.SIZE)):
+            self.assert_streams_in_bounded_memory('workouts/big.mov')
+
+
+class MediaDerivativeTests(TempMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', password='pw')
+        self.client.force_login(self.admin)
+        self.exercise = Exercise.objects.create(name='Deadlift')
+
+    def image_upload(self, name='lift.png', size=(2000, 1000)):
+        buf = BytesIO()
+        Image.new('RGB', size, 'red').save(buf, 'PNG')
+        return SimpleUploadedFile(name, buf.getvalue(), content_type='image/png')
+
+    def test_upload_generates_derivatives_next_to_original(self):
+        data = self.client.post('/api/upload-media/', {
+            'target_type': 'exercise',
+            'target_id': self.exercise.pk,
+            'files': [self.image_upload()],
+        }).json()
+        media = ExerciseMedia.objects.get(pk=data['media'][0]['id'])
+        self.assertEqual(data['media'][0]['thumbnail_url'], f'/media/{media.thumbnail.name}')
+        self.assertEqual(media.thumbnail.name, 'exercises/lift_320.webp')
+        self.assertEqual(media.preview.name, 'exercises/lift_960.webp')
+        with Image.open(media.preview.path) as img:
+            self.assertEqual(img.size, (960, 480))
+
+        response = self.client.get(f'/media/{media.thumbnail.name}')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+
+        names = [media.file.name, media.thumbnail.name, media.preview.name]
+        self.client.post('/api/delete-media/', {
+            'target_type': 'exercise', 'media_id': media.pk,
+        }, content_type='application/json')
+        self.assertFalse(any(default_storage.exists(n) for n in names))
+
+    def test_backfill_command(self):
+        media = ExerciseMedia.objects.create(exercise=self.exercise, file=self.image_upload())
+        ExerciseMedia.objects.create(
+            exercise=self.exercise, is_video=True,
+            file=SimpleUploadedFile('clip.mp4', b'not really a video'),
+        )
+        call_command('generate_media_derivatives', stdout=StringIO())
+        media.refresh_from_db()
+        self.assertTrue(default_storage.exists(media.thumbnail.name))
+
+
+class DashboardQueryTests(TestCase):
+    """The month view must not issue per-workout queries."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.client.force_login(self.user)
+        self.bench = Exercise.objects.create(name='Bench Press')
+        self.squat = Exercise.objects.create(name='Squat')
+
+    def log_days(self, days):
+        for day in range(1, days + 1):
+            workout = Workout.objects.create(user=self.user, date=datetime.date(2024, 5, day))
+            for n, exercise in enumerate((self.bench, self.squat, self.bench), start=1):
+                WorkoutSet.objects.create(
+                    workout=workout, exercise=exercise, set_number=n,
+                    reps=5, weight=Decimal(60 + day),
+                )
+        recalculate_prs(self.user, self.bench)
+
+    def dashboard_queries(self):
+        url = f'/?year=2024&month=5&exercise={self.bench.pk}&show_prs=1'
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_filtered_month_query_count_is_flat(self):
+        self.log_days(2)
+        self.dashboard_queries()  # warm the exercise catalog cache
+        few = self.dashboard_queries()
+        Workout.objects.all().delete()
+        self.log_days(28)
+        self.assertEqual(self.dashboard_queries(), few)
+
+    def test_filtered_month_query_cap(self):
+        self.log_days(28)
+        url = f'/?year=2024&month=5&exercise={self.bench.pk}&show_prs=1'
+        # session, user, exercise catalog (cold cache), month workouts,
+        # filtered sets, day summaries, recent workouts, month PRs
+        with self.assertNumQueries(8):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['filtered_sets']), 28)
+        self.assertEqual(response.context['filtered_sets'][0]['compact'], '2x5x88')
+
+
+class DaySummaryTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.client.force_login(self.user)
+        self.bench = Exercise.objects.create(name='Bench Press')
+        self.squat = Exercise.objects.create(name='Squat')
+
+    def post(self, url, payload):
+        data = self.client.post(url, payload, content_type='application/json').json()
+        self.assertEqual(data['status'], 'ok')
+        return data
+
+    def add_sets(self, exercise, date, sets_text):
+        return self.post('/api/add-sets/', {
+            'exercise_id': exercise.pk, 'workout_date': date, 'sets_text': sets_text,
+        })
+
+    def snapshot(self):
+        return sorted(DaySummary.objects.filter(user=self.user).values_list(
+            'date', 'has_workout', 'has_pr', 'set_count', 'exercise_ids', 'pr_exercise_ids',
+        ))
+
+    def assert_matches_rebuild(self):
+        maintained = self.snapshot()
+        refresh_day_summaries(self.user)
+        self.assertEqual(maintained, self.snapshot())
+
+    def test_write_paths_keep_summaries_current(self):
+        self.add_sets(self.bench, '2024-05-01', '3x5x100')
+        self.add_sets(self.squat, '2024-05-01', '2x5x140')
+        self.assert_matches_rebuild()
+
+        # A heavier day moves the current PRs off May 1st
+        data = self.add_sets(self.bench, '2024-05-03', '1x5x105')
+        self.assert_matches_rebuild()
+
+        self.post('/api/toggle-pr/', {'set_id': data['sets'][0]['id']})
+        self.assert_matches_rebuild()
+
+        self.post('/api/delete-set/', {'set_id': data['sets'][0]['id']})
+        self.assert_matches_rebuild()
+        self.assertEqual(
+            DaySummary.objects.get(date=datetime.date(2024, 5, 1)).exercise_ids,
+            [self.bench.pk, self.squat.pk],
+        )
+        # The manual PR outlives the deleted set and workout
+        may_3 = DaySummary.objects.get(date=datetime.date(2024, 5, 3))
+        self.assertEqual((may_3.has_workout, may_3.has_pr, may_3.set_count), (False, True, 0))
+
+    def test_dashboard_calendar_reads_summaries(self):
+        self.add_sets(self.bench, '2024-05-01', '3x5x100')
+        self.add_sets(self.squat, '2024-05-02', '3x5x140')
+        response = self.client.get(f'/?year=2024&month=5&exercise={self.squat.pk}&show_prs=1')
+        self.assertEqual(response.context['workout_dates'], {2})
+        self.assertEqual(response.context['pr_dates'], {2})
+        response = self.client.get('/?year=2024&month=5')
+        self.assertEqual(response.context['workout_dates'], {1, 2})
+        self.assertEqual(response.context['pr_dates'], set())
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Upper bounds on the queries each view and JSON API may issue against a
+    realistic account, so per-row (N+1) queries fail loudly. Counts and
+    timings are appended to QUERY_BUDGET_REPORT (JSON) for trend tracking.
+    """
+    REPORT = os.environ.get(
+        'QUERY_BUDGET_REPORT', os.path.join(settings.BASE_DIR, 'query_budget_report.json'),
+    )
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(7)
+        cls.user = User.objects.create_superuser('lifter', password='pw')
+        cls.exercises = [
+            Exercise.objects.create(name=name)
+            for name in ('Bench Press', 'Squat', 'Deadlift', 'Overhead Press')
+        ] + [
+            Exercise.objects.create(user=cls.user, name=f'Custom {n}', description='Mine')
+            for n in range(4)
+        ]
+        start = datetime.date(2024, 1, 1)
+        sets = []
+        for day in range(0, 180, 2):
+            workout = Workout.objects.create(user=cls.user, date=start + datetime.timedelta(days=day))
+            for exercise in rng.sample(cls.exercises, 3):
+                for n in range(1, rng.randint(3, 6)):
+                    sets.append(WorkoutSet(
+                        workout=workout, exercise=exercise, set_number=n,
+                        reps=rng.choice([5, 8, 10, 12]),
+                        weight=Decimal(rng.choice([40, 50, 60, 70, 80, 90, 100])),
+                    ))
+        WorkoutSet.objects.bulk_create(sets)
+        for exercise in cls.exercises:
+            recalculate_prs(cls.user, exercise)
+        refresh_day_summaries(cls.user)
+        cls.workout = Workout.objects.order_by('-date').first()
+        cls.exercise = cls.exercises[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if not cls.results:
+            return
+        try:
+            with open(cls.REPORT) as f:
+                runs = json.load(f)
+        except (OSError, ValueError):
+            runs = []
+        runs.append({
+            'recorded_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'results': dict(sorted(cls.results.items())),
+        })
+        with open(cls.REPORT, 'w') as f:
+            json.dump(runs[-50:], f, indent=2)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def assert_budget(self, name, budget, method, url, data=None, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            if method == 'post-json':
+                response = self.client.post(url, json.dumps(data), content_type='application/json')
+            else:
+                response = getattr(self.client, method)(url, data, **kwargs)
+            elapsed = (time.perf_counter() - started) * 1000
+        self.assertLess(response.status_code, 400, f'{name}: HTTP {response.status_code}')
+        queries = len(ctx.captured_queries)
+        self.results[name] = {'queries': queries, 'budget': budget, 'ms': round(elapsed, 2)}
+        self.assertLessEqual(
+            queries, budget,
+            f'{name} issued {queries} queries (budget {budget}):\n'
+            + '\n'.join(q['sql'] for q in ctx.captured_queries),
+        )
+        return response
+
+    def test_dashboard(self):
+        self.assert_budget('dashboard', 6, 'get', '/?year=2024&month=3')
+        self.assert_budget(
+            'dashboard_filtered', 8, 'get',
+            f'/?year=2024&month=3&exercise={self.exercise.pk}&show_prs=1',
+        )
+
+    def test_exercise_pages(self):
+        self.assert_budget('exercise_list', 4, 'get', '/exercises/')
+        self.assert_budget('exercise_add', 2, 'get', '/exercises/add/')
+        custom = self.exercises[-1]
+        self.assert_budget('exercise_detail', 5, 'get', f'/exercises/{custom.pk}/')
+        self.assert_budget('exercise_edit', 4, 'get', f'/exercises/{custom.pk}/edit/')
+        self.assert_budget('exercise_delete', 3, 'get', f'/exercises/{custom.pk}/delete/')
+
+    def test_workout_pages(self):
+        self.assert_budget('workout_session', 7, 'get', f'/workout/{self.workout.date}/')
+        self.assert_budget('workout_session_empty', 4, 'get', '/workout/2030-01-01/')
+        self.assert_budget('workout_history', 5, 'get', '/history/')
+        # Cached fragments skip the page's own queries
+        self.assert_budget('workout_session_warm', 4, 'get', f'/workout/{self.workout.date}/')
+        self.assert_budget('workout_history_warm', 3, 'get', '/history/')
+        self.assert_budget('workout_history_deep', 5, 'get', '/history/?cursor=2024-02-01.0')
+        self.assert_budget('api_workout_history', 5, 'get', '/api/history/', {'cursor': '2024-02-01.0'})
+
+    def test_pr_pages(self):
+        self.assert_budget('pr_list', 5, 'get', '/prs/')
+        self.assert_budget('pr_list_filtered', 5, 'get', f'/prs/?exercise={self.exercise.pk}&type=weight')
+        self.assert_budget('pr_add', 3, 'get', '/prs/add/')
+        self.assert_budget('pr_list_warm', 3, 'get', '/prs/')
+
+    def test_set_apis(self):
+        # Set writes include refreshing the day's ExerciseProgress rows (2 queries)
+        # and adding to the weekly and monthly volume rollups (2 more)
+        response = self.assert_budget('api_add_sets', 24, 'post-json', '/api/add-sets/', {
+            'workout_id': self.workout.pk,
+            'exercise_id': self.exercise.pk,
+            'sets_text': '3x5x100, 2x3x110',
+        })
+        set_id = response.json()['sets'][0]['id']
+        self.assert_budget('api_toggle_pr', 10, 'post-json', '/api/toggle-pr/', {'set_id': set_id})
+        # The delete runs in one transaction with its rollup updates (a
+        # savepoint pair here, inside the test's transaction)
+        self.assert_budget('api_delete_set', 22, 'post-json', '/api/delete-set/', {'set_id': set_id})
+        self.assert_budget(
+            'api_workout_prs', 5, 'get', '/api/workout-prs/',
+            {'workout_id': self.workout.pk, 'after': '2024-01-01T00:00:00+00:00'},
+        )
+
+    def test_backdated_set_apis(self):
+        # Replays roughly six months of history for the exercise
+        first = Workout.objects.order_by('date').first()
+        self.assert_budget('api_add_sets_backdated', 25, 'post-json', '/api/add-sets/', {
+            'workout_id': first.pk,
+            'exercise_id': self.exercise.pk,
+            'sets_text': '5x5x120',
+        })
+
+    def test_exercise_api(self):
+        self.assert_budget('api_create_exercise', 5, 'post-json', '/api/create-exercise/', {'name': 'Hip Thrust'})
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_admin_changelists(self):
+        for model in ('exercise', 'workout', 'workoutset', 'personalrecord'):
+            self.assert_budget(f'admin_{model}', 7, 'get', f'/admin/workouts/{model}/')
+
+
+class WorkoutHistoryPaginationTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.client.force_login(self.user)
+        bench = Exercise.objects.create(name='Bench Press')
+        squat = Exercise.objects.create(name='Squat')
+        start = datetime.date(2024, 1, 1)
+        for day in range(45):
+            workout = Workout.objects.create(user=self.user, date=start + datetime.timedelta(days=day))
+            WorkoutSet.objects.create(workout=workout, exercise=squat, set_number=1, reps=5, weight=100)
+            WorkoutSet.objects.create(workout=workout, exercise=bench, set_number=1, reps=5, weight=80)
+            WorkoutSet.objects.create(workout=workout, exercise=bench, set_number=2, reps=5, weight=80)
+        # Workouts without sets are never listed
+        Workout.objects.create(user=self.user, date=datetime.date(2024, 3, 1))
+        other = User.objects.create_user('other')
+        Workout.objects.create(user=other, date=datetime.date(2024, 1, 10)).sets.create(
+            exercise=bench, set_number=1, reps=1, weight=1,
+        )
+
+    def test_feed_walks_history_once(self):
+        dates, cursor, pages = [], None, 0
+        while True:
+            params = {'cursor': cursor} if cursor else {}
+            data = self.client.get('/api/history/', params).json()
+            self.assertEqual(data['status'], 'ok')
+            dates += [w['date'] for w in data['workouts']]
+            pages += 1
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        expected = [str(datetime.date(2024, 1, 1) + datetime.timedelta(days=d)) for d in range(44, -1, -1)]
+        self.assertEqual(dates, expected)
+        self.assertEqual(pages, 3)
+
+    def test_sets_are_grouped_by_exercise(self):
+        workout = self.client.get('/api/history/').json()['workouts'][0]
+        self.assertEqual(workout['set_count'], 3)
+        self.assertEqual(workout['url'], '/workout/2024-02-14/')
+        self.assertEqual([e['name'] for e in workout['exercises']], ['Bench Press', 'Squat'])
+        self.assertEqual(
+            workout['exercises'][0]['sets'],
+            [
+                {'set_number': 1, 'count': 1, 'reps': 5, 'weight': '80.00'},
+                {'set_number': 2, 'count': 1, 'reps': 5, 'weight': '80.00'},
+            ],
+        )
+
+    def test_page_cost_is_flat(self):
+        with CaptureQueriesContext(connection) as first:
+            self.client.get('/history/')
+        with CaptureQueriesContext(connection) as deep:
+            self.client.get('/history/', {'cursor': '2024-01-21.0'})
+        self.assertEqual(len(first.captured_queries), len(deep.captured_queries))
+
+    def test_html_page_links_next_cursor(self):
+        response = self.client.get('/history/')
+        self.assertEqual(len(response.context['workouts']), 20)
+        self.assertContains(response, f'?cursor={response.context["next_cursor"]}')
+        last = self.client.get('/history/', {'cursor': '2024-01-03.0'})
+        self.assertEqual(len(last.context['workouts']), 2)
+        self.assertFalse(last.context['next_cursor'])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/history/', {'cursor': 'nope'}).status_code, 400)
+        # The HTML page just starts from the top
+        self.assertEqual(self.client.get('/history/', {'cursor': 'nope'}).status_code, 200)
+
+
+class ExerciseCatalogTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.other = User.objects.create_user('other')
+        self.bench = Exercise.objects.create(name='Bench Press')
+        self.mine = Exercise.objects.create(user=self.user, name='My Curl')
+        Exercise.objects.create(user=self.other, name='Their Curl')
+
+    def names(self, user):
+        return [ex.name for ex in exercise_catalog(user)]
+
+    def assert_catalog_cached(self):
+        exercise_catalog(self.user)
+        with self.assertNumQueries(1):  # data version only
+            exercise_catalog(self.user)
+
+    def test_merges_global_and_own_exercises(self):
+        self.assertEqual(self.names(self.user), ['Bench Press', 'My Curl'])
+        self.assert_catalog_cached()
+        self.assertEqual(get_exercise(self.user, str(self.mine.pk)), self.mine)
+        for pk in (Exercise.objects.get(name='Their Curl').pk, 'abc', None):
+            with self.assertRaises(Exercise.DoesNotExist):
+                get_exercise(self.user, pk)
+
+    def test_exercise_missing_from_a_stale_catalog_is_found_in_the_db(self):
+        self.names(self.user)
+        # Committed just after this catalog was built under the new version
+        with mock.patch('workouts.fragments.bump_data_version'):
+            press = Exercise.objects.create(user=self.user, name='Overhead Press')
+        self.assertNotIn('Overhead Press', self.names(self.user))
+        self.assertEqual(get_exercise(self.user, press.pk), press)
+
+    def test_own_writes_invalidate_only_that_user(self):
+        self.assertEqual(self.names(self.user), ['Bench Press', 'My Curl'])
+        self.assertEqual(self.names(self.other), ['Bench Press', 'Their Curl'])
+        Exercise.objects.create(user=self.user, name='Another')
+        self.assertIn('Another', self.names(self.user))
+        with self.assertNumQueries(1):
+            self.names(self.other)
+
+        self.mine.name = 'Hammer Curl'
+        self.mine.save()
+        self.assertIn('Hammer Curl', self.names(self.user))
+        self.mine.delete()
+        self.assertEqual(self.names(self.user), ['Another', 'Bench Press'])
+
+    def test_global_writes_invalidate_everyone(self):
+        self.names(self.user)
+        self.names(self.other)
+        call_command('load_default_exercises', stdout=StringIO())
+        self.assertIn('Squat', self.names(self.user))
+        self.assertIn('Squat', self.names(self.other))
+        Exercise.objects.filter(name='Squat').delete()
+        self.assertNotIn('Squat', self.names(self.user))
+
+    def test_views_read_from_catalog(self):
+        self.client.force_login(self.user)
+        self.client.get('/exercises/')
+        response = self.client.post('/api/create-exercise/', json.dumps({'name': 'my curl'}),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['message'], 'Exercise already exists.')
+        response = self.client.post('/api/create-exercise/', json.dumps({'name': 'Dip'}),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['status'], 'ok')
+        results = self.client.get('/api/exercises/search/?q=di').json()['results']
+        self.assertEqual([r['name'] for r in results], ['Dip'])
+
+        response = self.client.post('/api/add-sets/', json.dumps({
+            'workout_date': '2024-01-01',
+            'exercise_id': Exercise.objects.get(name='Their Curl').pk,
+            'sets_text': '1x5x10',
+        }), content_type='application/json')
+        self.assertEqual(response.json()['message'], 'Invalid exercise.')
+
+        response = self.client.post('/prs/add/', {
+            'exercise': Exercise.objects.get(name='Their Curl').pk, 'pr_type': 'weight', 'reps': 5,
+            'weight': '20', 'sets': 1, 'date': '2024-01-01',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('exercise', response.context['form'].errors)
+        response = self.client.post('/prs/add/', {
+            'exercise': self.mine.pk, 'pr_type': 'weight', 'reps': 5,
+            'weight': '20', 'sets': 1, 'date': '2024-01-01',
+        })
+        self.assertRedirects(response, '/prs/')
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'gym-tracker-test-cache'),
+    }})
+    def test_file_based_cache(self):
+        cache.clear()
+        self.assertEqual(self.names(self.user), ['Bench Press', 'My Curl'])
+        self.assert_catalog_cached()
+        Exercise.objects.create(user=self.user, name='Another')
+        self.assertIn('Another', self.names(self.user))
+        cache.clear()
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.client.force_login(self.user)
+        self.bench = Exercise.objects.create(name='Bench Press')
+        self.post('/api/add-sets/', {
+            'workout_date': '2024-01-01', 'exercise_id': self.bench.pk, 'sets_text': '3x5x100',
+        })
+        self.workout = Workout.objects.get(user=self.user)
+
+    def post(self, url, data):
+        response = self.client.post(url, json.dumps(data), content_type='application/json')
+        self.assertEqual(response.json()['status'], 'ok')
+        return response.json()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode(), len(ctx.captured_queries)
+
+    def test_second_render_is_served_from_cache(self):
+        for url in ('/history/', '/prs/', '/workout/2024-01-01/'):
+            first, cold = self.get(url)
+            second, warm = self.get(url)
+            self.assertIn('5 reps @ 100.00kg', second)
+            self.assertLess(warm, cold, url)
+        stats = fragment_stats()
+        self.assertEqual(stats['history'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+        self.assertEqual(stats['session-sets']['hits'], 1)
+
+    def test_writes_retire_fragments(self):
+        self.get('/workout/2024-01-01/')
+        self.get('/history/')
+        version = data_version(self.user.pk)
+        data = self.post('/api/add-sets/', {
+            'workout_id': self.workout.pk, 'exercise_id': self.bench.pk, 'sets_text': '1x3x120',
+        })
+        self.assertGreater(data_version(self.user.pk), version)
+        self.assertIn('120.00kg', self.get('/workout/2024-01-01/')[0])
+        self.assertIn('120.00kg', self.get('/history/')[0])
+
+        self.assertIn('3 reps @ 120.00kg', self.get('/prs/')[0])
+        self.post('/api/delete-set/', {'set_id': data['sets'][0]['id']})
+        self.assertNotIn('120.00kg', self.get('/prs/')[0])
+        self.assertNotIn('120.00kg', self.get('/history/')[0])
+
+    def test_exercise_rename_retires_fragments(self):
+        self.get('/history/')
+        self.bench.name = 'Flat Bench'
+        self.bench.save()
+        self.assertIn('Flat Bench', self.get('/history/')[0])
+
+    def test_exercise_edits_reach_other_workers(self):
+        # Each worker has its own per-process (locmem) cache; only the database is shared
+        def names():
+            return [exercise.name for exercise in exercise_catalog(self.user)]
+
+        def worker(name):
+            return override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': name,
+            }})
+
+        with worker('a'):
+            self.get('/history/')
+            self.assertNotIn('Overhead Press', names())
+        with worker('b'):
+            self.bench.name = 'Flat Bench'
+            self.bench.save()
+            press = Exercise.objects.create(user=self.user, name='Overhead Press')
+        with worker('a'):
+            self.assertIn('Flat Bench', self.get('/history/')[0])
+            self.assertIn('Overhead Press', names())
+
+        other = User.objects.create_user('other')
+        curl = Exercise.objects.create(user=self.user, name='My Curl')
+        self.post('/api/add-sets/', {'workout_date': '2024-01-01', 'exercise_id': curl.pk, 'sets_text': '1x10x20'})
+        with worker('a'):
+            self.get('/history/')
+        versions = data_version(self.user.pk), data_version(other.pk)
+        with worker('b'):
+            curl.delete()
+            press.delete()
+        with worker('a'):
+            self.assertNotIn('My Curl', self.get('/history/')[0])
+            self.assertNotIn('Overhead Press', names())
+        self.assertEqual(data_version(other.pk), versions[1])
+
+    def test_vary_on_arguments(self):
+        self.assertIn('Bench Press', self.get('/prs/')[0])
+        self.assertNotIn('Bench Press', self.get('/prs/?type=sets&exercise=0')[0].split('</form>')[1])
+
+    def test_media_and_admin_writes_bump_version(self):
+        version = data_version(self.user.pk)
+        WorkoutMedia.objects.create(workout=self.workout, file='workouts/x.mp4', is_video=True)
+        self.assertEqual(data_version(self.user.pk), version + 1)
+
+        admin = User.objects.create_superuser('admin', password='pw')
+        self.client.force_login(admin)
+        with override_settings(STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        }):
+            set_id = self.workout.sets.first().pk
+            self.client.post(f'/admin/workouts/workoutset/{set_id}/delete/', {'post': 'yes'})
+        self.assertFalse(WorkoutSet.objects.filter(pk=set_id).exists())
+        self.assertEqual(data_version(self.user.pk), version + 2)
+
+    def test_user_with_workout_media_can_be_deleted(self):
+        media = WorkoutMedia.objects.create(workout=self.workout, file='workouts/x.mp4', is_video=True)
+        version = data_version(self.user.pk)
+        media.delete()
+        self.assertEqual(data_version(self.user.pk), version + 1)
+
+        WorkoutMedia.objects.create(workout=self.workout, file='workouts/y.mp4', is_video=True)
+        self.user.delete()
+        connection.check_constraints()
+        self.assertFalse(DataVersion.objects.exists())
+
+    def test_stats_endpoint_is_staff_only(self):
+        self.get('/history/')
+        self.assertEqual(self.client.get('/api/fragment-cache-stats/').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        data = self.client.get('/api/fragment-cache-stats/?reset=1').json()
+        self.assertEqual(data['fragments']['history']['misses'], 1)
+        self.assertEqual(fragment_stats(), {})
+
+
+class SyntheticHistoryTests(TestCase):
+    def test_generate_and_benchmark(self):
+        call_command('generate_history', users=2, years=0.25, seed=1, stdout=StringIO())
+        users = User.objects.filter(username__startswith='synthetic-')
+        self.assertEqual(users.count(), 2)
+        user = users.first()
+        self.assertTrue(WorkoutSet.objects.filter(workout__user=user).exists())
+        self.assertTrue(PersonalRecord.objects.filter(user=user, is_current=True).exists())
+        self.assertEqual(
+            DaySummary.objects.filter(user=user).count(), Workout.objects.filter(user=user).count(),
+        )
+
+        before = (WorkoutSet.objects.count(), PersonalRecord.objects.count())
+        out = StringIO()
+        call_command('benchmark', repeat=2, stdout=out)
+        for target in ('parse_sets', 'recalculate_prs', 'dashboard', 'workout_history', 'pr_list', 'api_add_sets'):
+            self.assertIn(target, out.getvalue())
+        # Benchmark writes are rolled back
+        self.assertEqual((WorkoutSet.objects.count(), PersonalRecord.objects.count()), before)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.reset()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.client.force_login(self.user)
+
+    def staff(self):
+        self.user.is_staff = True
+        self.user.save()
+
+    def test_server_timing_header(self):
+        response = self.client.get('/history/')
+        timing = dict(
+            part.strip().split(';', 1) for part in response['Server-Timing'].split(',')
+        )
+        self.assertEqual(set(timing), {'app', 'db', 'tpl'})
+        self.assertRegex(timing['db'], r'^dur=[\d.]+;desc="\d+ queries"$')
+        self.assertGreater(float(timing['tpl'].split('=')[1]), 0)
+
+    def test_metrics_are_staff_only_prometheus_histograms(self):
+        self.client.get('/history/')
+        self.client.get('/history/')
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+        self.staff()
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('# TYPE gym_request_duration_seconds histogram', body)
+        self.assertIn('gym_request_duration_seconds_bucket{view="workout_history",le="+Inf"} 2', body)
+        self.assertIn('gym_request_template_seconds_count{view="workout_history"} 2', body)
+        queries = [line for line in body.splitlines() if line.startswith('gym_request_queries_sum{view="workout_history"}')]
+        self.assertGreater(float(queries[0].split()[-1]), 0)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_bearer_token(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer nope').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+    def test_per_process_files_are_added_up(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        other = metrics.Registry()
+        timings = metrics.RequestTimings()
+        timings.wall, timings.queries = 0.02, 3
+        with override_settings(METRICS_DIR=directory):
+            other.observe('workout_history', timings)
+            other.flush()
+            self.client.get('/history/')
+            self.staff()
+            body = self.client.get('/metrics').content.decode()
+        self.assertEqual(len([name for name in os.listdir(directory) if name.endswith('.json')]), 2)
+        self.assertIn('gym_request_duration_seconds_count{view="workout_history"} 2', body)
+        self.assertIn('gym_request_duration_seconds_bucket{view="workout_history",le="0.025"}', body)
+
+
+class AsyncAPITests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.exercise = Exercise.objects.create(name='Bench Press')
+        self.async_client.force_login(self.user)
+
+    def test_json_api_views_are_async(self):
+        for view in (
+            views.api_add_sets, views.api_delete_set, views.api_toggle_pr,
+            views.api_create_exercise, views.api_upload_media, views.api_delete_media,
+        ):
+            self.assertTrue(iscoroutinefunction(view), view.__name__)
+
+    @override_settings(COMPACT_SETS=True)
+    async def test_add_toggle_delete_through_async_client(self):
+        response = await self.async_client.post('/api/add-sets/', {
+            'workout_date': '2024-01-01', 'exercise_id': self.exercise.pk, 'sets_text': '3x5x100',
+        }, content_type='application/json')
+        data = response.json()
+        self.assertEqual(data['status'], 'ok')
+        self.assertEqual(data['sets'][0]['count'], 3)
+        self.assertTrue(data['prs'])
+        set_id = data['sets'][0]['id']
+
+        data = (await self.async_client.post(
+            '/api/toggle-pr/', {'set_id': set_id}, content_type='application/json',
+        )).json()
+        self.assertTrue(data['pr_active'])
+        self.assertTrue(await PersonalRecord.objects.filter(user=self.user, is_manual=True).aexists())
+
+        data = (await self.async_client.post(
+            '/api/delete-set/', {'set_id': set_id}, content_type='application/json',
+        )).json()
+        self.assertEqual(data, {'status': 'ok', 'count': 2})
+        data = (await self.async_client.post(
+            '/api/delete-set/', {'set_id': set_id, 'all': True}, content_type='application/json',
+        )).json()
+        self.assertEqual(data, {'status': 'ok', 'count': 0})
+        self.assertFalse(await Workout.objects.filter(user=self.user).aexists())
+
+    async def test_other_users_set_is_rejected(self):
+        other = await User.objects.acreate(username='other')
+        workout = await Workout.objects.acreate(user=other, date=datetime.date(2024, 1, 1))
+        ws = await WorkoutSet.objects.acreate(
+            workout=workout, exercise=self.exercise, set_number=1, reps=5, weight=Decimal('100'),
+        )
+        response = await self.async_client.post(
+            '/api/delete-set/', {'set_id': ws.pk}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(await WorkoutSet.objects.filter(pk=ws.pk).aexists())
+
+    async def test_create_exercise(self):
+        response = await self.async_client.post(
+            '/api/create-exercise/', {'name': 'Pendlay Row'}, content_type='application/json',
+        )
+        self.assertEqual(response.json()['exercise']['name'], 'Pendlay Row')
+        response = await self.async_client.post(
+            '/api/create-exercise/', {'name': 'pendlay row'}, content_type='application/json',
+        )
+        self.assertEqual(response.json()['message'], 'Exercise already exists.')
+
+    async def test_metrics_middleware_counts_queries_in_async_mode(self):
+        async def view(request):
+            await Exercise.objects.acount()
+            return HttpResponse()
+
+        middleware = RequestMetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().get('/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+
+
+class AsgiStreamingTests(TempMediaMixin, TestCase):
+    """Under ASGI the streamed downloads must not be drained before the first byte goes out."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.read = 0
+
+    def counting(self, source):
+        def wrapper(*args, **kwargs):
+            for item in source(*args, **kwargs):
+                self.read += 1
+                yield item
+        return wrapper
+
+    async def test_media_streams_chunk_by_chunk(self):
+        content = os.urandom(3 * media.STREAM_CHUNK_SIZE)
+        path = await sync_to_async(default_storage.save)('workouts/clip.mp4', ContentFile(content))
+        await self.async_client.aforce_login(self.user)
+        with mock.patch('workouts.views.iter_media', self.counting(media.iter_media)):
+            response = await self.async_client.get(f'/media/{path}')
+            self.assertTrue(response.is_async)
+            chunks = aiter(response.streaming_content)
+            first = await anext(chunks)
+            self.assertEqual(self.read, 1)
+            rest = [chunk async for chunk in chunks]
+        self.assertEqual(first + b''.join(rest), content)
+
+    async def test_export_streams_chunk_by_chunk(self):
+        exercise = await Exercise.objects.acreate(name='Bench Press')
+        workout = await Workout.objects.acreate(user=self.user, date=datetime.date(2024, 1, 1))
+        await WorkoutSet.objects.abulk_create(
+            WorkoutSet(workout=workout, exercise=exercise, set_number=n, reps=5, weight=Decimal('100'))
+            for n in range(1, 5001)
+        )
+        await self.async_client.aforce_login(self.user)
+        with mock.patch('workouts.exporter.export_rows', self.counting(exporter.export_rows)):
+            response = await self.async_client.get('/api/export-history/')
+            self.assertTrue(response.is_async)
+            chunks = aiter(response.streaming_content)
+            await anext(chunks)
+            self.assertLess(self.read, 5000)
+            lines = b''.join([chunk async for chunk in chunks]).splitlines()
+        self.assertEqual(self.read, 5000)
+        self.assertEqual(lines[-1], b'2024-01-01,Bench Press,5000,5,100.00')
+
+class ConcurrentPRRecalcTests(TransactionTestCase):
+    """Threads need committed data and their own connections, so no wrapping transaction."""
+
+    def test_concurrent_saves_leave_no_drift(self):
+        out = StringIO()
+        call_command('stress_pr_recalc', threads=4, pairs=2, iterations=10, days=4, stdout=out)
+        self.assertIn('No drift', out.getvalue())
+        self.assertNotIn('failed', out.getvalue())
+        self.assertFalse(User.objects.filter(username='stress-pr-recalc').exists())
+
+    def test_rebuilds_during_saves_leave_no_drift(self):
+        out = StringIO()
+        call_command('stress_pr_recalc', threads=3, pairs=2, iterations=10, days=4, rebuilds=5, stdout=out)
+        self.assertIn('with 5 rebuild(s)', out.getvalue())
+        self.assertIn('No drift', out.getvalue())
+        self.assertNotIn('failed', out.getvalue())
+
+    def test_recompute_outside_a_transaction_takes_the_pair_stripe(self):
+        user = User.objects.create_user('lifter')
+        exercise = Exercise.objects.create(name='Bench Press')
+        stripe = services._pr_lock_stripes[hash((user.pk, exercise.pk)) % services.PR_LOCK_STRIPES]
+        acquired = []
+        real_atomic = services.transaction.atomic
+
+        def atomic(*args, **kwargs):
+            acquired.append(stripe.locked())
+            return real_atomic(*args, **kwargs)
+
+        with mock.patch.object(services.transaction, 'atomic', atomic):
+            recalculate_prs(user, exercise)
+        self.assertEqual(acquired[:1], [True])
+        self.assertFalse(stripe.locked())
+
+
+class ExerciseProgressTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.client.force_login(self.user)
+        self.bench = Exercise.objects.create(name='Bench Press')
+        self.squat = Exercise.objects.create(name='Squat')
+
+    def add(self, exercise, date, sets_text):
+        data = self.client.post('/api/add-sets/', {
+            'workout_date': date, 'exercise_id': exercise.pk, 'sets_text': sets_text,
+        }, content_type='application/json').json()
+        self.assertEqual(data['status'], 'ok', data.get('message'))
+        return data
+
+    def progress(self, exercise):
+        return list(
+            ExerciseProgress.objects.filter(user=self.user, exercise=exercise)
+            .values_list('date', 'epley', 'brzycki')
+        )
+
+    def test_formulas(self):
+        # A single is its own 1RM; Brzycki has no value from 37 reps on
+        for sets_text, epley, brzycki in [
+            ('1x5x100', '116.67', '112.50'), ('1x1x140', '140.00', '140.00'),
+            ('1x3x102.5', '112.75', '108.53'), ('1x40x50', '116.67', None),
+        ]:
+            with self.subTest(sets_text):
+                self.add(self.bench, '2024-01-01', sets_text)
+                row = ExerciseProgress.objects.get(exercise=self.bench)
+                self.assertEqual((str(row.epley), row.brzycki and str(row.brzycki)), (epley, brzycki))
+                WorkoutSet.objects.all().delete()
+                ExerciseProgress.objects.all().delete()
+
+    @override_settings(COMPACT_SETS=True)
+    def test_set_writes_keep_the_daily_best(self):
+        self.add(self.bench, '2024-01-01', '3x5x100')
+        self.add(self.bench, '2024-01-01', '1x1x115')
+        self.add(self.squat, '2024-01-01', '1x5x140')
+        self.add(self.bench, '2024-01-08', '1x3x110')
+        self.assertEqual(self.progress(self.bench), [
+            (datetime.date(2024, 1, 1), Decimal('116.67'), Decimal('115.00')),
+            (datetime.date(2024, 1, 8), Decimal('121.00'), Decimal('116.47')),
+        ])
+
+        # Deleting the best set falls back to the day's next best; deleting
+        # the last one removes the row but leaves other exercises alone
+        single = WorkoutSet.objects.get(exercise=self.bench, reps=1)
+        self.client.post('/api/delete-set/', {'set_id': single.pk}, content_type='application/json')
+        self.assertEqual(self.progress(self.bench)[0][1:], (Decimal('116.67'), Decimal('112.50')))
+        run = WorkoutSet.objects.get(exercise=self.bench, workout__date='2024-01-01')
+        self.client.post('/api/delete-set/', {'set_id': run.pk, 'all': True}, content_type='application/json')
+        self.assertEqual([date for date, _, _ in self.progress(self.bench)], [datetime.date(2024, 1, 8)])
+        self.assertEqual(len(self.progress(self.squat)), 1)
+
+    def test_api_series(self):
+        self.add(self.bench, '2024-01-01', '1x5x100')
+        self.add(self.bench, '2024-01-08', '1x40x50')
+        data = self.client.get('/api/progress/', {'exercise_id': self.bench.pk}).json()
+        self.assertEqual(data['formula'], 'epley')
+        self.assertEqual(data['series'], [
+            {'date': '2024-01-01', 'e1rm': '116.67'}, {'date': '2024-01-08', 'e1rm': '116.67'},
+        ])
+        data = self.client.get('/api/progress/', {'exercise_id': self.bench.pk, 'formula': 'brzycki'}).json()
+        self.assertEqual(data['series'], [{'date': '2024-01-01', 'e1rm': '112.50'}])
+
+        self.assertEqual(self.client.get('/api/progress/', {'exercise_id': self.bench.pk, 'formula': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/progress/', {'exercise_id': 'nope'}).status_code, 400)
+
+    def test_backfill_command(self):
+        self.add(self.bench, '2024-01-01', '1x5x100')
+        self.add(self.squat, '2024-01-02', '1x5x140')
+        expected = list(ExerciseProgress.objects.values_list('exercise_id', 'date', 'epley', 'brzycki'))
+        ExerciseProgress.objects.all().delete()
+
+        out = StringIO()
+        call_command('backfill_progress', stdout=out)
+        self.assertIn('for 1 users', out.getvalue())
+        self.assertEqual(list(ExerciseProgress.objects.values_list('exercise_id', 'date', 'epley', 'brzycki')), expected)
+        call_command('backfill_progress', stdout=out)
+        self.assertIn('for 0 users', out.getvalue())
+
+
+class ProgressDownsampleTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.client.force_login(self.user)
+        self.bench = Exercise.objects.create(name='Bench Press')
+
+    def test_lttb(self):
+        xs = list(range(100))
+        ys = [float(x % 10) for x in xs]
+        ys[55] = 50.0
+        self.assertEqual(lttb(xs, ys, 100), xs)
+
+        picked = lttb(xs, ys, 10)
+        self.assertEqual(len(picked), 10)
+        self.assertEqual(picked, sorted(picked))
+        self.assertEqual((picked[0], picked[-1]), (0, 99))
+        self.assertIn(55, picked)  # the spike survives
+
+        # Mandatory points are added on top of the shape, never dropped
+        picked = lttb(xs, ys, 10, keep=[3, 4, 97])
+        self.assertEqual(len(picked), 10)
+        self.assertTrue({0, 3, 4, 55, 97, 99} <= set(picked))
+        self.assertEqual(lttb(xs, ys, 3, keep=[10, 20, 30]), [0, 10, 20, 30, 99])
+
+    def seed_progress(self, days):
+        start = datetime.date(2000, 1, 1)
+        rng = random.Random(0)
+        ExerciseProgress.objects.bulk_create(
+            ExerciseProgress(
+                user=self.user, exercise=self.bench, date=start + datetime.timedelta(days=n),
+                epley=Decimal(100 + n // 50 + rng.randrange(-5, 5)), brzycki=None,
+            )
+            for n in range(days)
+        )
+        return start
+
+    def test_api_max_points_keeps_pr_days(self):
+        start = self.seed_progress(2000)
+        pr_day = start + datetime.timedelta(days=1234)
+        PersonalRecord.objects.create(user=self.user, exercise=self.bench, pr_type='weight', reps=5,
+                                      weight=Decimal('100'), date=pr_day)
+
+        series = self.client.get('/api/progress/', {'exercise_id': self.bench.pk}).json()['series']
+        self.assertEqual(len(series), 2000)
+        series = self.client.get(
+            '/api/progress/', {'exercise_id': self.bench.pk, 'max_points': 100},
+        ).json()['series']
+        dates = [point['date'] for point in series]
+        self.assertEqual(len(series), 100)
+        self.assertEqual(dates, sorted(dates))
+        self.assertEqual((dates[0], dates[-1]), (str(start), str(start + datetime.timedelta(days=1999))))
+        self.assertIn(str(pr_day), dates)
+
+        for bad in ('2', 'lots', '-5'):
+            response = self.client.get('/api/progress/', {'exercise_id': self.bench.pk, 'max_points': bad})
+            self.assertEqual(response.status_code, 400, bad)
+
+    def test_api_max_points_caps_many_pr_days(self):
+        start = self.seed_progress(2000)
+        # A PR on most training days, a fifth of them still current
+        PersonalRecord.objects.bulk_create(
+            PersonalRecord(user=self.user, exercise=self.bench, pr_type='weight', reps=5, weight=Decimal('100'),
+                           date=start + datetime.timedelta(days=n), is_current=n % 5 == 0)
+            for n in range(0, 2000, 2)
+        )
+        series = self.client.get(
+            '/api/progress/', {'exercise_id': self.bench.pk, 'max_points': 100},
+        ).json()['series']
+        self.assertLessEqual(len(series), 100)
+        dates = [point['date'] for point in series]
+        self.assertEqual((dates[0], dates[-1]), (str(start), str(start + datetime.timedelta(days=1999))))
+        best = max(ExerciseProgress.objects.filter(user=self.user).values_list('epley', flat=True))
+        self.assertIn(f'{best:.2f}', [point['e1rm'] for point in series])
+
+    def test_cached_per_data_version(self):
+        self.seed_progress(50)
+        params = {'exercise_id': self.bench.pk, 'max_points': 10}
+        first = self.client.get('/api/progress/', params)
+        with self.assertNumQueries(3):  # session, user and data version only
+            again = self.client.get('/api/progress/', params)
+        self.assertEqual(again.content, first.content)
+        self.assertEqual(again['ETag'], first['ETag'])
+        self.assertEqual(self.client.get('/api/progress/', params, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertNotEqual(self.client.get('/api/progress/', {**params, 'max_points': 20})['ETag'], first['ETag'])
+
+        self.client.post('/api/add-sets/', {
+            'workout_date': '2000-02-25', 'exercise_id': self.bench.pk, 'sets_text': '1x1x300',
+        }, content_type='application/json')
+        response = self.client.get('/api/progress/', params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn({'date': '2000-02-25', 'e1rm': '300.00'}, response.json()['series'])
+
+
+class VolumeRollupTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.client.force_login(self.user)
+        self.bench = Exercise.objects.create(name='Bench Press')
+        self.squat = Exercise.objects.create(name='Squat')
+
+    def add(self, exercise, date, sets_text):
+        data = self.client.post('/api/add-sets/', {
+            'workout_date': date, 'exercise_id': exercise.pk, 'sets_text': sets_text,
+        }, content_type='application/json').json()
+        self.assertEqual(data['status'], 'ok', data.get('message'))
+        return data['sets']
+
+    def delete(self, set_id, whole_row=False):
+        return self.client.post('/api/delete-set/', {'set_id': set_id, 'all': whole_row},
+                                content_type='application/json').json()
+
+    def weekly(self):
+        return {
+            (exercise_id, str(week)): (sets, reps, volume)
+            for exercise_id, week, sets, reps, volume in WeeklyVolume.objects.filter(
+                user=self.user, sets__gt=0,
+            ).values_list('exercise_id', 'week', 'sets', 'reps', 'volume')
+        }
+
+    def monthly(self):
+        return {
+            str(month): (sets, reps, volume)
+            for month, sets, reps, volume in MonthlyVolume.objects.filter(
+                user=self.user, sets__gt=0,
+            ).values_list('month', 'sets', 'reps', 'volume')
+        }
+
+    @override_settings(COMPACT_SETS=True)
+    def test_set_writes_apply_deltas(self):
+        # 2024-01-28 is a Sunday: same ISO week as the 22nd, same month; the
+        # 29th starts the next week, and 2024-02-01 the next month
+        self.add(self.bench, '2024-01-22', '3x5x100')
+        self.add(self.bench, '2024-01-28', '1x3x102.5')
+        self.add(self.squat, '2024-01-29', '2x5x140')
+        feb = self.add(self.bench, '2024-02-01', '2x10x60')
+        self.assertEqual(self.weekly(), {
+            (self.bench.pk, '2024-01-22'): (4, 18, Decimal('1807.50')),
+            (self.squat.pk, '2024-01-29'): (2, 10, Decimal('1400.00')),
+            (self.bench.pk, '2024-01-29'): (2, 20, Decimal('1200.00')),
+        })
+        self.assertEqual(self.monthly(), {
+            '2024-01-01': (6, 28, Decimal('3207.50')),
+            '2024-02-01': (2, 20, Decimal('1200.00')),
+        })
+
+        # One set of a counted row, then the rest of it
+        self.delete(feb[0]['id'])
+        self.assertEqual(self.weekly()[(self.bench.pk, '2024-01-29')], (1, 10, Decimal('600.00')))
+        self.delete(feb[0]['id'], whole_row=True)
+        self.assertNotIn((self.bench.pk, '2024-01-29'), self.weekly())
+        self.assertNotIn('2024-02-01', self.monthly())
+        call_command('verify_volume_rollups', stdout=StringIO())
+
+    @override_settings(COMPACT_SETS=True)
+    def test_writes_roll_back_with_the_rollups(self):
+        sets = self.add(self.bench, '2024-01-22', '3x5x100')
+        before = (self.weekly(), self.monthly())
+
+        with mock.patch.object(views, 'recalculate_prs', side_effect=RuntimeError('boom')):
+            response = self.client.post('/api/add-sets/', {
+                'workout_date': '2024-01-23', 'exercise_id': self.bench.pk, 'sets_text': '1x5x100',
+            }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        with mock.patch.object(views.Workout, 'delete', side_effect=RuntimeError('boom')):
+            self.assertEqual(self.delete(sets[0]['id'], whole_row=True)['status'], 'error')
+        self.assertEqual((self.weekly(), self.monthly()), before)
+        self.assertEqual(WorkoutSet.objects.get().count, 3)
+
+    def test_full_refresh_and_exercise_delete_rebuild(self):
+        self.add(self.bench, '2024-01-22', '3x5x100')
+        custom = Exercise.objects.create(user=self.user, name='Mine')
+        self.add(custom, '2024-01-23', '1x10x20')
+        expected = (self.weekly(), self.monthly())
+
+        WeeklyVolume.objects.all().delete()
+        MonthlyVolume.objects.all().delete()
+        services.refresh_day_summaries(self.user)
+        self.assertEqual((self.weekly(), self.monthly()), expected)
+
+        self.client.post(f'/exercises/{custom.pk}/delete/')
+        self.assertEqual(self.monthly(), {'2024-01-01': (3, 15, Decimal('1500.00'))})
+
+    def test_verify_command(self):
+        self.add(self.bench, '2024-01-22', '3x5x100')
+        WeeklyVolume.objects.update(volume=1)
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('verify_volume_rollups', stdout=out)
+        self.assertIn('lifter: week: 0 missing, 0 extra, 1 wrong', out.getvalue())
+
+        call_command('verify_volume_rollups', '--fix', stdout=out)
+        self.assertIn('rebuilt 1', out.getvalue())
+        call_command('verify_volume_rollups', stdout=out)
+
+    def test_api_and_stats_page(self):
+        self.add(self.bench, '2024-01-22', '3x5x100')
+        self.add(self.squat, '2024-02-05', '2x5x140')
+
+        rows = self.client.get('/api/volume/').json()['rows']
+        self.assertEqual(rows, [
+            {'week': '2024-W04', 'start': '2024-01-22', 'exercise_id': self.bench.pk, 'exercise': 'Bench Press',
+             'sets': 3, 'reps': 15, 'volume': '1500.00'},
+            {'week': '2024-W06', 'start': '2024-02-05', 'exercise_id': self.squat.pk, 'exercise': 'Squat',
+             'sets': 2, 'reps': 10, 'volume': '1400.00'},
+        ])
+        rows = self.client.get('/api/volume/', {'exercise_id': self.squat.pk}).json()['rows']
+        self.assertEqual([row['exercise'] for row in rows], ['Squat'])
+        rows = self.client.get('/api/volume/', {'period': 'month', 'since': '2024-02-10'}).json()['rows']
+        self.assertEqual(rows, [{'month': '2024-02', 'sets': 2, 'reps': 10, 'volume': '1400.00'}])
+        for params in ({'period': 'day'}, {'since': 'soon'}, {'exercise_id': 'x'}):
+            self.assertEqual(self.client.get('/api/volume/', params).status_code, 400, params)
+
+        today = datetime.date.today()
+        self.add(self.bench, str(today), '1x5x100')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/stats/')
+        self.assertNotIn('workouts_workoutset', ' '.join(q['sql'] for q in queries.captured_queries))
+        self.assertContains(response, 'Bench Press')
+        self.assertContains(response, today.strftime('%B %Y'))
+
+    def test_stats_months_end_with_the_current_month(self):
+        # Friday 1 March 2024: the week started in February
+        weeks, months = views._stats_periods(datetime.date(2024, 3, 1))
+        self.assertEqual((weeks[-1], len(weeks)), (datetime.date(2024, 2, 26), views.STATS_WEEKS))
+        self.assertEqual((months[0], months[-1]), (datetime.date(2023, 4, 1), datetime.date(2024, 3, 1)))
+        self.assertEqual(len(months), views.STATS_MONTHS)
+
+
+class ExerciseSearchTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('lifter', password='pw')
+        self.other = User.objects.create_user('other', password='pw')
+        self.client.force_login(self.user)
+        self.bench = Exercise.objects.create(name='Bench  Press')
+        self.incline = Exercise.objects.create(name='Incline Bench Press')
+        self.bent = Exercise.objects.create(name='Bent Over Row')
+        Exercise.objects.create(user=self.other, name='Bench Dip')
+
+    def search(self, q, **params):
+        response = self.client.get('/api/exercises/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [result['name'] for result in response.json()['results']]
+
+    def add(self, exercise, sets_text):
+        response = self.client.post('/api/add-sets/', json.dumps({
+            'workout_date': '2024-01-01', 'exercise_id': exercise.pk, 'sets_text': sets_text,
+        }), content_type='application/json')
+        self.assertEqual(response.json()['status'], 'ok')
+
+    def test_name_normalized_on_save(self):
+        self.assertEqual(self.bench.name_normalized, 'bench press')
+        self.bench.name = '  DEADLIFT '
+        self.bench.save(update_fields=['name'])
+        self.bench.refresh_from_db()
+        self.assertEqual(self.bench.name_normalized, 'deadlift')
+
+    def test_prefix_matches_before_contains(self):
+        self.assertEqual(self.search('bench'), ['Bench  Press', 'Incline Bench Press'])
+        self.assertEqual(self.search('  BENCH   press'), ['Bench  Press', 'Incline Bench Press'])
+        self.assertEqual(self.search('ben'), ['Bench  Press', 'Bent Over Row', 'Incline Bench Press'])
+        self.assertEqual(self.search('row'), ['Bent Over Row'])
+        self.assertEqual(self.search('squat'), [])
+
+    def test_ranked_by_usage_and_limited(self):
+        self.add(self.bent, '1x5x60')
+        self.assertEqual(self.search('ben'), ['Bent Over Row', 'Bench  Press', 'Incline Bench Press'])
+        self.add(self.bench, '3x5x100')
+        self.assertEqual(self.search('', limit=2), ['Bench  Press', 'Bent Over Row'])
+        result = self.client.get('/api/exercises/search/', {'q': 'bench'}).json()['results'][0]
+        self.assertEqual(result, {'id': self.bench.pk, 'name': 'Bench  Press', 'custom': False, 'sets': 3})
+        for limit in ('0', 'x'):
+            response = self.client.get('/api/exercises/search/', {'q': 'b', 'limit': limit})
+            self.assertEqual(response.status_code, 400, limit)
+
+    def test_create_rejects_duplicates_by_normalized_name(self):
+        for name in ('bench press', 'BENCH PRESS ', 'Bench Dip'):
+            response = self.client.post('/api/create-exercise/', json.dumps({'name': name}),
+                                        content_type='application/json')
+            expected = 'ok' if name == 'Bench Dip' else 'error'
+            self.assertEqual(response.json()['status'], expected, name)
+        self.assertEqual(Exercise.objects.filter(user=self.user, name='Bench Dip').count(), 1)
+
+    def test_pages_do_not_render_the_catalog(self):
+        for url in ('/', '/workout/2024-01-01/', '/prs/', '/prs/add/'):
+            response = self.client.get(url)
+            self.assertNotContains(response, 'Bent Over Row', msg_prefix=url)
+        response = self.client.get('/', {'exercise': self.bent.pk})
+        self.assertContains(response, 'value="Bent Over Row"')
@@ -7,8 +7,16 @@ urlpatterns = [
     path('workout/', views.workout_session, name='workout_today'),
     path('workout/<str:date_str>/', views.workout_session, name='workout_session'),
     path('history/', views.workout_history, name='workout_history'),
+    path('api/history/', views.api_workout_history, name='api_workout_history'),
+    path('api/fragment-cache-stats/', views.api_fragment_cache_stats, name='api_fragment_cache_stats'),
     path('api/add-sets/', views.api_add_sets, name='api_add_sets'),
+    path('api/import-history/', views.api_import_history, name='api_import_history'),
+    path('api/export-history/', views.api_export_history, name='api_export_history'),
     path('api/delete-set/', views.api_delete_set, name='api_delete_set'),
+    path('api/workout-prs/', views.api_workout_prs, name='api_workout_prs'),
+    path('api/progress/', views.api_exercise_progress, name='api_exercise_progress'),
+    path('stats/', views.training_stats, name='training_stats'),
+    path('api/volume/', views.api_training_volume, name='api_training_volume'),
     path('prs/add/', views.pr_add, name='pr_add'),
     path('prs/', views.pr_list, name='pr_list'),
     path('api/toggle-pr/', views.api_toggle_pr, name='api_toggle_pr'),
@@ -18,6 +26,7 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('media/<path:path>', views.serve_media, name='serve_media'),
     path('api/create-exercise/', views.api_create_exercise, name='api_create_exercise'),
+    path('api/exercises/search/', views.api_exercise_search, name='api_exercise_search'),
     path('api/upload-media/', views.api_upload_media, name='api_upload_media'),
     path('api/delete-media/', views.api_delete_media, name='api_delete_media'),
     ]
\ No newline at end of file
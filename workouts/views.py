@@ -1,21 +1,72 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, aget_object_or_404, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.db.models import Q
 from django.views.decorators.http import require_POST
-from .forms import ExerciseForm, parse_sets
+from .forms import ExerciseForm, collapse_sets, format_sets, parse_sets
 import datetime
 import json
 import calendar
+import codecs
+import functools
+import hashlib
 from itertools import groupby
 from operator import attrgetter
-from .services import recalculate_prs
+from .catalog import exercise_catalog, get_exercise
+from .exporter import EXPORT_DATASETS, EXPORT_FORMATS, export_filename, export_history
+from .downsample import lttb
+from .fragments import FRAGMENT_TIMEOUT, data_version, fragment_key, fragment_stats, record_fragment
+from .importer import IMPORT_FORMATS, import_format_for, import_workout_history
+from .search import MAX_SEARCH_LIMIT, SEARCH_LIMIT, exercise_usage, find_exercise, search_exercises, visible_exercises
+from .services import (
+    E1RM_FORMULAS, apply_volume_delta, enqueue_pr_recalc, month_start, rebuild_volume_rollups, recalculate_prs,
+    refresh_day_summaries, volume_of, week_start,
+)
 from django.contrib.auth import logout
-from django.db.models import Count
+from django.db.models import Exists, OuterRef, Prefetch, Sum
+from django.db import transaction
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.formats import date_format
+from django.utils.functional import SimpleLazyObject
+from urllib.parse import urlencode
+from collections import defaultdict
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.files.storage import default_storage
-from django.http import HttpResponse
-from .models import Exercise, Workout, WorkoutSet, PersonalRecord, ExerciseMedia, WorkoutMedia
+from django.core.handlers.asgi import ASGIRequest
+from django.forms import HiddenInput
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+from .media import content_type_for, generate_derivatives, iter_media, media_etag, media_stat, parse_range
+from .models import (
+    DaySummary, Exercise, ExerciseProgress, Workout, WorkoutSet, PersonalRecord, PRRecalcJob, ExerciseMedia, WorkoutMedia,
+    MonthlyVolume, WeeklyVolume,
+)
 import os
+from asgiref.sync import sync_to_async
+
+def _set_exercise_field(form, user):
+    """
+    Point a form's exercise field at the user's catalog. The page picks the
+    exercise with the search API, so the field renders as a hidden input
+    rather than a list of every exercise; the queryset validates a POST.
+    """
+    field = form.fields['exercise']
+    field.queryset = visible_exercises(user)
+    field.widget = HiddenInput()
+
+
+def _exercise_name(user, pk):
+    """Name of the visible exercise ``pk`` for a picker's initial text; '' if there is none."""
+    try:
+        return visible_exercises(user).filter(pk=int(pk)).values_list('name', flat=True).first() or ''
+    except (TypeError, ValueError):
+        return ''
+
 
 @login_required
 def pr_add(request):
@@ -24,9 +75,7 @@ def pr_add(request):
 
     if request.method == 'POST':
         form = ManualPRForm(request.POST)
-        form.fields['exercise'].queryset = Exercise.objects.filter(
-            Q(user=request.user) | Q(user__isnull=True)
-        )
+        _set_exercise_field(form, request.user)
         if form.is_valid():
             PersonalRecord.objects.create(
                 user=request.user,
@@ -39,14 +88,16 @@ def pr_add(request):
                 is_manual=True,
                 is_current=True,
             )
+            refresh_day_summaries(request.user, [form.cleaned_data['date']], progress=False)
             return redirect('pr_list')
     else:
         form = ManualPRForm()
-        form.fields['exercise'].queryset = Exercise.objects.filter(
-            Q(user=request.user) | Q(user__isnull=True)
-        )
+        _set_exercise_field(form, request.user)
 
-    return render(request, 'workouts/pr_add.html', {'form': form})
+    return render(request, 'workouts/pr_add.html', {
+        'form': form,
+        'exercise_name': _exercise_name(request.user, form['exercise'].value()),
+    })
 
 @login_required
 def dashboard(request):
@@ -68,29 +119,54 @@ def dashboard(request):
     # Exercise filter
     exercise_filter_id = request.GET.get('exercise', '')
     show_prs = request.GET.get('show_prs', '')
-    user_exercises = Exercise.objects.filter(
-        Q(user=request.user) | Q(user__isnull=True)
-    )
 
     # Get workouts for this month
     workouts_qs = Workout.objects.filter(
         user=request.user,
         date__year=year,
         date__month=month,
-    ).prefetch_related('sets__exercise')
+    )
 
-    # If filtering by exercise, only include workouts that have that exercise
+    # If filtering by exercise, only include workouts that have that exercise,
+    # prefetching just that exercise's sets in one extra query
+    month_workouts = []
     if exercise_filter_id:
         try:
             exercise_filter_id = int(exercise_filter_id)
-            workouts_qs = workouts_qs.filter(sets__exercise_id=exercise_filter_id).distinct()
+            month_workouts = list(
+                workouts_qs
+                .filter(sets__exercise_id=exercise_filter_id)
+                .distinct()
+                .order_by('-date')
+                .prefetch_related(Prefetch(
+                    'sets',
+                    queryset=WorkoutSet.objects.filter(
+                        exercise_id=exercise_filter_id
+                    ).order_by('set_number'),
+                    to_attr='filtered_sets',
+                ))
+            )
         except (ValueError, TypeError):
             exercise_filter_id = ''
 
-    # Build set of dates that have workouts
+    # Calendar highlighting comes from the per-day summaries
     workout_dates = set()
-    for w in workouts_qs:
-        workout_dates.add(w.date.day)
+    pr_dates = set()
+    for summary in DaySummary.objects.filter(
+        user=request.user, date__year=year, date__month=month,
+    ):
+        if exercise_filter_id:
+            if exercise_filter_id in summary.exercise_ids:
+                workout_dates.add(summary.date.day)
+            if exercise_filter_id in summary.pr_exercise_ids:
+                pr_dates.add(summary.date.day)
+        else:
+            if summary.has_workout:
+                workout_dates.add(summary.date.day)
+            if summary.has_pr:
+                pr_dates.add(summary.date.day)
+    if not show_prs:
+        pr_dates = set()
 
     # Build calendar grid
     cal = calendar.Calendar(firstweekday=0)  # Monday first
@@ -110,28 +186,21 @@ def dashboard(request):
 
     # Recent workouts (unfiltered, last 5)
     recent_workouts = Workout.objects.filter(user=request.user).annotate(
-    set_count=Count('sets')
+    set_count=Sum('sets__count')
 ).filter(set_count__gt=0)[:5]
 
     # Filtered workouts list (for exercise filter display)
     filtered_sets = []
-    if exercise_filter_id:
-        filtered_workouts = workouts_qs.order_by('-date')
-        for w in filtered_workouts:
-            sets = w.sets.filter(exercise_id=exercise_filter_id).order_by('set_number')
-            if sets.exists():
-                compact = ', '.join(
-                    f"{s.set_number}x{s.reps}x{int(s.weight) if s.weight == int(s.weight) else s.weight}"
-                    for s in sets
-                )
-                filtered_sets.append({
-                    'date': w.date,
-                    'compact': compact,
-                    'sets': list(sets),
-                })
+    for w in month_workouts:
+        sets = w.filtered_sets
+        if sets:
+            filtered_sets.append({
+                'date': w.date,
+                'compact': format_sets(sets),
+                'sets': sets,
+            })
 
-    # PR dates for calendar highlighting
-    pr_dates = set()
+    # PRs of the month, listed below the calendar
     filtered_prs = []
     if show_prs:
         pr_qs = PersonalRecord.objects.filter(
@@ -144,9 +213,6 @@ def dashboard(request):
         if exercise_filter_id:
             pr_qs = pr_qs.filter(exercise_id=exercise_filter_id)
 
-        for pr in pr_qs:
-            pr_dates.add(pr.date.day)
-
         # Build display list grouped by date
         prs_by_date = {}
         for pr in pr_qs.order_by('-date'):
@@ -174,17 +240,15 @@ def dashboard(request):
         'next_year': next_year,
         'next_month': next_month,
         'today': today,
-        'exercises': user_exercises,
         'exercise_filter_id': exercise_filter_id,
+        'exercise_filter_name': _exercise_name(request.user, exercise_filter_id) if exercise_filter_id else '',
         'filtered_sets': filtered_sets,
     })
 
 
 @login_required
 def exercise_list(request):
-    exercises = Exercise.objects.filter(
-        Q(user=request.user) | Q(user__isnull=True)
-    )
+    exercises = exercise_catalog(request.user)
     return render(request, 'workouts/exercise_list.html', {
         'exercises': exercises,
     })
@@ -203,9 +267,10 @@ def exercise_add(request):
             if request.user.is_superuser:
                 for f in request.FILES.getlist('media_files'):
                     is_video = f.content_type.startswith('video')
-                    ExerciseMedia.objects.create(
+                    media = ExerciseMedia.objects.create(
                         exercise=exercise, file=f, is_video=is_video
                     )
+                    generate_derivatives(media, source=f)
 
             return redirect('exercise_list')
     else:
@@ -226,109 +291,159 @@ def workout_session(request, date_str=None):
     workout = Workout.objects.filter(user=request.user, date=date).first()
     # Don't create yet — api_add_sets will create on first save
     
-    saved_sets = []
-    grouped_sets = []
-    if workout:
-        saved_sets = workout.sets.select_related('exercise').order_by('exercise__name', 'set_number')
-        for exercise, sets in groupby(saved_sets, key=attrgetter('exercise')):
-            sets_list = list(sets)
-            compact = ', '.join(
-                f"{s.set_number}x{s.reps}x{int(s.weight) if s.weight == int(s.weight) else s.weight}"
-                for s in sets_list
-            )
-            grouped_sets.append({
-                'exercise': exercise,
-                'compact': compact,
-                'sets': sets_list,
-            })
+    def load_sets():
+        saved_sets = []
+        grouped_sets = []
+        if workout:
+            saved_sets = list(workout.sets.select_related('exercise').order_by('exercise__name', 'set_number'))
+            for exercise, sets in groupby(saved_sets, key=attrgetter('exercise')):
+                sets_list = list(sets)
+                grouped_sets.append({
+                    'exercise': exercise,
+                    'compact': format_sets(sets_list),
+                    'sets': sets_list,
+                })
+        return saved_sets, grouped_sets
 
-    exercises = Exercise.objects.filter(
-        Q(user=request.user) | Q(user__isnull=True)
-    )
+    # Lazy, so a cached "saved sets" fragment skips the query entirely
+    load_sets = functools.cache(load_sets)
+    saved_sets = SimpleLazyObject(lambda: load_sets()[0])
+    grouped_sets = SimpleLazyObject(lambda: load_sets()[1])
 
     return render(request, 'workouts/workout_session.html', {
         'workout': workout,
         'saved_sets': saved_sets,
         'grouped_sets': grouped_sets,
-        'exercises': exercises,
         'date': date,
     })
 
 
-@login_required
-@require_POST
-def api_add_sets(request):
-    try:
-        data = json.loads(request.body)
-        workout_id = data.get('workout_id')
-        exercise_id = data.get('exercise_id')
-        sets_text = data.get('sets_text', '')
-
-        workout_date = data.get('workout_date')
-
+def _pr_toast(pr, exercise):
+    """JSON shape the workout page uses for PR toast notifications."""
+    return {
+        'type': pr.get_pr_type_display(),
+        'exercise': exercise.name,
+        'reps': pr.reps,
+        'weight': str(pr.weight),
+        'sets': pr.sets,
+        'date': str(pr.date),
+        'previous_value': str(pr.previous_value) if pr.previous_value else None,
+        'previous_date': str(pr.previous_date) if pr.previous_date else None,
+    }
+
+
+def _save_sets(user, exercise, parsed, workout_id, workout_date):
+    """
+    Save one quick-entry for api_add_sets and recompute PRs. Returns
+    ``(workout, new_sets, new_prs)``; ``new_prs`` is None when the
+    recompute is deferred to the PR worker.
+    """
+    # One transaction for the workout, every set of the entry, the volume
+    # rollups and the PR recompute, so a failure never leaves half an entry behind
+    with transaction.atomic():
         if workout_id:
-            workout = get_object_or_404(Workout, pk=workout_id, user=request.user)
+            workout = get_object_or_404(Workout, pk=workout_id, user=user)
         else:
             date = datetime.date.fromisoformat(workout_date)
             workout, _ = Workout.objects.get_or_create(
-                user=request.user,
+                user=user,
                 date=date,
                 defaults={'notes': ''},
             )
-        
-        exercise = Exercise.objects.filter(
-            Q(user=request.user) | Q(user__isnull=True)
-        ).get(pk=exercise_id)
 
-        parsed = parse_sets(sets_text)
-        created_sets = []
-        for s in parsed:
-            ws = WorkoutSet.objects.create(
+        new_sets = WorkoutSet.objects.bulk_create([
+            WorkoutSet(
                 workout=workout,
                 exercise=exercise,
                 set_number=s['set_number'],
                 reps=s['reps'],
                 weight=s['weight'],
+                count=s.get('count', 1),
             )
-            created_sets.append({
-                'id': ws.id,
-                'exercise': exercise.name,
-                'set_number': ws.set_number,
-                'reps': ws.reps,
-                'weight': str(ws.weight),
-            })
+            for s in parsed
+        ])
+        apply_volume_delta(user, exercise.pk, workout.date, *volume_of(new_sets))
+
+        if settings.PR_RECALC_DEFERRED:
+            enqueue_pr_recalc(user, exercise, workout.date)
+            refresh_day_summaries(user, [workout.date])
+            return workout, new_sets, None
 
         # Snapshot existing PRs for today before recalculating
         existing_prs = set(
             PersonalRecord.objects.filter(
-                user=request.user, exercise=exercise,
+                user=user, exercise=exercise,
                 date=workout.date, is_manual=False,
             ).values_list('pr_type', 'reps', 'weight', 'sets', flat=False)
         )
 
-        # Recalculate PRs for this exercise
-        current_prs = recalculate_prs(request.user, exercise)
-        pr_list = [
+        # Recalculate PRs for this exercise, replaying from this workout on
+        current_prs = recalculate_prs(user, exercise, since=workout.date, also_refresh=[workout.date])
+
+    new_prs = [
+        pr for pr in current_prs
+        if pr.date == workout.date
+        and (pr.pr_type, pr.reps, pr.weight, pr.sets) not in existing_prs
+    ]
+    return workout, new_sets, new_prs
+
+
+@login_required
+@require_POST
+async def api_add_sets(request):
+    user = await request.auser()
+    try:
+        data = json.loads(request.body)
+        workout_id = data.get('workout_id')
+        exercise_id = data.get('exercise_id')
+        sets_text = data.get('sets_text', '')
+
+        workout_date = data.get('workout_date')
+
+        exercise = await sync_to_async(get_exercise)(user, exercise_id)
+
+        parsed = parse_sets(sets_text)
+        if settings.COMPACT_SETS:
+            parsed = collapse_sets(parsed)
+
+        # Toasts are fetched from api_workout_prs once the worker ran
+        saved_at = timezone.now()
+        # The async ORM has no transactions, so the write runs as one sync call
+        workout, new_sets, new_prs = await sync_to_async(_save_sets)(
+            user, exercise, parsed, workout_id, workout_date,
+        )
+
+        created_sets = [
             {
-                'type': pr.get_pr_type_display(),
-                'exercise': pr.exercise.name,
-                'reps': pr.reps,
-                'weight': str(pr.weight),
-                'sets': pr.sets,
-                'date': str(pr.date),
-                'previous_value': str(pr.previous_value) if pr.previous_value else None,
-                'previous_date': str(pr.previous_date) if pr.previous_date else None,
+                'id': ws.id,
+                'exercise': exercise.name,
+                'set_number': ws.set_number,
+                'count': ws.count,
+                'reps': ws.reps,
+                'weight': str(ws.weight),
             }
-            for pr in current_prs
-            if pr.date == workout.date
-            and (pr.pr_type, pr.reps, pr.weight, pr.sets) not in existing_prs
+            for ws in new_sets
         ]
 
+        if new_prs is None:
+            return JsonResponse({
+                'status': 'ok',
+                'sets': created_sets,
+                'workout_id': workout.id,
+                'prs': [],
+                'prs_pending': True,
+                'prs_url': reverse('api_workout_prs') + '?' + urlencode({
+                    'workout_id': workout.id,
+                    'exercise_id': exercise.pk,
+                    'after': saved_at.isoformat(),
+                }),
+            })
+
         return JsonResponse({
             'status': 'ok',
             'sets': created_sets,
             'workout_id': workout.id,
-            'prs': pr_list,
+            'prs': [_pr_toast(pr, exercise) for pr in new_prs],
         })
 
     except Exercise.DoesNotExist:
@@ -339,37 +454,432 @@ def api_add_sets(request):
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
 
-@login_required
-@require_POST
-def api_delete_set(request):
-    try:
-        data = json.loads(request.body)
-        set_id = data.get('set_id')
-
-        ws = get_object_or_404(WorkoutSet, pk=set_id, workout__user=request.user)
-        exercise = ws.exercise  # grab before deleting
-        workout = ws.workout     # grab before deleting
-        ws.delete()
+async def _recompute_after_change(user, exercise, date):
+    """Recalculate PRs (or queue it) after a set on ``date`` was removed."""
+    if settings.PR_RECALC_DEFERRED:
+        await sync_to_async(enqueue_pr_recalc)(user, exercise, date)
+        await sync_to_async(refresh_day_summaries)(user, [date])
+    else:
+        await sync_to_async(recalculate_prs)(user, exercise, since=date, also_refresh=[date])
+
+
+def _delete_set(user, set_id, whole_row):
+    """
+    Remove one set of a row for api_delete_set (or with ``whole_row`` all
+    of a counted row's sets), take it off the volume rollups and drop the
+    workout once it has no sets left, in one transaction. Returns the
+    WorkoutSet, its ``count`` now what is left of it.
+    """
+    with transaction.atomic():
+        ws = get_object_or_404(
+            WorkoutSet.objects.select_related('workout', 'exercise'), pk=set_id, workout__user=user,
+        )
+        workout = ws.workout
+        # A counted row loses its last set, unless the whole row is asked for
+        if ws.count > 1 and not whole_row:
+            ws.count -= 1
+            ws.save(update_fields=['count'])
+            removed = 1
+        else:
+            removed, ws.count = ws.count, 0
+            ws.delete()
+        apply_volume_delta(user, ws.exercise_id, workout.date, -removed, -removed * ws.reps, -removed * ws.reps * ws.weight)
 
         # If the workout has no sets left, delete it
         if not workout.sets.exists():
             workout.delete()
+    return ws
+
+
+@login_required
+@require_POST
+async def api_delete_set(request):
+    user = await request.auser()
+    try:
+        data = json.loads(request.body)
+        ws = await sync_to_async(_delete_set)(user, data.get('set_id'), data.get('all'))
         # Recalculate PRs since removing a set might shift records
-        recalculate_prs(request.user, exercise)
-        
-        return JsonResponse({'status': 'ok'})
+        await _recompute_after_change(user, ws.exercise, ws.workout.date)
+
+        return JsonResponse({'status': 'ok', 'count': ws.count})
 
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
 
+@login_required
+def api_workout_prs(request):
+    """
+    PR toasts for a workout once deferred recalculation has caught up.
+
+    Returns the current auto PRs dated on the workout that were recorded
+    after ``after`` (the save time api_add_sets handed out), and whether
+    a recalculation for the exercise is still queued.
+    """
+    try:
+        workout_id = int(request.GET.get('workout_id', ''))
+        exercise_id = int(request.GET['exercise_id']) if request.GET.get('exercise_id') else None
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid workout or exercise id.'}, status=400)
+    after = parse_datetime(request.GET.get('after', ''))
+    if after is None:
+        return JsonResponse({'status': 'error', 'message': 'Invalid "after" timestamp.'}, status=400)
+    workout = get_object_or_404(Workout, pk=workout_id, user=request.user)
+
+    prs_qs = PersonalRecord.objects.filter(
+        user=request.user, date=workout.date, is_current=True,
+        is_manual=False, created_at__gte=after,
+    ).select_related('exercise')
+    jobs = PRRecalcJob.objects.filter(user=request.user, since__lte=workout.date)
+
+    if exercise_id is not None:
+        prs_qs = prs_qs.filter(exercise_id=exercise_id)
+        jobs = jobs.filter(exercise_id=exercise_id)
+
+    return JsonResponse({
+        'status': 'ok',
+        'pending': jobs.exists(),
+        'prs': [_pr_toast(pr, pr.exercise) for pr in prs_qs.order_by('created_at')],
+    })
+
+
+# LTTB needs the first and last point plus at least one to choose
+PROGRESS_MIN_POINTS = 3
+
+
+@login_required
+def api_exercise_progress(request):
+    """
+    Daily best estimated 1RM of one exercise (``exercise_id``), oldest
+    first, by ``formula=epley`` (the default) or ``brzycki``. Read from
+    the precomputed ExerciseProgress table, one row per training day.
+
+    With ``max_points`` the series is downsampled (LTTB) to about that
+    many points, always keeping the first and last day and every day the
+    exercise set a PR. Responses are cached under the user's data version
+    and carry an ETag, so a chart reload without new sets is a 304.
+    """
+    formula = request.GET.get('formula', 'epley')
+    if formula not in E1RM_FORMULAS:
+        return JsonResponse({'status': 'error', 'message': 'Unknown formula.'}, status=400)
+    max_points = request.GET.get('max_points')
+    if max_points is not None:
+        try:
+            max_points = int(max_points)
+        except ValueError:
+            max_points = 0
+        if max_points < PROGRESS_MIN_POINTS:
+            return JsonResponse({
+                'status': 'error', 'message': f'max_points must be a whole number of at least {PROGRESS_MIN_POINTS}.',
+            }, status=400)
+    version = data_version(request.user.pk)
+    try:
+        exercise = get_exercise(request.user, request.GET.get('exercise_id'), version)
+    except Exercise.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Invalid exercise.'}, status=400)
+
+    key = fragment_key(request.user.pk, version, 'progress', [exercise.pk, formula, max_points])
+    etag = f'"{hashlib.md5(key.encode()).hexdigest()}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        body = cache.get(key)
+        record_fragment('progress', hit=body is not None)
+        if body is None:
+            body = json.dumps(_progress_payload(request.user, exercise, formula, max_points))
+            cache.set(key, body, FRAGMENT_TIMEOUT)
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _progress_payload(user, exercise, formula, max_points=None):
+    rows = list(
+        ExerciseProgress.objects
+        .filter(user=user, exercise=exercise, **{f'{formula}__isnull': False})
+        .order_by('date')
+        .values_list('date', formula)
+    )
+    if max_points is not None and len(rows) > max_points:
+        xs = [date.toordinal() for date, _ in rows]
+        ys = [float(e1rm) for _, e1rm in rows]
+        keep = _progress_keep(user, exercise, rows, max_points)
+        rows = [rows[i] for i in lttb(xs, ys, max_points, keep)]
+    return {
+        'status': 'ok',
+        'exercise': {'id': exercise.pk, 'name': exercise.name},
+        'formula': formula,
+        'series': [{'date': str(date), 'e1rm': str(e1rm)} for date, e1rm in rows],
+    }
+
+
+def _progress_keep(user, exercise, rows, max_points):
+    """
+    Indexes of ``rows`` the downsampled series must keep: days of a current
+    PR and days that set a new best e1RM. At most half of ``max_points``
+    (highest e1RM first) so LTTB still has budget for the shape in between.
+    """
+    current_dates = set(
+        PersonalRecord.objects
+        .filter(user=user, exercise=exercise, is_current=True)
+        .values_list('date', flat=True)
+    )
+    keep = []
+    best = None
+    for i, (date, e1rm) in enumerate(rows):
+        if best is None or e1rm > best:
+            best = e1rm
+            keep.append(i)
+        elif date in current_dates:
+            keep.append(i)
+    # The first and last day are always kept on top of these
+    limit = max(max_points // 2 - 2, 0)
+    if len(keep) > limit:
+        keep = sorted(sorted(keep, key=lambda i: rows[i][1], reverse=True)[:limit])
+    return keep
+
+
+@login_required
+def api_exercise_search(request):
+    """
+    Type-ahead exercise search (``q``, up to ``limit`` results): names
+    starting with the query, then containing it, each ranked by how many
+    sets the user has logged. An empty ``q`` lists their most used.
+    """
+    try:
+        limit = min(int(request.GET.get('limit', SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return JsonResponse({'status': 'error', 'message': 'limit must be a positive whole number.'}, status=400)
+    usage = exercise_usage(request.user)
+    return JsonResponse({
+        'status': 'ok',
+        'results': [
+            {
+                'id': exercise.pk,
+                'name': exercise.name,
+                'custom': exercise.user_id is not None,
+                'sets': usage.get(exercise.pk, 0),
+            }
+            for exercise in search_exercises(request.user, request.GET.get('q', ''), limit)
+        ],
+    })
+
+
+STATS_WEEKS = 8
+STATS_MONTHS = 12
+
+
+def _stats_periods(today):
+    """The starts of the last STATS_WEEKS weeks and STATS_MONTHS months up to ``today``, oldest first."""
+    this_week = week_start(today)
+    weeks = [this_week - datetime.timedelta(weeks=n) for n in range(STATS_WEEKS - 1, -1, -1)]
+    months = [month_start(today)]
+    for _ in range(STATS_MONTHS - 1):
+        months.insert(0, month_start(months[0] - datetime.timedelta(days=1)))
+    return weeks, months
+
+
+def _iso_week(week):
+    year, number, _ = week.isocalendar()
+    return f'{year}-W{number:02d}'
+
+
+def _parse_date_param(value):
+    """An optional ISO date bound; raises ValueError if malformed."""
+    return datetime.date.fromisoformat(value) if value else None
+
+
+@login_required
+def training_stats(request):
+    """
+    Training volume (sets × reps × weight): per exercise for the last
+    STATS_WEEKS ISO weeks and in total for the last STATS_MONTHS months.
+    Reads only the WeeklyVolume and MonthlyVolume rollups.
+    """
+    weeks, months = _stats_periods(datetime.date.today())
+
+    def weekly():
+        names = {exercise.pk: exercise.name for exercise in exercise_catalog(request.user)}
+        grid = defaultdict(dict)
+        for exercise_id, week, volume in (
+            WeeklyVolume.objects.filter(user=request.user, week__gte=weeks[0], sets__gt=0)
+            .values_list('exercise_id', 'week', 'volume')
+        ):
+            grid[names.get(exercise_id, '?')][week] = volume
+        return [
+            {'exercise': name, 'volumes': [grid[name].get(week) for week in weeks]}
+            for name in sorted(grid)
+        ]
+
+    def monthly():
+        return list(
+            MonthlyVolume.objects.filter(user=request.user, month__gte=months[0], sets__gt=0).order_by('-month')
+        )
+
+    # Lazy, so a cached stats fragment skips the queries entirely
+    return render(request, 'workouts/stats.html', {
+        'weeks': [{'label': _iso_week(week), 'start': week} for week in weeks],
+        'this_month': months[-1],
+        'weekly': SimpleLazyObject(weekly),
+        'monthly': SimpleLazyObject(monthly),
+    })
+
+
+@login_required
+def api_training_volume(request):
+    """
+    Volume rollups as JSON: ``period=week`` (the default), one row per
+    exercise and ISO week, optionally for one ``exercise_id``; or
+    ``period=month``, one row per month across exercises. ``since`` and
+    ``until`` (ISO dates) bound the week or month start. Oldest first.
+    """
+    period = request.GET.get('period', 'week')
+    if period not in ('week', 'month'):
+        return JsonResponse({'status': 'error', 'message': 'period must be week or month.'}, status=400)
+    try:
+        since = _parse_date_param(request.GET.get('since'))
+        until = _parse_date_param(request.GET.get('until'))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid date.'}, status=400)
+
+    if period == 'month':
+        rows = MonthlyVolume.objects.filter(user=request.user, sets__gt=0)
+        if since:
+            rows = rows.filter(month__gte=month_start(since))
+        if until:
+            rows = rows.filter(month__lte=until)
+        return JsonResponse({'status': 'ok', 'period': period, 'rows': [
+            {'month': f'{month:%Y-%m}', 'sets': sets, 'reps': reps, 'volume': str(volume)}
+            for month, sets, reps, volume in rows.order_by('month').values_list('month', 'sets', 'reps', 'volume')
+        ]})
+
+    names = {exercise.pk: exercise.name for exercise in exercise_catalog(request.user)}
+    rows = WeeklyVolume.objects.filter(user=request.user, sets__gt=0)
+    if 'exercise_id' in request.GET:
+        try:
+            exercise = get_exercise(request.user, request.GET['exercise_id'])
+        except Exercise.DoesNotExist:
+            return JsonResponse({'status': 'error', 'message': 'Invalid exercise.'}, status=400)
+        rows = rows.filter(exercise=exercise)
+    if since:
+        rows = rows.filter(week__gte=week_start(since))
+    if until:
+        rows = rows.filter(week__lte=until)
+    return JsonResponse({'status': 'ok', 'period': period, 'rows': [
+        {
+            'week': _iso_week(week), 'start': str(week),
+            'exercise_id': exercise_id, 'exercise': names.get(exercise_id),
+            'sets': sets, 'reps': reps, 'volume': str(volume),
+        }
+        for week, exercise_id, sets, reps, volume in (
+            rows.order_by('week', 'exercise_id').values_list('week', 'exercise_id', 'sets', 'reps', 'volume')
+        )
+    ]})
+
+
+HISTORY_PAGE_SIZE = 20
+
+
+def _parse_history_cursor(cursor):
+    """Split a history cursor ('<date>.<id>') into (date, id); None if malformed."""
+    try:
+        date_str, pk = cursor.split('.')
+        return datetime.date.fromisoformat(date_str), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _history_page(user, cursor=None):
+    """
+    One page of workout history, newest first, using keyset pagination on
+    (date, id): each page seeks past the last row of the previous one, so
+    its cost doesn't grow with how far back the user has scrolled.
+
+    Returns (workouts, next_cursor). Each workout carries ``set_count``
+    and ``exercise_groups`` (exercise + its sets, by exercise name).
+    """
+    workouts = (
+        Workout.objects.filter(user=user)
+        .filter(Exists(WorkoutSet.objects.filter(workout=OuterRef('pk'))))
+        .order_by('-date', '-id')
+    )
+    if cursor:
+        date, pk = cursor
+        workouts = workouts.filter(Q(date__lt=date) | Q(date=date, id__lt=pk))
+    workouts = list(workouts.prefetch_related(Prefetch(
+        'sets',
+        queryset=WorkoutSet.objects.select_related('exercise').order_by('exercise__name', 'set_number'),
+        to_attr='history_sets',
+    ))[:HISTORY_PAGE_SIZE + 1])
+
+    next_cursor = None
+    if len(workouts) > HISTORY_PAGE_SIZE:
+        workouts = workouts[:HISTORY_PAGE_SIZE]
+        last = workouts[-1]
+        next_cursor = f'{last.date.isoformat()}.{last.pk}'
+
+    for workout in workouts:
+        workout.set_count = sum(s.count for s in workout.history_sets)
+        workout.exercise_groups = [
+            {'exercise': exercise, 'sets': list(sets)}
+            for exercise, sets in groupby(workout.history_sets, key=attrgetter('exercise'))
+        ]
+    return workouts, next_cursor
+
+
+@login_required
+def api_fragment_cache_stats(request):
+    """Fragment cache hit/miss counters, for tuning. Staff only; ``?reset=1`` zeroes them."""
+    if not request.user.is_staff:
+        return JsonResponse({'status': 'error', 'message': 'Permission denied.'}, status=403)
+    return JsonResponse({
+        'status': 'ok',
+        'fragments': fragment_stats(reset=request.GET.get('reset') == '1'),
+    })
+
+
 @login_required
 def workout_history(request):
-    workouts = Workout.objects.filter(user=request.user).annotate(
-    set_count=Count('sets')
-).filter(set_count__gt=0).prefetch_related('sets__exercise')
+    cursor = _parse_history_cursor(request.GET.get('cursor'))
+    # Lazy, so a cached page fragment skips the queries entirely
+    page = functools.cache(lambda: _history_page(request.user, cursor))
     return render(request, 'workouts/workout_history.html', {
-        'workouts': workouts,
+        'cursor': request.GET.get('cursor', '') if cursor else '',
+        'workouts': SimpleLazyObject(lambda: page()[0]),
+        'next_cursor': SimpleLazyObject(lambda: page()[1] or ''),
+    })
+
+
+@login_required
+def api_workout_history(request):
+    """Next page of workout history for infinite scroll, from ``cursor``."""
+    cursor = request.GET.get('cursor')
+    parsed = _parse_history_cursor(cursor) if cursor else None
+    if cursor and parsed is None:
+        return JsonResponse({'status': 'error', 'message': 'Invalid cursor.'}, status=400)
+
+    workouts, next_cursor = _history_page(request.user, parsed)
+    return JsonResponse({
+        'status': 'ok',
+        'workouts': [{
+            'id': workout.pk,
+            'date': str(workout.date),
+            'label': date_format(workout.date),
+            'url': reverse('workout_session', args=[workout.date.isoformat()]),
+            'notes': workout.notes,
+            'set_count': workout.set_count,
+            'exercises': [{
+                'id': group['exercise'].pk,
+                'name': group['exercise'].name,
+                'sets': [
+                    {'set_number': s.set_number, 'count': s.count, 'reps': s.reps, 'weight': str(s.weight)}
+                    for s in group['sets']
+                ],
+            } for group in workout.exercise_groups],
+        } for workout in workouts],
+        'next_cursor': next_cursor,
     })
 
 @login_required
@@ -377,11 +887,6 @@ def pr_list(request):
     """Show current personal records with exercise and type filters."""
     from .models import PersonalRecord
 
-    # Available exercises for the filter dropdown
-    user_exercises = Exercise.objects.filter(
-        Q(user=request.user) | Q(user__isnull=True)
-    )
-
     # Read filter params
     exercise_filter = request.GET.get('exercise', '')
     type_filter = request.GET.get('type', '')
@@ -406,47 +911,56 @@ def pr_list(request):
     prs_qs = prs_qs.order_by('exercise__name', 'pr_type')
 
     # Group by exercise for display
-    grouped = {}
-    for pr in prs_qs:
-        name = pr.exercise.name
-        if name not in grouped:
-            grouped[name] = []
-        grouped[name].append(pr)
+    def group_prs():
+        grouped = {}
+        for pr in prs_qs:
+            name = pr.exercise.name
+            if name not in grouped:
+                grouped[name] = []
+            grouped[name].append(pr)
+        return grouped
+
+    # Lazy, so a cached PR list fragment skips the query entirely
+    grouped = SimpleLazyObject(group_prs)
 
     return render(request, 'workouts/pr_list.html', {
         'grouped_prs': grouped,
-        'exercises': user_exercises,
         'exercise_filter': exercise_filter,
+        'exercise_filter_name': _exercise_name(request.user, exercise_filter) if exercise_filter else '',
         'type_filter': type_filter,
     })
 
 @login_required
 @require_POST
-def api_toggle_pr(request):
+async def api_toggle_pr(request):
     """Toggle a manual PR for a specific set."""
+    user = await request.auser()
     try:
         data = json.loads(request.body)
         set_id = data.get('set_id')
 
-        ws = get_object_or_404(WorkoutSet, pk=set_id, workout__user=request.user)
+        ws = await aget_object_or_404(
+            WorkoutSet.objects.select_related('workout', 'exercise'), pk=set_id, workout__user=user,
+        )
 
         # Check if a manual PR already exists for this exact set
-        existing = PersonalRecord.objects.filter(
-            user=request.user,
+        existing = await PersonalRecord.objects.filter(
+            user=user,
             exercise=ws.exercise,
             pr_type='weight',
             reps=ws.reps,
             weight=ws.weight,
             date=ws.workout.date,
             is_manual=True,
-        ).first()
+        ).afirst()
 
         if existing:
-            existing.delete()
+            await existing.adelete()
+            await sync_to_async(refresh_day_summaries)(user, [ws.workout.date], progress=False)
             return JsonResponse({'status': 'ok', 'pr_active': False})
         else:
-            PersonalRecord.objects.create(
-                user=request.user,
+            await PersonalRecord.objects.acreate(
+                user=user,
                 exercise=ws.exercise,
                 pr_type='weight',
                 reps=ws.reps,
@@ -456,6 +970,7 @@ def api_toggle_pr(request):
                 is_manual=True,
                 is_current=True,
             )
+            await sync_to_async(refresh_day_summaries)(user, [ws.workout.date], progress=False)
             return JsonResponse({'status': 'ok', 'pr_active': True})
 
     except Exception as e:
@@ -509,7 +1024,17 @@ def exercise_delete(request, pk):
         return redirect('exercise_list')
 
     if request.method == 'POST':
+        # The cascade removes sets and PRs; remember whose days they were on
+        affected = defaultdict(set)
+        for user_id, date in exercise.workout_sets.values_list('workout__user_id', 'workout__date').distinct():
+            affected[user_id].add(date)
+        for user_id, date in exercise.personal_records.values_list('user_id', 'date').distinct():
+            affected[user_id].add(date)
         exercise.delete()
+        for user in User.objects.filter(pk__in=affected):
+            refresh_day_summaries(user, affected[user.pk])
+            # Its weekly rows went with the cascade; the months still count its sets
+            rebuild_volume_rollups(user)
         return redirect('exercise_list')
 
     return render(request, 'workouts/exercise_delete.html', {
@@ -520,43 +1045,82 @@ def logout_view(request):
     logout(request)
     return redirect('/login/')
 
+async def _chunks_async(chunks):
+    """Yield ``chunks`` one at a time, each fetched in a ``sync_to_async`` call."""
+    chunks = iter(chunks)
+    try:
+        while (chunk := await sync_to_async(next)(chunks, None)) is not None:
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def _streaming_content(request, chunks):
+    """
+    ``chunks`` in the form this server streams without buffering. Under
+    ASGI, Django drains a sync iterator into a list before sending the
+    first byte, so it gets an async one instead. The request's
+    thread-sensitive context keeps every fetch (and an open database
+    cursor) on one thread.
+    """
+    if isinstance(request, ASGIRequest):
+        return _chunks_async(chunks)
+    return chunks
+
+
 @login_required
 def serve_media(request, path):
-    """Proxy media files from S3 bucket."""
-    try:
-        f = default_storage.open(path)
-        content = f.read()
-        f.close()
-
-        # Determine content type
-        if path.lower().endswith('.png'):
-            content_type = 'image/png'
-        elif path.lower().endswith('.jpg') or path.lower().endswith('.jpeg'):
-            content_type = 'image/jpeg'
-        elif path.lower().endswith('.gif'):
-            content_type = 'image/gif'
-        elif path.lower().endswith('.webp'):
-            content_type = 'image/webp'
-        elif path.lower().endswith('.mp4'):
-            content_type = 'video/mp4'
-        elif path.lower().endswith('.mov'):
-            content_type = 'video/quicktime'
-        elif path.lower().endswith('.webm'):
-            content_type = 'video/webm'
-        elif path.lower().endswith('.avi'):
-            content_type = 'video/x-msvideo'
-        else:
-            content_type = 'application/octet-stream'
+    """
+    Proxy media files from S3 bucket.
 
-        return HttpResponse(content, content_type=content_type)
+    Streams the file in fixed-size chunks, honours single ``Range``
+    requests (so videos can seek) and answers conditional requests with
+    304 using ``ETag`` / ``Last-Modified``.
+    """
+    try:
+        size, modified = media_stat(default_storage, path)
     except Exception:
-        from django.http import Http404
         raise Http404("File not found")
-    
+
+    etag = media_etag(path, size, modified)
+    last_modified = modified.timestamp()
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    # Only honour Range if the client's copy (If-Range) is still current
+    byte_range = parse_range(request.headers.get('Range'), size)
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag and if_range != http_date(last_modified):
+        byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    response = StreamingHttpResponse(
+        _streaming_content(request, iter_media(default_storage, path, start, end)),
+        status=206 if byte_range else 200,
+        content_type=content_type_for(path),
+    )
+    response['Content-Length'] = end - start + 1
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
 
 @login_required
 @require_POST
-def api_create_exercise(request):
+async def api_create_exercise(request):
+    user = await request.auser()
     try:
         data = json.loads(request.body)
         name = data.get('name', '').strip()
@@ -565,15 +1129,10 @@ def api_create_exercise(request):
             return JsonResponse({'status': 'error', 'message': 'Name is required.'}, status=400)
 
         # Check if it already exists for this user or globally
-        existing = Exercise.objects.filter(
-            Q(user=request.user) | Q(user__isnull=True),
-            name__iexact=name,
-        ).first()
-
-        if existing:
+        if await sync_to_async(find_exercise)(user, name):
             return JsonResponse({'status': 'error', 'message': 'Exercise already exists.'}, status=400)
 
-        exercise = Exercise.objects.create(user=request.user, name=name)
+        exercise = await Exercise.objects.acreate(user=user, name=name)
         return JsonResponse({
             'status': 'ok',
             'exercise': {'id': exercise.pk, 'name': exercise.name},
@@ -583,9 +1142,10 @@ def api_create_exercise(request):
     
 @login_required
 @require_POST
-def api_upload_media(request):
+async def api_upload_media(request):
     """Upload images/videos to an exercise or workout. Superuser only."""
-    if not request.user.is_superuser:
+    user = await request.auser()
+    if not user.is_superuser:
         return JsonResponse({'status': 'error', 'message': 'Permission denied.'}, status=403)
 
     target_type = request.POST.get('target_type')
@@ -605,27 +1165,33 @@ def api_upload_media(request):
             return JsonResponse({'status': 'error', 'message': f'Unsupported file type: {ext}'}, status=400)
         is_video = ext in ALLOWED_VIDEO
 
+        # acreate() writes the file to storage in a worker thread, so
+        # S3 uploads don't hold up the event loop
         if target_type == 'exercise':
-            exercise = get_object_or_404(Exercise, pk=target_id)
-            media = ExerciseMedia.objects.create(exercise=exercise, file=f, is_video=is_video)
+            exercise = await aget_object_or_404(Exercise, pk=target_id)
+            media = await ExerciseMedia.objects.acreate(exercise=exercise, file=f, is_video=is_video)
         elif target_type == 'workout':
             if target_id:
-                workout = get_object_or_404(Workout, pk=target_id, user=request.user)
+                workout = await aget_object_or_404(Workout, pk=target_id, user=user)
             else:
                 # Create workout on the fly from date
                 workout_date = request.POST.get('workout_date')
-                workout, _ = Workout.objects.get_or_create(
-                    user=request.user,
+                workout, new_workout = await Workout.objects.aget_or_create(
+                    user=user,
                     date=datetime.date.fromisoformat(workout_date),
                     defaults={'notes': ''},
                 )
-            media = WorkoutMedia.objects.create(workout=workout, file=f, is_video=is_video)
+                if new_workout:
+                    await sync_to_async(refresh_day_summaries)(user, [workout.date], progress=False)
+            media = await WorkoutMedia.objects.acreate(workout=workout, file=f, is_video=is_video)
         else:
             return JsonResponse({'status': 'error', 'message': 'Invalid target type.'}, status=400)
 
+        await sync_to_async(generate_derivatives)(media, source=f)
         created.append({
             'id': media.id,
             'url': f'/media/{media.file.name}',
+            'thumbnail_url': f'/media/{media.thumbnail.name}' if media.thumbnail else None,
             'is_video': media.is_video,
         })
 
@@ -634,9 +1200,10 @@ def api_upload_media(request):
 
 @login_required
 @require_POST
-def api_delete_media(request):
+async def api_delete_media(request):
     """Delete a media file. Superuser only."""
-    if not request.user.is_superuser:
+    user = await request.auser()
+    if not user.is_superuser:
         return JsonResponse({'status': 'error', 'message': 'Permission denied.'}, status=403)
 
     data = json.loads(request.body)
@@ -644,12 +1211,63 @@ def api_delete_media(request):
     media_id = data.get('media_id')
 
     if target_type == 'exercise':
-        media = get_object_or_404(ExerciseMedia, pk=media_id)
+        media = await aget_object_or_404(ExerciseMedia, pk=media_id)
     elif target_type == 'workout':
-        media = get_object_or_404(WorkoutMedia, pk=media_id)
+        media = await aget_object_or_404(WorkoutMedia, pk=media_id)
     else:
         return JsonResponse({'status': 'error', 'message': 'Invalid target type.'}, status=400)
 
-    media.file.delete()
-    media.delete()
-    return JsonResponse({'status': 'ok'})
\ No newline at end of file
+    await sync_to_async(media.file.delete)()
+    await media.adelete()
+    return JsonResponse({'status': 'ok'})
+
+@login_required
+@require_POST
+def api_import_history(request):
+    """
+    Import workout history from an uploaded CSV or NDJSON file (``file``;
+    ``format`` overrides the extension). The upload is streamed through
+    the importer a chunk at a time rather than read into memory.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'status': 'error', 'message': 'No file provided.'}, status=400)
+    fmt = request.POST.get('format') or import_format_for(upload.name)
+    if fmt not in IMPORT_FORMATS:
+        return JsonResponse({'status': 'error', 'message': 'Unsupported format; upload .csv or .ndjson.'}, status=400)
+
+    try:
+        # utf-8-sig: spreadsheet CSV exports often start with a BOM
+        summary = import_workout_history(request.user, codecs.iterdecode(upload, 'utf-8-sig'), fmt)
+    except UnicodeDecodeError:
+        return JsonResponse({
+            'status': 'error', 'message': 'The file is not UTF-8 text; rows before the bad bytes were imported.',
+        }, status=400)
+    return JsonResponse({'status': 'ok', **summary})
+
+
+@login_required
+def api_export_history(request):
+    """
+    Download the user's sets (``?data=sets``, the default) or PRs
+    (``?data=prs``) as CSV or NDJSON (``?format=``), gzipped with
+    ``?gzip=1``. The file is streamed as it is read from the database.
+    """
+    dataset = request.GET.get('data', 'sets')
+    fmt = request.GET.get('format', 'csv')
+    compress = request.GET.get('gzip') == '1'
+    if dataset not in EXPORT_DATASETS or fmt not in EXPORT_FORMATS:
+        return JsonResponse({'status': 'error', 'message': 'Invalid export data or format.'}, status=400)
+
+    if compress:
+        content_type = 'application/gzip'
+    else:
+        content_type = 'text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(
+        _streaming_content(request, export_history(request.user, dataset, fmt, compress)),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = content_disposition_header(
+        True, export_filename(request.user, dataset, fmt, compress),
+    )
+    return response